@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
+from django.utils.functional import cached_property
 # from ..clinical.models import Clinic
 class Clinic(models.Model):
     name = models.CharField(max_length=255)
@@ -79,6 +80,19 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    @cached_property
+    def managed_clinic_ids(self):
+        """Ids of the clinics this user manages; cached with the principal (clinical_be.utils.authentication)."""
+        return list(self.managed_clinics_assignments.values_list('clinic_id', flat=True))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored approval so the approval email needs no extra query on save
+        if 'is_approved' in instance.__dict__:
+            instance._loaded_is_approved = instance.is_approved
+        return instance
+
 
 class ClinicManagerAssignment(models.Model):
     manager = models.ForeignKey(User, on_delete=models.CASCADE, related_name='managed_clinics_assignments')
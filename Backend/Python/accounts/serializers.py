@@ -2,6 +2,7 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.conf import settings
+from clinical_be.utils.authentication import invalidate_principal
 from .models import User, Clinic, Role, ClinicManagerAssignment
 import re
 
@@ -136,6 +137,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             if clinic_ids:
                 assignments = [ClinicManagerAssignment(manager=user, clinic_id=cid) for cid in clinic_ids]
                 ClinicManagerAssignment.objects.bulk_create(assignments)
+                invalidate_principal(user.pk)  # bulk_create sends no signals
         else:
             if clinic_ids is not None:
                 clinic_id = clinic_ids[0]
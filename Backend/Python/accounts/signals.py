@@ -1,50 +1,49 @@
-from django.conf import settings
-from django.core.mail import send_mail
-from django.db.models.signals import post_save, pre_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import User
+from clinical_be.utils.authentication import invalidate_principal
+from clinical_be.utils.cache import invalidate_on_change
+from .models import Clinic, ClinicManagerAssignment, Role, User
+from .tasks import notify_admins_of_new_user, notify_user_approved
+
+# Reference data served from clinical_be.utils.cache
+invalidate_on_change('clinics', Clinic)
+invalidate_on_change('roles', Role)
+
+
+# Principals cached by clinical_be.utils.authentication
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ClinicManagerAssignment)
+def invalidate_manager_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.manager_id)
+
+
+def send_after_commit(task, *args):
+    # Queued once the row is committed, so the request never waits on SMTP;
+    # robust: a broker outage is logged instead of failing the request
+    transaction.on_commit(partial(task.delay, *args), robust=True)
+
 
 @receiver(post_save, sender=User)
 def notify_admin_on_new_user(sender, instance, created, **kwargs):
     if created and not instance.is_approved:
-        # example: email all superusers or users with admin role
-        admin_emails = list(User.objects.filter(role__name='Admin').values_list('email', flat=True))
-        print(admin_emails)
-        if admin_emails:
-            send_mail(
-                subject="New user awaiting approval",
-                message=f"User {instance.email} registered and needs approval.",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=admin_emails,
-                fail_silently=True,
-            )
-
-# track approval change to notify user
-@receiver(pre_save, sender=User)
-def detect_approval_change(sender, instance, **kwargs):
-    if not instance.pk:
-        instance._was_approved = None
-        return
-    try:
-        prev = User.objects.get(pk=instance.pk)
-        instance._was_approved = prev.is_approved
-    except User.DoesNotExist:
-        instance._was_approved = None
+        send_after_commit(notify_admins_of_new_user, instance.email)
+
 
 @receiver(post_save, sender=User)
-def notify_user_on_approval(sender, instance, created, **kwargs):
+def notify_user_on_approval(sender, instance, created, update_fields=None, **kwargs):
+    # User.from_db() remembers the stored is_approved, so no extra query here
+    if update_fields is not None and 'is_approved' not in update_fields:
+        return
+    was = getattr(instance, '_loaded_is_approved', None)
+    instance._loaded_is_approved = instance.is_approved
     if created:
         return
-    was = getattr(instance, "_was_approved", None)
     if was is False and instance.is_approved is True:
-        # send approval email to user
-        send_mail(
-            subject="Your account has been approved",
-            message="Your account has been approved by admin. You can now log in.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[instance.email],
-            fail_silently=True,
-        )
-    if was is False and instance.is_approved is False and not instance.is_active:
-        # optional: rejection flow (if you set is_active False to reject)
-        pass
\ No newline at end of file
+        send_after_commit(notify_user_approved, instance.email)
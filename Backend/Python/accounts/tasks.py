@@ -0,0 +1,41 @@
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from .models import User
+
+EMAIL_RETRY = {
+    'autoretry_for': (SMTPException, OSError),
+    'retry_backoff': True,
+    'retry_kwargs': {'max_retries': 5},
+}
+
+
+def send_emails(messages):
+    """Send [(subject, body, recipient)] over one SMTP connection; returns the number sent."""
+    if not messages:
+        return 0
+    connection = get_connection()
+    return connection.send_messages([
+        EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient], connection=connection)
+        for subject, body, recipient in messages
+    ])
+
+
+@shared_task(**EMAIL_RETRY)
+def notify_admins_of_new_user(email):
+    # One message per admin so addresses aren't shared, all on the same connection
+    admin_emails = User.objects.filter(role__name='Admin').values_list('email', flat=True)
+    return send_emails([
+        ("New user awaiting approval", f"User {email} registered and needs approval.", admin_email)
+        for admin_email in admin_emails
+    ])
+
+
+@shared_task(**EMAIL_RETRY)
+def notify_user_approved(email):
+    return send_emails([
+        ("Your account has been approved", "Your account has been approved by admin. You can now log in.", email),
+    ])
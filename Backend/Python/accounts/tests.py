@@ -1,3 +1,190 @@
-from django.test import TestCase
+import os
+import tempfile
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import tasks
+from accounts.models import Clinic, ClinicManagerAssignment, Role, User
+from clinical_be.celery import app as celery_app
+from clinical_be.utils.authentication import load_principal
+
+# A cache every process sees, like Redis in production
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'clinical-tests-cache'),
+    }
+}
+
+
+class ReferenceListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, table):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/accounts/' + url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), sum(table in q['sql'] for q in ctx.captured_queries)
+
+    def test_clinics_cached_until_changed(self):
+        Clinic.objects.create(name='Main', address='Addr', phone='1', is_main_inventory=True)
+        Clinic.objects.create(name='Branch', address='Addr', phone='2')
+
+        clinics, queries = self.get('clinics/', 'accounts_clinic')
+        self.assertEqual((len(clinics['data']), queries), (2, 1))
+        self.assertEqual(self.get('clinics/', 'accounts_clinic'), (clinics, 0))
+        transfer, _ = self.get('clinics/?transfer_inventory=true', 'accounts_clinic')
+        self.assertEqual([c['name'] for c in transfer['data']], ['Branch'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Clinic.objects.create(name='Third', address='Addr', phone='3')
+        clinics, queries = self.get('clinics/', 'accounts_clinic')
+        self.assertEqual((len(clinics['data']), queries), (3, 1))
+
+    def test_roles_cached_until_changed(self):
+        Role.objects.create(name='Admin')
+        roles, queries = self.get('roles/', 'accounts_role')
+        self.assertEqual(queries, 2)  # page count + rows
+        self.assertEqual(self.get('roles/', 'accounts_role'), (roles, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Role.objects.create(name='Reception')
+        roles, _ = self.get('roles/', 'accounts_role')
+        self.assertEqual(roles['count'], 2)
+
+
+class AccountEmailTests(TestCase):
+    def setUp(self):
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', eager)
+        admin = Role.objects.create(name='Admin')
+        for n in range(3):
+            User.objects.create(email=f'admin{n}@example.com', name='Admin', role=admin, is_approved=True)
+
+    def test_registration_email_is_sent_after_commit_over_one_connection(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            User.objects.create(email='new@example.com', name='New')
+        self.assertEqual(mail.outbox, [])  # nothing sent while the request is open
+
+        with mock.patch.object(tasks, 'get_connection', wraps=tasks.get_connection) as get_connection:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'admin{n}@example.com' for n in range(3)])
+        self.assertIn('new@example.com', mail.outbox[0].body)
+
+    def test_approval_email_uses_the_loaded_state(self):
+        User.objects.create(email='new@example.com', name='New')
+        user = User.objects.get(email='new@example.com')
+        mail.outbox = []
+
+        user.is_approved = True
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries], ['UPDATE'])
+        self.assertEqual([m.to for m in mail.outbox], [['new@example.com']])
+
+        # Saving again (or touching other fields) sends nothing more
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+            user.save(update_fields=['last_login'])
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_smtp_failures_are_retried(self):
+        send = EmailBackend.send_messages
+        attempts = []
+
+        def flaky(backend, messages):
+            attempts.append(len(messages))
+            if len(attempts) == 1:
+                raise SMTPServerDisconnected('dropped')
+            return send(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', autospec=True, side_effect=flaky):
+            tasks.notify_user_approved.delay('new@example.com')
+        self.assertEqual(attempts, [1, 1])
+        self.assertEqual([m.to for m in mail.outbox], [['new@example.com']])
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.main = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.branch = Clinic.objects.create(name='Branch', address='Addr', phone='2')
+        self.manager_role = Role.objects.create(name='Clinic Manager')
+        self.user = User.objects.create(
+            email='m@example.com', name='M', clinic=self.main, role=self.manager_role, is_approved=True,
+        )
+        ClinicManagerAssignment.objects.create(manager=self.user, clinic=self.main)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/accounts/' + url)
+        return response, len(ctx.captured_queries)
+
+    def test_cache_hit_authenticates_without_queries(self):
+        response, first = self.get('profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(first, 2)  # user + role + clinic, managed clinic ids
+        response, queries = self.get('profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.json()['data']['role']['name'], 'Clinic Manager')
+
+    def test_changes_invalidate_the_principal(self):
+        response, _ = self.get('clinics/manager/')
+        self.assertEqual([c['name'] for c in response.json()['data']], ['Main'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ClinicManagerAssignment.objects.create(manager=self.user, clinic=self.branch)
+        response, _ = self.get('clinics/manager/')
+        self.assertEqual(sorted(c['name'] for c in response.json()['data']), ['Branch', 'Main'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager_role.name = 'Regional Manager'
+            self.manager_role.save()
+        self.assertEqual(self.get('profile/')[0].json()['data']['role']['name'], 'Regional Manager')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.get('profile/')[0].status_code, 401)
+
+    @override_settings(
+        CACHES={
+            'worker-1': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-1'},
+            'worker-2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-2'},
+        },
+    )
+    def test_per_process_cache_is_not_trusted(self):
+        # Two workers with their own local-memory caches
+        with self.settings(REFERENCE_CACHE_ALIAS='worker-1'):
+            response, queries = self.get('profile/')
+            self.assertEqual((response.status_code, queries), (200, 2))
+            self.assertEqual(self.get('profile/')[1], 2)
+        with self.settings(REFERENCE_CACHE_ALIAS='worker-2'), self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        with self.settings(REFERENCE_CACHE_ALIAS='worker-1'):
+            self.assertEqual(self.get('profile/')[0].status_code, 401)
+
+    def test_password_is_not_cached(self):
+        user = load_principal(self.user.pk)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertEqual(user.managed_clinic_ids, [self.main.pk])
 
-# Create your tests here.
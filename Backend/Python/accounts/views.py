@@ -7,6 +7,7 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Clinic , Role, User
 from .serializers import TokenWithClinicSerializer, ClinicSimpleSerializer, RegisterSerializer, RoleSimpleSerializer, UserSerializer
 from django.shortcuts import get_object_or_404
+from clinical_be.utils.cache import get_or_set
 from clinical_be.utils.pagination import StandardResultsSetPagination
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -16,7 +17,7 @@ def get_user_clinics(user):
     if user.role and user.role.name == 'Admin':
         return Clinic.objects.all()
     if user.role and user.role.name == 'Clinic Manager':
-        return Clinic.objects.filter(manager_assignments__manager=user)
+        return Clinic.objects.filter(id__in=user.managed_clinic_ids)
     if user.clinic:
         return Clinic.objects.filter(id=user.clinic.id)
     return Clinic.objects.none()
@@ -54,18 +55,28 @@ class ClinicListView(generics.ListAPIView):
 
     def list(self, request, *args, **kwargs):
         transfer_inventory = request.query_params.get('transfer_inventory', None)
-        if transfer_inventory and transfer_inventory.lower() == 'true':
-            self.queryset = self.queryset.filter(is_main_inventory=False)
-        else:
-            self.queryset = self.get_queryset()
-        serializer = self.get_serializer(self.queryset, many=True)
-        return Response({"status": 200, "data": serializer.data}, status=status.HTTP_200_OK)
+        transfer_only = bool(transfer_inventory and transfer_inventory.lower() == 'true')
+
+        def build():
+            queryset = self.get_queryset()
+            if transfer_only:
+                queryset = queryset.filter(is_main_inventory=False)
+            return list(self.get_serializer(queryset, many=True).data)
+
+        data = get_or_set('clinics', ['list', transfer_only], build)
+        return Response({"status": 200, "data": data}, status=status.HTTP_200_OK)
 
 class RoleListView(generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = RoleSimpleSerializer
     queryset = Role.objects.values('id', 'name')
 
+    def list(self, request, *args, **kwargs):
+        data = get_or_set(
+            'roles', [request.get_full_path()], lambda: super(RoleListView, self).list(request, *args, **kwargs).data
+        )
+        return Response(data)
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
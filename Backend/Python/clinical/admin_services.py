@@ -1,5 +1,4 @@
 from django.shortcuts import render
-from django.http import JsonResponse
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Count, Sum, Q, F, Avg, DecimalField
@@ -9,8 +8,14 @@ from django.db.models.functions import TruncDate, TruncMonth, TruncYear
 from accounts.models import User, Clinic
 from .models import Patient, PatientVisit, Trial, Bill, BillItem, InventoryItem, InventorySerial, ServiceVisit, TestType, PatientPurchase
 import json
+from clinical_be.utils.cache import get_or_set
 from clinical_be.utils.permission import IsClinicAdmin, ReceptionistPermission, ClinicManagerPermission
+from clinical_be.utils.renderers import FastJsonResponse as JsonResponse
+from .date_utils import day_bounds
+from .report_export import EXPORT_FORMATS, EXPORT_RENDERERS, export_response
+from .revenue_rollup import revenue_report
 from rest_framework import status
+from rest_framework.settings import api_settings
 
 
 
@@ -20,8 +25,10 @@ class ClinicListView(APIView):
     
     def get(self, request):
         try:
-            clinics = Clinic.objects.all().values('id', 'name', 'address', 'phone')
-            return JsonResponse({'status': status.HTTP_200_OK, 'data': list(clinics)})
+            clinics = get_or_set(
+                'clinics', ['admin-list'], lambda: list(Clinic.objects.all().values('id', 'name', 'address', 'phone'))
+            )
+            return JsonResponse({'status': status.HTTP_200_OK, 'data': clinics})
         except Exception as e:
             return JsonResponse({'status': status.HTTP_500_INTERNAL_SERVER_ERROR, 'message': str(e)}, status=500)
 
@@ -30,8 +37,10 @@ class AdminClinicReportView(APIView):
     """
     Clinic Report Dashboard
     Provides comprehensive clinic data for a date range (similar to AdminDailyStatusView)
+    Add ?format=csv|ndjson|xlsx to download the rows as a streamed file.
     """
     permission_classes = [IsAuthenticated, IsClinicAdmin | ReceptionistPermission | ClinicManagerPermission]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + EXPORT_RENDERERS
     
     def get(self, request):
         try:
@@ -49,79 +58,79 @@ class AdminClinicReportView(APIView):
             # Parse dates
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            # Timestamp bounds instead of __date lookups so the created_at indexes are usable
+            range_start, range_end = day_bounds(start_date, end_date)
             
             # Base queryset with optional clinic filter
             visit_filter = {
-                'created_at__date__gte': start_date,
-                'created_at__date__lte': end_date
+                'created_at__gte': range_start,
+                'created_at__lt': range_end
             }
             if clinic_id:
                 visit_filter['clinic_id'] = clinic_id
             
             # 1. Patients in date range
-            patients_data = PatientVisit.objects.filter(**visit_filter).values(
-                'patient__name', 'patient__phone_primary', 'clinic__name', 'visit_type', 'created_at'
-            ).order_by('-created_at')
+            patient_columns = ['patient__name', 'patient__phone_primary', 'clinic__name', 'visit_type', 'created_at']
+            patients_data = PatientVisit.objects.filter(**visit_filter).values(*patient_columns).order_by('-created_at')
             
             # 2. New tests in date range
-            if clinic_id:
-                new_tests = PatientVisit.objects.filter(
-                    clinic_id=clinic_id,
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date,
-                    test_requested__isnull=False
-                ).exclude(test_requested='').values('patient__name', 'test_requested', 'clinic__name', 'seen_by__name')
-            else:
-                new_tests = PatientVisit.objects.filter(
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date,
-                    test_requested__isnull=False
-                ).exclude(test_requested='').values('patient__name', 'test_requested', 'clinic__name', 'seen_by__name')
+            new_test_columns = ['patient__name', 'test_requested', 'clinic__name', 'seen_by__name']
+            new_tests = PatientVisit.objects.filter(
+                **visit_filter,
+                test_requested__isnull=False
+            ).exclude(test_requested='').values(*new_test_columns)
             
             # 3. Trials in date range
+            trial_filter = {
+                'created_at__gte': range_start,
+                'created_at__lt': range_end
+            }
             if clinic_id:
-                trials_data = Trial.objects.filter(
-                    visit__clinic_id=clinic_id,
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date
-                ).values(
-                    'assigned_patient__name', 'device_inventory_id__product_name', 'device_inventory_id__brand__name', 'device_inventory_id__model_type__name',
-                    'visit__clinic__name', 'trial_decision', 'followup_date', 'created_at'
-                )
-            else:
-                trials_data = Trial.objects.filter(
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date
-                ).values(
-                    'assigned_patient__name', 'device_inventory_id__product_name', 'device_inventory_id__brand__name', 'device_inventory_id__model_type__name',
-                    'visit__clinic__name', 'trial_decision', 'followup_date', 'created_at'
-                )
+                trial_filter['visit__clinic_id'] = clinic_id
+            trial_columns = [
+                'assigned_patient__name', 'device_inventory_id__product_name', 'device_inventory_id__brand__name', 'device_inventory_id__model_type__name',
+                'visit__clinic__name', 'trial_decision', 'followup_date', 'created_at'
+            ]
+            trials_data = Trial.objects.filter(**trial_filter).values(*trial_columns)
             
             # 4. Bookings in date range (completed trials that resulted in booking)
             if clinic_id:
+                booking_columns = [
+                    'assigned_patient__name', 'device_inventory_id__product_name', 'device_inventory_id__brand__name', 'device_inventory_id__model_type__name',
+                    'visit__clinic__name', 'cost', 'trial_completed_at','trial_decision'
+                ]
                 bookings_data = Trial.objects.filter(
                     visit__clinic_id=clinic_id,
-                    trial_completed_at__date__gte=start_date,
-                    trial_completed_at__date__lte=end_date,
+                    trial_completed_at__gte=range_start,
+                    trial_completed_at__lt=range_end,
                     trial_decision__in=['BOOK - Awaiting Stock', 'BOOK - Device Allocated']
-                ).values(
-                    'assigned_patient__name', 'device_inventory_id__product_name', 'device_inventory_id__brand__name', 'device_inventory_id__model_type__name',
-                    'visit__clinic__name', 'cost', 'trial_completed_at','trial_decision'
-                )
+                ).values(*booking_columns)
             else:
-                bookings_data = Trial.objects.filter(
-                    trial_completed_at__date__gte=start_date,
-                    trial_completed_at__date__lte=end_date,
-                    trial_decision='BOOK - Device Allocated'
-                ).values(
+                booking_columns = [
                     'assigned_patient__name', 'booked_device_inventory__brand', 'booked_device_inventory__model_type',
                     'visit__clinic__name', 'cost', 'trial_completed_at'
-                )
+                ]
+                bookings_data = Trial.objects.filter(
+                    trial_completed_at__gte=range_start,
+                    trial_completed_at__lt=range_end,
+                    trial_decision='BOOK - Device Allocated'
+                ).values(*booking_columns)
+
+            # ?format=csv|ndjson|xlsx streams the rows instead of building the JSON payload
+            export_format = request.GET.get('format')
+            if export_format in EXPORT_FORMATS:
+                return export_response([
+                    ('patients', patient_columns, patients_data),
+                    ('new_tests', new_test_columns, new_tests),
+                    ('trials', trial_columns, trials_data),
+                    ('bookings', booking_columns, bookings_data),
+                ], export_format, f"clinic-report-{start_date:%Y-%m-%d}-to-{end_date:%Y-%m-%d}")
+
             # Prepare response data
-            patients_list = list(patients_data) if patients_data.exists() else []
-            new_tests_list = list(new_tests) if new_tests.exists() else []
-            trials_list = list(trials_data) if trials_data.exists() else []
-            bookings_list = list(bookings_data) if bookings_data.exists() else []
+            patients_list = list(patients_data)
+            new_tests_list = list(new_tests)
+            trials_list = list(trials_data)
+            bookings_list = list(bookings_data)
             
             # Create summary counts
             summary = {
@@ -155,8 +164,10 @@ class AdminRevenueReportsView(APIView):
     """
     Revenue Reports Dashboard
     Provides comprehensive revenue analytics
+    Add ?format=csv|ndjson|xlsx to download the report as a streamed file.
     """
     permission_classes = [IsAuthenticated,IsClinicAdmin | ReceptionistPermission | ClinicManagerPermission]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + EXPORT_RENDERERS
     
     def get(self, request):
         try:
@@ -175,51 +186,27 @@ class AdminRevenueReportsView(APIView):
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
             
-            # Base filter for bills
-            bill_filter = {
-                'created_at__date__gte': start_date,
-                'created_at__date__lte': end_date,
-                'payment_status': 'Paid'
-            }
-            if clinic_id:
-                bill_filter['clinic_id'] = clinic_id
-            
-            bills = Bill.objects.filter(**bill_filter)
-            
             if report_type == 'clinic':
                 # Revenue by clinic
-                revenue_data = bills.values('clinic__name').annotate(
-                    total_revenue=Sum('final_amount'),
-                    total_bills=Count('id'),
-                    avg_bill_amount=Avg('final_amount')
-                ).order_by('-total_revenue')
-                
+                revenue_columns = ['clinic__name', 'total_revenue', 'total_bills', 'avg_bill_amount']
             # elif report_type == 'staff':
                 # Revenue by staff (who created the bills)
-            
-                
             elif report_type == 'category':
                 # Revenue by category (tests, trials, services, purchases)
-                revenue_data = BillItem.objects.filter(
-                    bill__in=bills
-                ).values('item_type').annotate(
-                    total_revenue=Sum(F('cost') * F('quantity'), output_field=DecimalField()),
-                    total_items=Count('id')
-                ).order_by('-total_revenue')
-                
+                revenue_columns = ['item_type', 'total_revenue', 'total_items']
             else:
                 return JsonResponse({'status': 'error', 'message': 'Invalid report type'}, status=400)
-            
-            # Calculate overall totals
-            total_revenue = bills.aggregate(total=Sum('final_amount'))['total'] or 0
-            total_bills = bills.count()
-            avg_bill_amount = bills.aggregate(avg=Avg('final_amount'))['avg'] or 0
 
-            staff_revenue_data = bills.values('created_by__name', 'created_by__id').annotate(
-                    total_revenue=Sum('final_amount'),
-                    total_bills=Count('id'),
-                    avg_bill_amount=Avg('final_amount')
-                ).order_by('-total_revenue')
+            # Closed days come from DailyRevenueRollup, only today is aggregated from the bills
+            revenue_data, staff_revenue_data = revenue_report(report_type, start_date, end_date, clinic_id)
+            staff_revenue_columns = ['created_by__name', 'created_by__id', 'total_revenue', 'total_bills', 'avg_bill_amount']
+
+            export_format = request.GET.get('format')
+            if export_format in EXPORT_FORMATS:
+                return export_response([
+                    ('revenue', revenue_columns, revenue_data),
+                    ('staff_revenue', staff_revenue_columns, staff_revenue_data),
+                ], export_format, f"revenue-report-{report_type}-{start_date:%Y-%m-%d}-to-{end_date:%Y-%m-%d}")
             
             return JsonResponse({
                 'status': status.HTTP_200_OK,
@@ -1,129 +1,270 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Count, DecimalField, Q, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count
 from accounts.models import User
-from .models import PatientVisit, Trial
+from .date_utils import day_bounds
+from .models import PatientVisit, ServiceVisit, Trial
 from .serializers import PatientVisitSerializer, TrialListSerializer, ServiceVisitListSerializer
 
+BOOKED_TRIAL_DECISIONS = ['BOOK - Awaiting Stock', 'BOOK - Device Allocated']
+DETAIL_MODES = ('full', 'page', 'none')
+MAX_DETAIL_PAGE_SIZE = 100
+EMPTY_AUDIOLOGIST_COUNTS = {
+    "test_count": 0, "patient_seen": 0, "trial_count": 0, "trials_booked": 0, "trial_booking_ratio": 0,
+}
+EMPTY_RECEPTION_COUNTS = {"pending_service": 0, "calls_made_for_followup": 0}
+
+
+class _CostMixin(serializers.Serializer):
+    # `cost` is annotated on the queryset (or is a model field), never looked up per row
+    cost = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True, coerce_to_string=False)
+
+
+class StaffVisitSerializer(_CostMixin, PatientVisitSerializer):
+    class Meta(PatientVisitSerializer.Meta):
+        fields = PatientVisitSerializer.Meta.fields + ['cost']
+
+
+class StaffTrialSerializer(_CostMixin, TrialListSerializer):
+    class Meta(TrialListSerializer.Meta):
+        fields = TrialListSerializer.Meta.fields + ['cost']
+
+
+class StaffServiceSerializer(ServiceVisitListSerializer):
+    cost = serializers.DecimalField(
+        source='charges_collected', max_digits=12, decimal_places=2, read_only=True, coerce_to_string=False,
+    )
+
+    class Meta(ServiceVisitListSerializer.Meta):
+        fields = ServiceVisitListSerializer.Meta.fields + ['cost']
+
+
+def _parse_staff_ids(params):
+    """staff_id may be repeated (?staff_id=1&staff_id=2) or comma separated (?staff_id=1,2)."""
+    staff_ids = []
+    for value in params.getlist('staff_id'):
+        for part in value.split(','):
+            part = part.strip()
+            if part:
+                staff_ids.append(int(part))
+    return list(dict.fromkeys(staff_ids))
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _range_filter(field, start_date, end_date):
+    # Timestamp bounds instead of __date lookups so the created_at indexes are usable
+    filters = {}
+    if start_date:
+        filters[f'{field}__gte'] = day_bounds(start_date, start_date)[0]
+    if end_date:
+        filters[f'{field}__lt'] = day_bounds(end_date, end_date)[1]
+    return filters
+
+
+def _grouped_counts(queryset, group_field, **counts):
+    """{staff id: {name: count}} from one GROUP BY query."""
+    rows = queryset.values(group_field).annotate(**counts).order_by()
+    return {row.pop(group_field): row for row in rows}
+
+
 class AdminStaffPerformanceAPIView(APIView):
     """
-    Get API for admin to view count of tests and trials performed by each audiologist (staff). by staff id 
+    Get API for admin to view count of tests and trials performed by each audiologist (staff). by staff id
+
+    Query params:
+        staff_id: one or more staff ids (?staff_id=1,2 or ?staff_id=1&staff_id=2)
+        start_date / end_date: YYYY-MM-DD
+        detail: full (default) lists every record, page paginates each list
+                (page / pageSize), none returns only the counts and ratios
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Filter only staff/audiologists (customize as needed)
-
-        staff_id = request.query_params.get('staff_id')
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-
-        if staff_id:
-            try:
-                staff = User.objects.get(id=staff_id, is_active=True, is_approved=True)
-            except User.DoesNotExist:
-                return Response({"status": 404, "error": "Staff not found"}, status=404)
-        else:
+        try:
+            staff_ids = _parse_staff_ids(request.query_params)
+            start_date = _parse_date(request.query_params.get('start_date'))
+            end_date = _parse_date(request.query_params.get('end_date'))
+        except ValueError:
+            return Response({"status": 400, "error": "Invalid staff_id or date (use YYYY-MM-DD)"}, status=400)
+
+        if not staff_ids:
             return Response({"status": 400, "error": "staff_id query parameter is required"}, status=400)
-        
+
+        detail = request.query_params.get('detail', 'full')
+        if detail not in DETAIL_MODES:
+            return Response(
+                {"status": 400, "error": f"detail must be one of: {', '.join(DETAIL_MODES)}"}, status=400,
+            )
+
+        staff_by_id = User.objects.select_related('role').filter(
+            id__in=staff_ids, is_active=True, is_approved=True,
+        ).in_bulk()
+        staff_members = [staff_by_id[staff_id] for staff_id in staff_ids if staff_id in staff_by_id]
+        if not staff_members:
+            return Response({"status": 404, "error": "Staff not found"}, status=404)
+
+        self.start_date, self.end_date = start_date, end_date
+        self.detail = detail
+        self.page_number = request.query_params.get('page', 1)
+        try:
+            self.page_size = min(
+                int(request.query_params.get('pageSize', settings.REST_FRAMEWORK.get('PAGE_SIZE', 10))),
+                MAX_DETAIL_PAGE_SIZE,
+            )
+        except ValueError:
+            return Response({"status": 400, "error": "pageSize must be a number"}, status=400)
+
+        def role_of(staff):
+            return getattr(staff.role, 'name', '').lower()
+
+        audiologist_ids = [staff.id for staff in staff_members if role_of(staff) == 'audiologist']
+        reception_ids = [staff.id for staff in staff_members if role_of(staff) == 'reception']
+        audiologist_counts = self.audiologist_counts(audiologist_ids) if audiologist_ids else {}
+        reception_counts = self.reception_counts(reception_ids) if reception_ids else {}
+
         results = []
-        if staff:
-            role = getattr(staff.role, 'name', '').lower()
+        for staff in staff_members:
             staff_result = {
                 "staff_id": staff.id,
                 "staff_name": staff.name,
                 "role": staff.role.name if staff.role else None
             }
-            if role == 'audiologist':
-                # wanted to show the count  and details of tests and trials performed by each audiologist
-                test_qs = PatientVisit.objects.filter(seen_by=staff, bill__payment_status='Paid', visit_type='New Test')
-                if start_date:
-                    test_qs = test_qs.filter(created_at__date__gte=start_date)
-                if end_date:
-                    test_qs = test_qs.filter(created_at__date__lte=end_date)
-                test_qs = test_qs.prefetch_related('bill').order_by('-created_at')
-                test_count = test_qs.count()
-                test_details = PatientVisitSerializer(test_qs, many=True).data
-                for i, visit in enumerate(test_qs):
-                    try:
-                        test_details[i]['cost'] = visit.bill.final_amount
-                    except:
-                        test_details[i]['cost'] = 0
-
-                trial_qs = Trial.objects.filter(visit__seen_by=staff, visit__bill__payment_status='Paid')
-                if start_date:
-                    trial_qs = trial_qs.filter(created_at__date__gte=start_date)
-                if end_date:
-                    trial_qs = trial_qs.filter(created_at__date__lte=end_date)
-                trial_qs = trial_qs.order_by('-created_at')
-                trial_count = trial_qs.count()
-                trial_details = TrialListSerializer(trial_qs, many=True).data
-                for i, trial in enumerate(trial_qs):
-                    trial_details[i]['cost'] = trial.cost
-
-                patient_seen_qs = PatientVisit.objects.filter(seen_by=staff, bill__payment_status='Paid')
-                if start_date:
-                    patient_seen_qs = patient_seen_qs.filter(created_at__date__gte=start_date)
-                if end_date:
-                    patient_seen_qs = patient_seen_qs.filter(created_at__date__lte=end_date)
-                patient_seen_qs = patient_seen_qs.values('patient__id', 'patient__name', 'patient__phone_primary').distinct()
-                patient_seen = patient_seen_qs.count()
-
-                # Follow-up completion %: completed followups / total followups assigned
-                # total_followups = PatientVisit.objects.filter(seen_by=staff, status='Follow-up').count()
-                # completed_followups = PatientVisit.objects.filter(seen_by=staff, status='Follow-up', contacted=True).count()
-                # followup_completion = (completed_followups / total_followups * 100) if total_followups > 0 else 0
-                
-                booked_trials_qs = trial_qs.filter(trial_decision__in=['BOOK - Awaiting Stock', 'BOOK - Device Allocated'])
-                trials_booked = booked_trials_qs.count()
-                booked_trials_details = TrialListSerializer(booked_trials_qs, many=True).data
-                for i, trial in enumerate(booked_trials_qs):
-                    booked_trials_details[i]['cost'] = trial.cost
-
-                trial_booking_ratio = (trials_booked / trial_count * 100) if trial_count > 0 else 0
-                staff_result.update({
-                    "test_count": test_count,
-                    "test_details": test_details,
-                    "trial_count": trial_count,
-                    "trial_details": trial_details,
-                    "patient_seen": patient_seen,
-                    "patient_seen_details": list(patient_seen_qs),
-                    "trials_booked": trials_booked,
-                    "booked_trials_details": booked_trials_details,
-                    "trial_booking_ratio": round(trial_booking_ratio, 2),
-                    # "followup_completion_percent": round(followup_completion, 2)
-                })
-
-            elif role == 'reception':
-                # Pending Service: service visits assigned and not completed
-                from .models import ServiceVisit
-                pending_service_qs = ServiceVisit.objects.filter(created_by=staff, visit__bill__payment_status='Paid')
-                if start_date:
-                    pending_service_qs = pending_service_qs.filter(created_at__date__gte=start_date)
-                if end_date:
-                    pending_service_qs = pending_service_qs.filter(created_at__date__lte=end_date)
-                pending_service = pending_service_qs.count()
-                pending_service_details = ServiceVisitListSerializer(pending_service_qs, many=True).data
-                for i, service in enumerate(pending_service_qs):
-                    pending_service_details[i]['cost'] = service.charges_collected
-
-                # Calls made for followup: PatientVisit where contacted_by = staff
-                calls_made_qs = PatientVisit.objects.filter(contacted_by=staff, contacted=True)
-                if start_date:
-                    calls_made_qs = calls_made_qs.filter(updated_at__date__gte=start_date)
-                if end_date:
-                    calls_made_qs = calls_made_qs.filter(updated_at__date__lte=end_date)
-                calls_made_qs = calls_made_qs.order_by('-updated_at')
-                calls_made = calls_made_qs.count()
-                calls_made_details = PatientVisitSerializer(calls_made_qs, many=True, show_contacted_fields=True).data
-
-                staff_result.update({
-                    "pending_service": pending_service,
-                    "pending_service_details": pending_service_details,
-                    "calls_made_for_followup": calls_made,
-                    "calls_made_details": calls_made_details
-                })
+            if staff.id in audiologist_ids:
+                staff_result.update(audiologist_counts[staff.id])
+                if detail != 'none':
+                    staff_result.update(self.audiologist_details(staff))
+            elif staff.id in reception_ids:
+                staff_result.update(reception_counts[staff.id])
+                if detail != 'none':
+                    staff_result.update(self.reception_details(staff))
             results.append(staff_result)
 
         return Response({"status": 200, "data": results})
+
+    # ------------------------------------------------------------ querysets
+
+    def paid_visits(self, staff_ids):
+        return PatientVisit.objects.filter(
+            seen_by__in=staff_ids, bill__payment_status='Paid',
+            **_range_filter('created_at', self.start_date, self.end_date),
+        )
+
+    def trials(self, staff_ids):
+        return Trial.objects.filter(
+            visit__seen_by__in=staff_ids, visit__bill__payment_status='Paid',
+            **_range_filter('created_at', self.start_date, self.end_date),
+        )
+
+    def service_visits(self, staff_ids):
+        return ServiceVisit.objects.filter(
+            created_by__in=staff_ids, visit__bill__payment_status='Paid',
+            **_range_filter('created_at', self.start_date, self.end_date),
+        )
+
+    def followup_calls(self, staff_ids):
+        return PatientVisit.objects.filter(
+            contacted_by__in=staff_ids, contacted=True,
+            **_range_filter('updated_at', self.start_date, self.end_date),
+        )
+
+    # -------------------------------------------------------------- counts
+
+    def audiologist_counts(self, staff_ids):
+        """
+        test_count / patient_seen / trial_count / trials_booked / trial_booking_ratio
+        for every audiologist in staff_ids, from two grouped queries.
+        """
+        visits = _grouped_counts(
+            self.paid_visits(staff_ids), 'seen_by',
+            test_count=Count('pk', filter=Q(visit_type='New Test')),
+            patient_seen=Count('patient', distinct=True),
+        )
+        trials = _grouped_counts(
+            self.trials(staff_ids), 'visit__seen_by',
+            trial_count=Count('pk'),
+            trials_booked=Count('pk', filter=Q(trial_decision__in=BOOKED_TRIAL_DECISIONS)),
+        )
+        counts = {}
+        for staff_id in staff_ids:
+            row = {**EMPTY_AUDIOLOGIST_COUNTS, **visits.get(staff_id, {}), **trials.get(staff_id, {})}
+            if row['trial_count']:
+                row['trial_booking_ratio'] = round(row['trials_booked'] / row['trial_count'] * 100, 2)
+            counts[staff_id] = row
+        return counts
+
+    def reception_counts(self, staff_ids):
+        """pending_service / calls_made_for_followup per receptionist, one grouped query each."""
+        services = _grouped_counts(self.service_visits(staff_ids), 'created_by', pending_service=Count('pk'))
+        calls = _grouped_counts(self.followup_calls(staff_ids), 'contacted_by', calls_made_for_followup=Count('pk'))
+        return {
+            staff_id: {**EMPTY_RECEPTION_COUNTS, **services.get(staff_id, {}), **calls.get(staff_id, {})}
+            for staff_id in staff_ids
+        }
+
+    # ------------------------------------------------------------- details
+
+    def serialize(self, queryset, serializer_class=None, **kwargs):
+        """The whole list (detail=full) or one page of it (detail=page)."""
+        def to_data(rows):
+            return serializer_class(rows, many=True, **kwargs).data if serializer_class else list(rows)
+
+        if self.detail != 'page':
+            return to_data(queryset)
+        page = Paginator(queryset, self.page_size).get_page(self.page_number)
+        return {
+            "nextPage": page.next_page_number() if page.has_next() else -1,
+            "previousPage": page.previous_page_number() if page.has_previous() else -1,
+            "totalItems": page.paginator.count,
+            "totalPages": page.paginator.num_pages,
+            "data": to_data(page.object_list),
+        }
+
+    def audiologist_details(self, staff):
+        test_qs = self.paid_visits([staff.id]).filter(visit_type='New Test').select_related(
+            'patient', 'seen_by',
+        ).annotate(
+            cost=Coalesce('bill__final_amount', Value(0), output_field=DecimalField(max_digits=10, decimal_places=2)),
+        ).order_by('-created_at', '-id')
+
+        trial_qs = self.trials([staff.id]).select_related(
+            'visit__seen_by', 'assigned_patient',
+            'device_inventory_id__brand', 'device_inventory_id__model_type',
+        ).order_by('-created_at', '-id')
+
+        patient_seen_qs = self.paid_visits([staff.id]).values(
+            'patient__id', 'patient__name', 'patient__phone_primary',
+        ).distinct().order_by('patient__name', 'patient__id')
+
+        return {
+            "test_details": self.serialize(test_qs, StaffVisitSerializer),
+            "trial_details": self.serialize(trial_qs, StaffTrialSerializer),
+            "patient_seen_details": self.serialize(patient_seen_qs),
+            "booked_trials_details": self.serialize(
+                trial_qs.filter(trial_decision__in=BOOKED_TRIAL_DECISIONS), StaffTrialSerializer,
+            ),
+        }
+
+    def reception_details(self, staff):
+        service_qs = self.service_visits([staff.id]).select_related(
+            'visit__patient', 'device_serial',
+            'device__inventory_item__brand', 'device__inventory_item__model_type',
+        ).order_by('-created_at', '-id')
+
+        calls_made_qs = self.followup_calls([staff.id]).select_related(
+            'patient', 'seen_by', 'contacted_by',
+        ).order_by('-updated_at', '-id')
+
+        return {
+            "pending_service_details": self.serialize(service_qs, StaffServiceSerializer),
+            "calls_made_details": self.serialize(calls_made_qs, PatientVisitSerializer, show_contacted_fields=True),
+        }
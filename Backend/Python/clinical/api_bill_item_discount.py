@@ -58,11 +58,9 @@ class BillItemDiscountUpdateView(APIView):
                 # Update the BillItem
                 bill_item.discount_amount = discount_amount
                 # bill_item.discount_reason = discount_reason
+                # Saving the item moves the bill total by the discount change
                 bill_item.save()
                 
-                # Recalculate bill total
-                bill_item.bill.calculate_total()
-                
                 # Return updated BillItem
                 serializer = BillItemSerializer(bill_item)
                 return Response({
@@ -104,49 +102,51 @@ class BillItemBulkDiscountUpdateView(APIView):
                 updated_items = []
                 errors = []
                 
-                for update in discount_updates:
-                    item_id = update.get('item_id')
-                    discount_amount = update.get('discount_amount')
-                    # discount_reason = update.get('discount_reason', '')
-                    
-                    if not item_id:
-                        errors.append('item_id is required')
-                        continue
-                    
-                    if discount_amount is None:
-                        errors.append(f'discount_amount is required for item_id {item_id}')
-                        continue
-                    
-                    try:
-                        # Get the BillItem
-                        bill_item = BillItem.objects.get(id=item_id, bill=bill)
-                        
-                        # Validate discount amount
+                # One recalculation for the whole batch instead of one per item
+                with bill.deferred_total():
+                    for update in discount_updates:
+                        item_id = update.get('item_id')
+                        discount_amount = update.get('discount_amount')
+                        # discount_reason = update.get('discount_reason', '')
+
+                        if not item_id:
+                            errors.append('item_id is required')
+                            continue
+
+                        if discount_amount is None:
+                            errors.append(f'discount_amount is required for item_id {item_id}')
+                            continue
+
                         try:
-                            discount_amount = float(discount_amount)
-                            if discount_amount < 0:
-                                errors.append(f'discount_amount cannot be negative for item_id {item_id}')
+                            # Get the BillItem
+                            bill_item = BillItem.objects.get(id=item_id, bill=bill)
+
+                            # Validate discount amount
+                            try:
+                                discount_amount = float(discount_amount)
+                                if discount_amount < 0:
+                                    errors.append(f'discount_amount cannot be negative for item_id {item_id}')
+                                    continue
+                            except (ValueError, TypeError):
+                                errors.append(f'discount_amount must be a valid number for item_id {item_id}')
                                 continue
-                        except (ValueError, TypeError):
-                            errors.append(f'discount_amount must be a valid number for item_id {item_id}')
-                            continue
-                        
-                        # Check if discount doesn't exceed item total
-                        item_total = float(bill_item.cost * bill_item.quantity)
-                        if discount_amount > item_total:
-                            errors.append(f'discount_amount ({discount_amount}) cannot exceed item total ({item_total}) for item_id {item_id}')
+
+                            # Check if discount doesn't exceed item total
+                            item_total = float(bill_item.cost * bill_item.quantity)
+                            if discount_amount > item_total:
+                                errors.append(f'discount_amount ({discount_amount}) cannot exceed item total ({item_total}) for item_id {item_id}')
+                                continue
+
+                            # Update the BillItem
+                            bill_item.discount_amount = discount_amount
+                            # bill_item.discount_reason = discount_reason
+                            bill_item.save()
+
+                            updated_items.append(bill_item)
+
+                        except BillItem.DoesNotExist:
+                            errors.append(f'BillItem with id {item_id} not found in this bill')
                             continue
-                        
-                        # Update the BillItem
-                        bill_item.discount_amount = discount_amount
-                        # bill_item.discount_reason = discount_reason
-                        bill_item.save()
-                        
-                        updated_items.append(bill_item)
-                        
-                    except BillItem.DoesNotExist:
-                        errors.append(f'BillItem with id {item_id} not found in this bill')
-                        continue
                 
                 if errors:
                     return Response({
@@ -154,9 +154,6 @@ class BillItemBulkDiscountUpdateView(APIView):
                         'errors': errors
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
-                # Recalculate bill total
-                bill.calculate_total()
-                
                 # Return updated BillItems
                 serializer = BillItemSerializer(updated_items, many=True)
                 return Response({
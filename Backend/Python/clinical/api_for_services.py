@@ -8,6 +8,7 @@ from django.db import transaction
 from .models import PatientVisit, Patient, InventorySerial, PatientPurchase, ServiceVisit, InventoryItem
 from django.utils import timezone
 from clinical_be.utils.pagination import StandardResultsSetPagination
+from .patient_search import patient_search_q
 from django.db.models import Q
 from django.db.models import F
 
@@ -35,10 +36,7 @@ class CustomerNeedService(APIView):
 
             search_query = request.query_params.get('search', None)
             if search_query:
-                service_visits = service_visits.filter(
-                    Q(patient__name__icontains=search_query) |
-                    Q(patient__phone_primary__icontains=search_query)
-                )
+                service_visits = service_visits.filter(patient_search_q(search_query.split(), 'patient__'))
             
             # Get unique patients (latest visit per patient)
             unique_patients = {}
@@ -261,12 +259,11 @@ class ServiceVisitUpdateView(APIView):
 
                 # Calculate total GST for parts used
                 parts_gst_total = 0
+                part_items = InventoryItem.objects.in_bulk([part['inventory_item'] for part in parts_created])
                 for part_data in parts_created:
-                    try:
-                        inv_item = InventoryItem.objects.get(id=part_data['inventory_item'])
+                    inv_item = part_items.get(part_data['inventory_item'])
+                    if inv_item:
                         parts_gst_total += float(inv_item.gst_value or 0) * part_data['quantity']
-                    except InventoryItem.DoesNotExist:
-                        pass
                 
                 # Total GST = Service GST + Parts GST
                 total_gst = float(gst_value or 0) + parts_gst_total
@@ -289,43 +286,45 @@ class ServiceVisitUpdateView(APIView):
                         )
                         bill.refresh_from_db()
                     
-                    # Delete existing service-related BillItems to avoid duplicates on re-submission
-                    BillItem.objects.filter(
-                        bill=bill,
-                        item_type__in=['Service', 'Part Used in Service']
-                    ).delete()
-
-                    # Add service charges to bill
-                    if charges_collected > 0:
-                        BillItem.objects.create(
+                    # Replace the service-related BillItems and recalculate the total once
+                    with bill.deferred_total():
+                        # Delete existing service-related BillItems to avoid duplicates on re-submission
+                        BillItem.objects.filter(
                             bill=bill,
-                            item_type='Service',
-                            service_visit=service_visit,
-                            description=f"Service charges for {service_visit.service_type}",
-                            cost=charges_collected,
-                            quantity=1,
-                        )
-                    
-                    # Add parts to D
-                    if len(parts_created) > 0:
-                        for part_data in parts_created:
-                            inventory_item = InventoryItem.objects.get(id=part_data['inventory_item'])
-                            
-                            # Build description with serial number if available
-                            description = f"{inventory_item.product_name} (Qty: {part_data['quantity']})"
-                            if part_data.get('serial_number'):
-                                description += f" - SN: {part_data['serial_number']}"
-                            
-                            BillItem.objects.create(
-                                bill=bill,
-                                item_type='Part Used in Service',
-                                description=description,
-                                cost=inventory_item.unit_price * part_data['quantity'],
-                                quantity=part_data['quantity'],
-                            )
-                    
-                    # Calculate bill total
-                    bill.calculate_total()
+                            item_type__in=['Service', 'Part Used in Service']
+                        ).delete()
+
+                        bill_items = []
+                        # Add service charges to bill
+                        if charges_collected > 0:
+                            bill_items.append(BillItem(
+                                item_type='Service',
+                                service_visit=service_visit,
+                                description=f"Service charges for {service_visit.service_type}",
+                                cost=charges_collected,
+                                quantity=1,
+                            ))
+
+                        # Add parts to D
+                        if len(parts_created) > 0:
+                            for part_data in parts_created:
+                                inventory_item = part_items[part_data['inventory_item']]
+
+                                # Build description with serial number if available
+                                description = f"{inventory_item.product_name} (Qty: {part_data['quantity']})"
+                                if part_data.get('serial_number'):
+                                    description += f" - SN: {part_data['serial_number']}"
+
+                                bill_items.append(BillItem(
+                                    item_type='Part Used in Service',
+                                    inventory_item=inventory_item,
+                                    description=description,
+                                    cost=inventory_item.unit_price * part_data['quantity'],
+                                    quantity=part_data['quantity'],
+                                ))
+
+                        bill.add_items(bill_items)
+
                     bill_created = {
                         'bill_id': bill.id,
                         'total_amount': float(bill.total_amount),
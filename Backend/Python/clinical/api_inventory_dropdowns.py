@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from .models import InventoryItem, CATEGORY_CHOICES , Brand, ModelType
 from .serializers import InventoryItemSerializer, BrandSerializer, ModelTypeSerializer
+from clinical_be.utils.cache import get_or_set
 
 class InventoryDropdownsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -19,18 +20,24 @@ class InventoryDropdownsView(APIView):
         # category only: return brands for that category
 
         if accessories_type: # use only when category is Accessroies
-            brands = Brand.objects.filter(category=category, accessories_type=accessories_type).distinct()
-            unique_brands = BrandSerializer(brands, many=True).data
+            unique_brands = get_or_set('brands-models', ['dropdown-brands', category, accessories_type], lambda: list(
+                BrandSerializer(Brand.objects.filter(category=category, accessories_type=accessories_type).distinct(), many=True).data
+            ))
             return Response({'brands': unique_brands}, status=status.HTTP_200_OK)
         
         if category and not brand:
-            brands = Brand.objects.filter(category=category).distinct()
-            unique_brands = BrandSerializer(brands, many=True).data
+            unique_brands = get_or_set('brands-models', ['dropdown-brands', category], lambda: list(
+                BrandSerializer(Brand.objects.filter(category=category).distinct(), many=True).data
+            ))
             return Response({'brands': unique_brands}, status=status.HTTP_200_OK)
         # category and brand: return models for that category and brand
         if category and brand:
-            models = ModelType.objects.filter(brand__category=category, brand__name=brand).distinct()
-            unique_models = ModelTypeSerializer(models, many=True).data
+            unique_models = get_or_set('brands-models', ['dropdown-models', category, brand], lambda: list(
+                ModelTypeSerializer(
+                    ModelType.objects.filter(brand__category=category, brand__name=brand).select_related('brand').distinct(),
+                    many=True,
+                ).data
+            ))
             return Response({'models': unique_models}, status=status.HTTP_200_OK)
         # If only brand is provided (should not happen), return error
         return Response({'error': 'Invalid parameters. Provide category or category+brand.'}, status=status.HTTP_400_BAD_REQUEST)
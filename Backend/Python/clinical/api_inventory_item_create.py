@@ -6,6 +6,7 @@ from .models import DeletedRecordLog,ContentType
 from clinical_be.utils.permission import IsClinicAdmin, AuditorPermission, ReceptionistPermission,ClinicManagerPermission
 from django.contrib.contenttypes.models import ContentType
 from django_filters.rest_framework import DjangoFilterBackend 
+from clinical_be.utils.cache import get_or_set
 
 class BrandListView(generics.ListAPIView):
     queryset = Brand.objects.all()
@@ -15,8 +16,11 @@ class BrandListView(generics.ListAPIView):
     filterset_fields = ['category' , 'accessories_type']  # Allow filtering by category
 
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        return Response({"status": 200, "data": response.data}, status=status.HTTP_200_OK)
+        data = get_or_set(
+            'brands-models', ['brands', request.get_full_path()],
+            lambda: super(BrandListView, self).list(request, *args, **kwargs).data,
+        )
+        return Response({"status": 200, "data": data}, status=status.HTTP_200_OK)
 
 class BrandCreateView(generics.CreateAPIView):
     # queryset = Brand.objects.all()
@@ -41,12 +45,14 @@ class BrandCreateView(generics.CreateAPIView):
 
 
 class ModelListView(generics.ListAPIView):
-    queryset = ModelType.objects.all()
+    queryset = ModelType.objects.select_related('brand')
     serializer_class = ModelTypeSerializer  # Use the ModelTypeSerializer for returning model data
 
     def list(self, request, *args, **kwargs):
-        serializer = self.get_serializer(self.get_queryset(), many=True)
-        return Response({"status": 200, "data": serializer.data}, status=status.HTTP_200_OK)
+        data = get_or_set(
+            'brands-models', ['models'], lambda: list(self.get_serializer(self.get_queryset(), many=True).data)
+        )
+        return Response({"status": 200, "data": data}, status=status.HTTP_200_OK)
     
 class ModelCreateView(generics.CreateAPIView):  
     queryset = ModelType.objects.all()
@@ -89,7 +95,7 @@ class InventoryItemCreateView(generics.CreateAPIView):
         # Assign the item to the user's clinic (Admin's clinic acts as Main Inventory)
         if request.user.role.name == 'Clinic Manager':
             # Clinic Managers can only create items for their managed clinics
-            managed_clinics = request.user.managed_clinics_assignments.values_list('clinic', flat=True)
+            managed_clinics = request.user.managed_clinic_ids
 
             if not managed_clinics:
                 return Response({"status": 403, "error": "You do not have permission to create items for any clinic"}, status=status.HTTP_403_FORBIDDEN)
@@ -6,6 +6,7 @@ from .serializers import InventoryItemSerializer, InventorySerialDetailSerialize
 from clinical_be.utils.permission import IsClinicAdmin, AuditorPermission, ReceptionistPermission, ClinicManagerPermission
 from clinical_be.utils.pagination import StandardResultsSetPagination
 from rest_framework.generics import ListAPIView
+from django.db.models import Count, Q
 
 class InventoryItemListView(ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsClinicAdmin | ReceptionistPermission | ClinicManagerPermission ]
@@ -21,7 +22,7 @@ class InventoryItemListView(ListAPIView):
                 items = items.filter(clinic_id=clinic_id)
         elif request.user.role.name == 'Clinic Manager':
             # Clinic Managers see items for their clinic, but can also filter by other clinics they manage
-            managed_clinics = request.user.managed_clinics_assignments.values_list('clinic', flat=True)
+            managed_clinics = request.user.managed_clinic_ids
             items = InventoryItem.objects.filter(clinic__in=managed_clinics, is_approved=True).order_by('-id')
             clinic_id = request.query_params.get('clinic_id')
             if clinic_id:
@@ -31,45 +32,35 @@ class InventoryItemListView(ListAPIView):
             # Non-admins only see their clinic's inventory
             items = InventoryItem.objects.filter(clinic=request.user.clinic, is_approved=True).order_by('-id')
 
-        # Always compute counts on the full unfiltered list
-        all_items = list(items)
-        
         status_param = request.query_params.get('status')
         use_in_trial = request.query_params.get('use_in_trial') # true or false
-         
-        # Determine base items for counting based on conditions
+
+        # With use_in_trial param: counts should reflect filtered items; otherwise all items
         if use_in_trial is not None:
-            # With use_in_trial param: counts should reflect filtered items
-            use_in_trial_bool = use_in_trial.lower() == 'true'
-            base_items = [item for item in all_items if item.use_in_trial == use_in_trial_bool]
-        else:
-            # No params: counts should reflect all items
-            base_items = all_items
-        
-        # Calculate counts based on determined base items
-        total_count = len(base_items)
-        low_count = sum(1 for item in base_items if item.status.lower() == 'low')
-        critical_count = sum(1 for item in base_items if item.status.lower() == 'critical')
-        
+            items = items.filter(use_in_trial=use_in_trial.lower() == 'true')
+        items = InventoryItemSerializer.setup_eager_loading(items)
+
+        # One conditional aggregate for all three counts
+        counts = items.aggregate(
+            total_count=Count('pk'),
+            low_count=Count('pk', filter=Q(stock_status='Low')),
+            critical_count=Count('pk', filter=Q(stock_status='Critical')),
+        )
+
         # Apply additional filters
-        items = base_items
         if status_param:
-            items = [item for item in items if item.status.lower() == status_param.lower()]
-        
+            items = items.filter(stock_status__iexact=status_param)
+
         page = self.paginate_queryset(items)
 
         if page is not None:
             serializer = InventoryItemSerializer(page, many=True)
             response = self.get_paginated_response(serializer.data)
-            response.data['total_count'] = total_count
-            response.data['low_count'] = low_count
-            response.data['critical_count'] = critical_count
+            response.data.update(counts)
             return response
         serializer = InventoryItemSerializer(items, many=True)
         return Response({
-            'total_count': total_count,
-            'low_count': low_count,
-            'critical_count': critical_count,
+            **counts,
             'results': serializer.data
             
         }, status=status.HTTP_200_OK)
@@ -124,10 +115,11 @@ class InventoryItemPendingListView(ListAPIView):
             if clinic_id:
                 items = InventoryItem.objects.filter(clinic_id=clinic_id, is_approved=False).order_by('-id')
             else:   
-                managed_clinics = request.user.managed_clinics_assignments.values_list('clinic', flat=True)
+                managed_clinics = request.user.managed_clinic_ids
                 items = InventoryItem.objects.filter(clinic__in=managed_clinics, is_approved=False).order_by('-id')
         else:
             items = InventoryItem.objects.filter(clinic=request.user.clinic, is_approved=False).order_by('-id')
+        items = InventoryItemSerializer.setup_eager_loading(items)
 
         page = self.paginate_queryset(items)
         if page is not None:
@@ -169,6 +161,7 @@ class MainInventoryItemListView(ListAPIView):
         #     items = InventoryItem.objects.filter(clinic__in=managed_clinics, clinic__is_main_inventory=True, is_approved=True).order_by('-id')
         # else:
         #     items = InventoryItem.objects.filter(clinic=request.user.clinic, clinic__is_main_inventory=True, is_approved=True).order_by('-id')
+        items = InventoryItemSerializer.setup_eager_loading(items)
 
         page = self.paginate_queryset(items)
         if page is not None:
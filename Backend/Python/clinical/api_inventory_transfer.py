@@ -1,18 +1,19 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from django.db import transaction
 from django.shortcuts import get_object_or_404
-from .models import InventoryItem, InventorySerial, InventoryTransfer
+from .models import InventoryItem, InventoryTransfer
 from accounts.models import Clinic
-from .serializers import InventoryTransferSerializer
+from .serializers import InventoryItemSerializer, InventoryTransferSerializer
+from .inventory_transfer import TransferError, transfer_inventory
 from clinical_be.utils.permission import IsClinicAdmin
 from django.db import models
 
 class InventoryTransferView(APIView):
     """
     API to transfer inventory items from one clinic to another.
-    Handles both Serialized and Non-Serialized items.
+    Handles both Serialized and Non-Serialized items; all products move in
+    one transaction (see clinical.inventory_transfer).
     """
     permission_classes = [permissions.IsAuthenticated, IsClinicAdmin]
 
@@ -32,132 +33,10 @@ class InventoryTransferView(APIView):
         except Clinic.DoesNotExist:
             return Response({"status": 404, "error": "Destination Clinic not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # 1. Fetch all source items
-        source_ids = [p.get('source_inventory_id') for p in products if p.get('source_inventory_id')]
-        if not source_ids:
-             return Response({"status": 400, "error": "No valid source items provided."}, status=status.HTTP_400_BAD_REQUEST)
-
-        source_items = InventoryItem.objects.filter(id__in=source_ids)
-        source_item_map = {item.id: item for item in source_items}
-
-        if len(source_items) != len(set(source_ids)):
-             return Response({"status": 400, "error": "One or more source items not found."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 2. Pre-fetch destination items by SKU to minimize queries
-        source_skus = [item.sku for item in source_items if item.sku]
-        dest_items_by_sku = {}
-        if source_skus:
-            dest_items = InventoryItem.objects.filter(clinic=to_clinic, sku__in=source_skus)
-            for item in dest_items:
-                dest_items_by_sku[item.sku] = item
-
-        transfer_logs = []
-
-        with transaction.atomic():
-            for product_data in products:
-                source_id = product_data.get('source_inventory_id')
-                quantity = int(product_data.get('quantity', 0))
-                serial_numbers = product_data.get('serial_numbers', [])
-                
-                source_item = source_item_map.get(source_id)
-                if not source_item:
-                    continue 
-
-                if source_item.clinic_id == to_clinic.id:
-                    return Response({"status": 400, "error": f"Item '{source_item.product_name}' is already in the destination clinic."}, status=status.HTTP_400_BAD_REQUEST)
-
-                master_ref = source_item.master_item if source_item.master_item else source_item
-
-                # Find or Create Destination Item
-                dest_item = None
-                if source_item.sku and source_item.sku in dest_items_by_sku:
-                    dest_item = dest_items_by_sku[source_item.sku]
-                
-                if not dest_item:
-                    # Try legacy match
-                    if not source_item.sku:
-                        dest_item = InventoryItem.objects.filter(
-                            clinic=to_clinic,
-                            brand=source_item.brand,
-                            model_type=source_item.model_type,
-                            product_name=source_item.product_name,
-                            category=source_item.category
-                        ).first()
-
-                    if not dest_item:
-                        dest_item = InventoryItem.objects.create(
-                            clinic=to_clinic,
-                            product_name=source_item.product_name,
-                            brand=source_item.brand,
-                            model_type=source_item.model_type,
-                            category=source_item.category,
-                            stock_type=source_item.stock_type,
-                            sku=source_item.sku,
-                            master_item=master_ref,
-                            description=source_item.description,
-                            reorder_level=source_item.reorder_level,
-                            unit_price=source_item.unit_price,
-                            use_in_trial=source_item.use_in_trial,
-                            quantity_in_stock=0
-                        )
-                        if dest_item.sku:
-                            dest_items_by_sku[dest_item.sku] = dest_item
-                
-                # Ensure linkage
-                if not dest_item.master_item:
-                    dest_item.master_item = master_ref
-                dest_item.save()
-
-                transfer_qty = 0
-
-                if source_item.stock_type == 'Serialized':
-                    if not serial_numbers:
-                        return Response({"status": 400, "error": f"Serial numbers required for {source_item.product_name}"}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    serials_qs = InventorySerial.objects.filter(
-                        inventory_item=source_item,
-                        serial_number__in=serial_numbers,
-                        status='In Stock'
-                    )
-                    if serials_qs.count() != len(serial_numbers):
-                         return Response({"status": 400, "error": f"Invalid or unavailable serials for {source_item.product_name}"}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    serials_qs.update(inventory_item=dest_item)
-                    
-                    # Update quantities manually to save query
-                    source_item.quantity_in_stock -= len(serial_numbers)
-                    dest_item.quantity_in_stock += len(serial_numbers)
-                    transfer_qty = len(serial_numbers)
-
-                else:
-                    # Non-Serialized
-                    if quantity <= 0:
-                        return Response({"status": 400, "error": f"Quantity must be > 0 for {source_item.product_name}"}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    if source_item.quantity_in_stock < quantity:
-                        return Response({"status": 400, "error": f"Insufficient stock for {source_item.product_name}. Available: {source_item.quantity_in_stock}"}, status=status.HTTP_400_BAD_REQUEST)
-
-                    source_item.quantity_in_stock -= quantity
-                    dest_item.quantity_in_stock += quantity
-                    transfer_qty = quantity
-
-                source_item.save()
-                dest_item.save()
-
-                transfer_logs.append(InventoryTransfer(
-                    item_name=source_item.product_name,
-                    category=source_item.category,
-                    brand=source_item.brand,
-                    model=source_item.model_type.name if source_item.model_type else '',
-                    from_clinic=source_item.clinic,
-                    to_clinic=to_clinic,
-                    quantity=transfer_qty,
-                    serial_numbers=serial_numbers if source_item.stock_type == 'Serialized' else [],
-                    transferred_by=request.user,
-                    notes=notes
-                ))
-            
-            InventoryTransfer.objects.bulk_create(transfer_logs)
+        try:
+            transfer_logs = transfer_inventory(to_clinic, products, request.user, notes)
+        except TransferError as exc:
+            return Response({"status": 400, "error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             "status": 200, 
@@ -180,7 +59,7 @@ class InventoryTransferHistoryView(APIView):
         if user.role.name != 'Admin':
             user_clinics = [user.clinic] if user.clinic else []
             if user.role.name == 'Clinic Manager':
-                 user_clinics = user.managed_clinics_assignments.values_list('clinic', flat=True)
+                 user_clinics = user.managed_clinic_ids
             
             queryset = queryset.filter(models.Q(from_clinic__in=user_clinics) | models.Q(to_clinic__in=user_clinics))
 
@@ -198,18 +77,14 @@ class InventoryFlatListView(APIView): # For dropdowns and quick access
     def get(self, request):
         clinic = Clinic.objects.filter(is_main_inventory=True).first()
 
-        queryset = InventoryItem.objects.select_related('clinic', 'brand', 'model_type').filter(clinic=clinic, quantity_in_stock__gt=0).distinct()
-        
-        # Calculate quantity_in_stock based on stock type
+        # stock_quantity: the In Stock serial counter for serialized items, the stored quantity otherwise
+        queryset = InventoryItemSerializer.setup_eager_loading(
+            InventoryItem.objects.filter(clinic=clinic)
+        ).filter(stock_quantity__gt=0)
+
         data = []
         for item in queryset:
-            if item.stock_type == 'Serialized':
-                # For serialized items, count only serial numbers with 'In Stock' status
-                quantity = item.serials.filter(status='In Stock').count()
-            else:
-                # For non-serialized items, use the stored quantity
-                quantity = item.quantity_in_stock
-            
+            quantity = item.stock_quantity
             data.append({
                 'id': item.id,
                 'product_name': item.product_name,
@@ -81,6 +81,7 @@ class TrialCompletionNotesUpdateView(generics.UpdateAPIView):
         BillItem.objects.create(
             bill=bill,
             item_type='Purchase',
+            inventory_item=inventory_item,
             description=f"Purchase of {inventory_item.product_name} ({inventory_item.brand} {inventory_item.model_type}) - With Customization",
             cost=unit_price,
             quantity=1,
@@ -2,7 +2,7 @@ from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-from django.db.models import Count, Q
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery
 from .models import InventoryItem, InventorySerial, Trial, Patient, ModelType
 from .serializers import TrialDeviceSerialSerializer, ProductInfoBySerialSerializer, ModelTypeSerializer
 from clinical_be.utils.pagination import StandardResultsSetPagination
@@ -151,56 +151,73 @@ class ProductInfoBySerialView(generics.RetrieveAPIView):
 
 
 class TrialDeviceInUseListView(generics.ListAPIView):
-    """API endpoint for listing trial devices currently in use."""
+    """
+    API endpoint for listing trial devices currently in use, with the
+    patient of each device's latest trial. Paginated (page / pageSize);
+    ?clinic_id= limits it to one clinic's devices.
+    """
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
     
     def get_queryset(self):
         """Get serial numbers for trial devices currently in trial status."""
-        return InventorySerial.objects.filter(
+        # Latest trial of each serial, fetched for the whole page in one query
+        latest_trial = Trial.objects.filter(
+            inventory_serial=OuterRef('inventory_serial'),
+        ).order_by('-created_at', '-id').values('pk')[:1]
+        queryset = InventorySerial.objects.filter(
             inventory_item__use_in_trial=True,
             status='Use in Trial'
-        ).select_related('inventory_item').order_by('-created_at')
+        ).select_related(
+            'inventory_item__brand', 'inventory_item__model_type',
+        ).prefetch_related(
+            Prefetch(
+                'trials',
+                queryset=Trial.objects.filter(pk=Subquery(latest_trial)).select_related('assigned_patient'),
+                to_attr='latest_trials',
+            ),
+        ).order_by('-created_at', '-id')
+
+        clinic_id = self.request.query_params.get('clinic_id')
+        if clinic_id:
+            queryset = queryset.filter(inventory_item__clinic_id=clinic_id)
+        return queryset
+
+    def device_data(self, serial):
+        trial = serial.latest_trials[0] if serial.latest_trials else None
+        trial_info = None
+        if trial and trial.assigned_patient:
+            trial_info = {
+                'trial_id': trial.id,
+                'patient_name': trial.assigned_patient.name,
+                'patient_phone': trial.assigned_patient.phone_primary,
+                'trial_start_date': trial.trial_start_date,
+                'trial_end_date': trial.trial_end_date,
+                'followup_date': trial.followup_date,
+                'ear_fitted': trial.ear_fitted,
+            }
+        item = serial.inventory_item
+        return {
+            'serial_number': serial.serial_number,
+            'status': serial.status,
+            'product_info': {
+                'id': item.id,
+                'product_name': item.product_name,
+                'brand': item.brand.name if item.brand else None,
+                'model_type': item.model_type.name if item.model_type else None,
+                'category': item.category,
+            },
+            'trial_assignment': trial_info
+        }
     
     def list(self, request, *args, **kwargs):
         """Return trial devices currently in use with patient assignment info."""
         queryset = self.get_queryset()
-        
-        devices_in_use = []
-        for serial in queryset:
-            # Get trial information for this serial
-            trial_info = None
-            try:
-                trial = Trial.objects.filter(serial_number=serial.serial_number).first()
-                if trial and trial.assigned_patient:
-                    trial_info = {
-                        'trial_id': trial.id,
-                        'patient_name': trial.assigned_patient.name,
-                        'patient_phone': trial.assigned_patient.phone_primary,
-                        'trial_start_date': trial.trial_start_date,
-                        'trial_end_date': trial.trial_end_date,
-                        'followup_date': trial.followup_date,
-                        'ear_fitted': trial.ear_fitted,
-                    }
-            except:
-                pass
-            
-            device_data = {
-                'serial_number': serial.serial_number,
-                'status': serial.status,
-                # 'created_at': serial.created_at,
-                'product_info': {
-                    'id': serial.inventory_item.id,
-                    'product_name': serial.inventory_item.product_name,
-                    'brand': serial.inventory_item.brand,
-                    'model_type': serial.inventory_item.model_type,
-                    'category': serial.inventory_item.category,
-                },
-                'trial_assignment': trial_info
-            }
-            devices_in_use.append(device_data)
-        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([self.device_data(serial) for serial in page])
+
         return Response({
             "status": status.HTTP_200_OK,
-            "data": devices_in_use
+            "data": [self.device_data(serial) for serial in queryset]
         })
@@ -1,7 +1,8 @@
+from django.db.models import Prefetch
 from rest_framework import generics, permissions
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter
-from .models import InventoryItem
+from .models import InventoryItem, InventorySerial
 from .serializers import TrialDeviceSerializer
 from rest_framework.response import Response
 from rest_framework import status
@@ -15,7 +16,9 @@ class TrialDeviceListView(generics.ListAPIView):
 
     def get_queryset(self):
         """Only return items that are marked for trial use."""
-        return InventoryItem.objects.filter(use_in_trial=True, is_approved=True).prefetch_related('serials').order_by('product_name')
+        return InventoryItem.objects.filter(use_in_trial=True, is_approved=True).prefetch_related(
+            Prefetch('serials', queryset=InventorySerial.objects.filter(status='In Stock'), to_attr='in_stock_serials'),
+        ).order_by('product_name')
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -3,7 +3,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter
 from .models import Trial
 from .serializers import TrialCreateSerializer, TrialListSerializer
-from clinical_be.utils.pagination import StandardResultsSetPagination
+from clinical_be.utils.pagination import KeysetResultsSetPagination
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -28,10 +28,10 @@ class TrialListView(generics.ListAPIView):
     """API endpoint for listing all trial records."""
     queryset = Trial.objects.select_related(
         'assigned_patient', 'visit__seen_by', 'device_inventory_id'
-    ).order_by('-created_at')
+    ).order_by('-created_at', '-id')
     serializer_class = TrialListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['ear_fitted', 'patient_response', 'visit__status']
     search_fields = [
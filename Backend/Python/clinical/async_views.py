@@ -0,0 +1,50 @@
+"""
+Async variants of the endpoints the reception desks and audiologists poll
+all day: today's visits, the audiologist queue, dashboard stats and
+follow-ups.
+
+clinical.urls routes to them instead of the sync views when
+ASYNC_READ_VIEWS is on, as clinical_be/asgi.py sets it. Querysets, filters,
+permissions, conditional GET and payloads are those of the sync views;
+only the queries go through the async ORM, so a poll waiting on the
+database holds no worker thread.
+"""
+
+from django.utils.decorators import method_decorator
+from rest_framework import status
+from rest_framework.response import Response
+
+from clinical_be.utils.async_views import AsyncAPIViewMixin, AsyncListModelMixin
+
+from .conditional import clinic_conditional_get
+from .dashboard import aget_dashboard_stats
+from .views import AudiologistPatientQueueView, DashboardStatsView, PatientVisitFollowupView, TodayPatientVisitsView
+
+
+@method_decorator(clinic_conditional_get, name='get')
+class AsyncTodayPatientVisitsView(AsyncListModelMixin, TodayPatientVisitsView):
+    ''' List all Patient Visits for Today '''
+
+
+@method_decorator(clinic_conditional_get, name='get')
+class AsyncAudiologistPatientQueueView(AsyncListModelMixin, AudiologistPatientQueueView):
+    ''' List all Patient Visits for Audiologist Queue '''
+
+
+class AsyncPatientVisitFollowupView(AsyncListModelMixin, PatientVisitFollowupView):
+    ''' Patient visits that require follow-up '''
+
+
+@method_decorator(clinic_conditional_get, name='get')
+class AsyncDashboardStatsView(AsyncAPIViewMixin, DashboardStatsView):
+
+    async def get(self, request, *args, **kwargs):
+        # Loaded by the permission check already
+        role = getattr(request.user.role, 'name', None)
+
+        if role in ('Reception', 'Audiologist'):
+            data = await aget_dashboard_stats(request.user, role)
+        else:
+            data = {"error": "Access restricted to Receptionists only."}
+
+        return Response({"status": 200, "data": data}, status=status.HTTP_200_OK)
@@ -0,0 +1,77 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+
+_deferred = threading.local()
+
+
+def summarize_items(items):
+    """
+    Compute the bill summary from already loaded BillItems, so serializers
+    and views don't need extra aggregate queries once items are prefetched.
+    """
+    subtotal = Decimal('0.00')
+    discounts = Decimal('0.00')
+    count = 0
+    for item in items:
+        subtotal += item.cost * item.quantity
+        discounts += item.discount_amount or Decimal('0.00')
+        count += 1
+    return {
+        'items_count': count,
+        'subtotal': subtotal,
+        'discounts': discounts,
+    }
+
+
+def bill_total(bill, summary):
+    """Same formula as Bill.calculate_total(): items + GST - item discounts, never negative."""
+    gst_amount = bill.gst_amount or Decimal('0.00')
+    if not isinstance(gst_amount, Decimal):
+        gst_amount = Decimal(str(gst_amount))
+    return max(Decimal('0.00'), (summary['subtotal'] + gst_amount) - summary['discounts'])
+
+
+def item_gst_value(item):
+    """GST for one line item, read from its linked inventory item or service visit."""
+    quantity = item.quantity or 1
+    if item.item_type in ('Purchase', 'Part Used in Service') and item.inventory_item_id:
+        return (item.inventory_item.gst_value or 0) * quantity
+    if item.item_type == 'Service' and item.service_visit_id:
+        return item.service_visit.gst_charges or 0
+    return 0
+
+
+def _deferred_bill_ids():
+    bill_ids = getattr(_deferred, 'bill_ids', None)
+    if bill_ids is None:
+        bill_ids = _deferred.bill_ids = set()
+    return bill_ids
+
+
+def is_total_deferred(bill_id):
+    """True while a deferred_bill_total() block is open for this bill."""
+    return bill_id in _deferred_bill_ids()
+
+
+@contextmanager
+def deferred_bill_total(bill):
+    """
+    Add/update/delete any number of items on `bill` inside the block without
+    touching its total; the total is recalculated once when the block exits.
+    Nested blocks for the same bill leave the recalculation to the outer one.
+    """
+    bill_ids = _deferred_bill_ids()
+    if bill.pk in bill_ids:
+        yield bill
+        return
+    bill_ids.add(bill.pk)
+    try:
+        with transaction.atomic():
+            yield bill
+            bill_ids.discard(bill.pk)
+            bill.calculate_total()
+    finally:
+        bill_ids.discard(bill.pk)
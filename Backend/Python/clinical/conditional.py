@@ -0,0 +1,139 @@
+"""
+Conditional GET for the screens the frontend polls all day (today's visits,
+the audiologist queue, dashboard stats, pending bills).
+
+Each clinic has a version stamp (a clinical_be.utils.cache stamp) that
+clinical.signals touches once a visit, patient, trial, bill or test write
+commits. A response's ETag hashes that stamp with the user, the URL, the
+negotiated media type and today's date, so a poll that finds nothing changed
+is answered 304 Not Modified before any query or serializer runs:
+
+    @method_decorator(clinic_conditional_get, name='get')
+    class TodayPatientVisitsView(generics.ListAPIView):
+        ...
+
+Writes that bypass signals (queryset.update()) touch the stamp themselves
+where it matters; anything missed still shows within CLINIC_VERSION_TIMEOUT
+seconds, when the stamp expires and starts afresh.
+
+The stamps must live in a cache shared by every process (Redis,
+CACHE_REDIS_URL). With the per-process local-memory cache a write served by
+one worker would leave the others answering 304 with stale data, so there
+the views simply run and answer 200 every time. The same goes for users
+without a clinic: what they see spans clinics, which no single stamp covers.
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from accounts.models import Clinic
+from clinical_be.utils.cache import get_stamp, is_shared, touch_stamp
+
+from .date_utils import day_bounds
+
+
+def _namespace(clinic_id):
+    return f'clinic-data:{clinic_id}'
+
+
+def _timeout():
+    return getattr(settings, 'CLINIC_VERSION_TIMEOUT', 120)
+
+
+def clinic_version(clinic_id):
+    """(token, last modified) of a clinic's data."""
+    return get_stamp(_namespace(clinic_id), _timeout())
+
+
+def touch_clinic_version(clinic_id):
+    """Mark a clinic's data changed once the current transaction commits."""
+    # After commit: a poll in between must not pair the new token with old rows
+    transaction.on_commit(lambda: touch_stamp(_namespace(clinic_id), _timeout()), robust=True)
+
+
+def touch_bill_clinic_version(bill_id):
+    """touch_clinic_version() for the clinic of a bill that was changed with queryset.update()."""
+    from .models import Bill
+
+    def touch():
+        clinic_id = Bill.objects.filter(pk=bill_id).values_list('clinic_id', flat=True).first()
+        touch_stamp(_namespace(clinic_id), _timeout())
+
+    transaction.on_commit(touch, robust=True)
+
+
+def touch_all_clinic_versions():
+    """touch_clinic_version() for every clinic, after a set-based update across clinics."""
+    def touch():
+        for clinic_id in Clinic.objects.values_list('pk', flat=True):
+            touch_stamp(_namespace(clinic_id), _timeout())
+
+    transaction.on_commit(touch, robust=True)
+
+
+def _request_version(request):
+    # Read once per request, the ETag and Last-Modified functions both need it
+    if not hasattr(request, '_clinic_version'):
+        request._clinic_version = clinic_version(getattr(request.user, 'clinic_id', None))
+    return request._clinic_version
+
+
+def clinic_etag(request, *args, **kwargs):
+    token, _ = _request_version(request)
+    user = request.user
+    parts = [
+        token, user.pk, getattr(user, 'role_id', None), timezone.localdate().isoformat(),
+        getattr(request, 'accepted_media_type', ''), request.get_full_path(),
+    ]
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def clinic_last_modified(request, *args, **kwargs):
+    _, modified = _request_version(request)
+    # "Today" lists change at midnight without any write
+    start_of_today, _ = day_bounds(timezone.localdate(), timezone.localdate())
+    return max(modified, start_of_today)
+
+
+def clinic_conditional_get(view_func):
+    """
+    Answer If-None-Match / If-Modified-Since from the clinic version stamp,
+    when the cache is shared and the user has a clinic. For DRF handlers
+    (get), so authentication and permissions have already run; sync or async.
+    """
+    conditional = condition(etag_func=clinic_etag, last_modified_func=clinic_last_modified)(view_func)
+
+    def finish(response):
+        # Per-user payloads: browsers revalidate every time, shared caches keep out
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def unconditional(request):
+        return getattr(request.user, 'clinic_id', None) is None or not is_shared()
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if unconditional(request):
+                return finish(await view_func(request, *args, **kwargs))
+            # Read the stamp off the event loop; the ETag functions then reuse it
+            await sync_to_async(_request_version)(request)
+            return finish(await conditional(request, *args, **kwargs))
+
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if unconditional(request):
+            return finish(view_func(request, *args, **kwargs))
+        return finish(conditional(request, *args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from clinical_be.utils.cache import aget_or_set, bump_version, get_or_set
+
+from .models import Patient, PatientVisit, Trial
+
+
+def _namespace(clinic_id):
+    return f'dashboard-stats:{clinic_id}'
+
+
+def invalidate_dashboard_stats(clinic_id):
+    """Invalidate every cached dashboard of a clinic."""
+    bump_version(_namespace(clinic_id))
+
+
+def invalidate_dashboard_stats_on_commit(clinic_id):
+    """invalidate_dashboard_stats() once the current transaction commits."""
+    # Before commit, a poll would re-cache the old counters under the new version
+    transaction.on_commit(lambda: invalidate_dashboard_stats(clinic_id), robust=True)
+
+
+def reception_queries(clinic, today):
+    """(visit queryset, its counters for aggregate(), patient queryset) of the Reception dashboard."""
+    visits = PatientVisit.objects.filter(clinic=clinic).filter(
+        Q(appointment_date=today) | Q(status__in=['Pending for Service', 'Follow up'])
+    )
+    counters = {
+        'todays_visits': Count('pk', filter=Q(appointment_date=today)),
+        'pending_services': Count('pk', filter=Q(status='Pending for Service')),
+        'followup_visits': Count('pk', filter=Q(status='Follow up')),
+    }
+    return visits, counters, Patient.objects.filter(clinic=clinic)
+
+
+def audiologist_queries(clinic, user):
+    """(visit queryset, its counters for aggregate(), active trial queryset) of the Audiologist dashboard."""
+    visits = PatientVisit.objects.filter(clinic=clinic, seen_by=user)
+    counters = {
+        'pending_tests': Count('pk', distinct=True, filter=Q(status='Test pending')),
+        # one per test performed on a visit whose patient has a case history
+        'completed_tests': Count(
+            'visittestperformed',
+            filter=Q(patient__case_history__isnull=False, visittestperformed__isnull=False),
+        ),
+    }
+    trials = Trial.objects.filter(clinic=clinic, visit__seen_by=user, trial_decision='TRIAL_ACTIVE')
+    return visits, counters, trials
+
+
+def reception_stats(clinic, today):
+    visits, counters, patients = reception_queries(clinic, today)
+    return {"total_patients": patients.count(), **visits.aggregate(**counters)}
+
+
+def audiologist_stats(clinic, user):
+    visits, counters, trials = audiologist_queries(clinic, user)
+    return {**visits.aggregate(**counters), "trials_active": trials.count()}
+
+
+async def areception_stats(clinic, today):
+    visits, counters, patients = reception_queries(clinic, today)
+    return {"total_patients": await patients.acount(), **await visits.aaggregate(**counters)}
+
+
+async def aaudiologist_stats(clinic, user):
+    visits, counters, trials = audiologist_queries(clinic, user)
+    return {**await visits.aaggregate(**counters), "trials_active": await trials.acount()}
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_STATS_CACHE_TIMEOUT', 60)
+
+
+def get_dashboard_stats(user, role):
+    """
+    Dashboard counters for a Reception / Audiologist user, cached per
+    (clinic, role, user) for DASHBOARD_STATS_CACHE_TIMEOUT seconds and
+    invalidated by the signals in clinical.signals.
+    """
+    clinic = getattr(user, 'clinic', None)
+
+    def build():
+        if role == 'Reception':
+            return reception_stats(clinic, timezone.now().date())
+        return audiologist_stats(clinic, user)
+
+    return get_or_set(_namespace(getattr(clinic, 'pk', None)), [role, user.pk], build, timeout=_timeout())
+
+
+async def aget_dashboard_stats(user, role):
+    """get_dashboard_stats() through the async ORM, sharing its cache entries."""
+    # The id: user.clinic may not be loaded, and a lazy load cannot run here
+    clinic_id = getattr(user, 'clinic_id', None)
+
+    async def build():
+        if role == 'Reception':
+            return await areception_stats(clinic_id, timezone.now().date())
+        return await aaudiologist_stats(clinic_id, user)
+
+    return await aget_or_set(_namespace(clinic_id), [role, user.pk], build, timeout=_timeout())
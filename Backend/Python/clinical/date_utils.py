@@ -0,0 +1,16 @@
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+
+
+def day_bounds(start_date, end_date):
+    """
+    Return aware datetimes [start of start_date, start of the day after end_date).
+
+    Filtering with created_at__gte / created_at__lt on these bounds gives the
+    same rows as created_at__date__gte / __lte, but lets the database use the
+    index on the timestamp column instead of casting every row to a date.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
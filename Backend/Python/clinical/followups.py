@@ -0,0 +1,67 @@
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .conditional import touch_all_clinic_versions
+from .models import PatientVisit, Trial
+
+
+def update_followup_statuses(today=None):
+    """
+    Move visits into "Follow up" for trials that end today (visit still
+    "Trial Active") and for trials whose follow-up date is today (visit in
+    "Decision Pending").
+
+    Runs as a handful of set-based UPDATE statements in one transaction and
+    returns a summary that the Celery task records as its result:
+
+        {
+            "date": "2025-01-31",
+            "transitions": {
+                "trial_ended": {"trials": 3, "visits": 3},
+                "followup_due": {"visits": 2},
+            },
+            "total_visits": 5,
+            "duration_ms": 4.2,
+        }
+    """
+    started = time.perf_counter()
+    today = today or timezone.now().date()
+    now = timezone.now()
+
+    with transaction.atomic():
+        # 1. Trials that END today: Trial Active -> Follow up.
+        #    The trials are updated first, while their visits still match the filter.
+        ended_trials = Trial.objects.filter(
+            trial_end_date=today,
+            visit__status='Trial Active',
+        ).update(trial_decision='Follow up')
+        ended_visits = PatientVisit.objects.filter(
+            status='Trial Active',
+            trial__trial_end_date=today,
+        ).update(
+            status='Follow up',
+            status_note='Trial ended, Follow up needed',
+            updated_at=now,
+        )
+
+        # 2. Follow-up due today: Decision Pending -> Follow up
+        followup_visits = PatientVisit.objects.filter(
+            status='Decision Pending',
+            trial__followup_date=today,
+        ).update(status='Follow up', updated_at=now)
+
+        # The UPDATEs send no signals; polled lists of every clinic may have changed
+        if ended_trials or ended_visits or followup_visits:
+            touch_all_clinic_versions()
+
+    return {
+        'date': today.isoformat(),
+        'transitions': {
+            'trial_ended': {'trials': ended_trials, 'visits': ended_visits},
+            'followup_due': {'visits': followup_visits},
+        },
+        'total_visits': ended_visits + followup_visits,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,215 @@
+"""
+Bulk inventory transfer between clinics.
+
+transfer_inventory() moves any number of products in a constant number of
+statements, inside one transaction:
+
+  * the destination clinic row is locked, so two transfers into the same
+    clinic cannot both create the same destination item;
+  * all source items are locked with one SELECT ... FOR UPDATE ordered by
+    id, so concurrent transfers out of the same stock queue up instead of
+    overselling it (and cannot deadlock on each other);
+  * missing destination items are created with one bulk_create;
+  * serials move with one UPDATE, quantities with one bulk_update (sources,
+    locked) and one F() UPDATE (destinations).
+
+Any validation failure raises TransferError and rolls everything back.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+
+from accounts.models import Clinic
+
+from .models import InventoryItem, InventorySerial, InventoryTransfer
+from .serial_counts import move_serials
+
+
+class TransferError(Exception):
+    """A transfer request that cannot be carried out; nothing was changed."""
+
+
+def _requested_lines(products):
+    """[(source_id, quantity, serial_numbers)] with repeated products merged."""
+    lines = {}
+    for product in products:
+        source_id = product.get('source_inventory_id')
+        if not source_id:
+            continue
+        try:
+            # Ids may arrive as strings ("5"); the locked sources are keyed by int
+            source_id = int(source_id)
+        except (TypeError, ValueError):
+            raise TransferError(f"Invalid source item id {source_id!r}.")
+        try:
+            quantity = int(product.get('quantity') or 0)
+        except (TypeError, ValueError):
+            raise TransferError(f"Invalid quantity for item {source_id}.")
+        serial_numbers = product.get('serial_numbers') or []
+        previous_quantity, previous_serials = lines.get(source_id, (0, []))
+        lines[source_id] = (previous_quantity + quantity, previous_serials + list(serial_numbers))
+    return [(source_id, quantity, serials) for source_id, (quantity, serials) in lines.items()]
+
+
+def _destination_items(sources, to_clinic):
+    """{source id: existing destination item}, matched by SKU (or by name/brand/model for legacy items)."""
+    skus = {item.sku for item in sources if item.sku}
+    legacy = [item for item in sources if not item.sku]
+
+    by_sku = {}
+    if skus:
+        for item in InventoryItem.objects.filter(clinic=to_clinic, sku__in=skus).order_by('id'):
+            by_sku.setdefault(item.sku, item)
+
+    by_fields = {}
+    if legacy:
+        match = Q()
+        for item in legacy:
+            match |= Q(
+                brand_id=item.brand_id, model_type_id=item.model_type_id,
+                product_name=item.product_name, category=item.category,
+            )
+        for item in InventoryItem.objects.filter(match, clinic=to_clinic).order_by('id'):
+            key = (item.brand_id, item.model_type_id, item.product_name, item.category)
+            by_fields.setdefault(key, item)
+
+    found = {}
+    for item in sources:
+        if item.sku:
+            dest = by_sku.get(item.sku)
+        else:
+            dest = by_fields.get((item.brand_id, item.model_type_id, item.product_name, item.category))
+        if dest is not None:
+            found[item.id] = dest
+    return found
+
+
+def transfer_inventory(to_clinic, products, user, notes=''):
+    """
+    Transfer ``products`` ([{source_inventory_id, quantity | serial_numbers}])
+    to ``to_clinic``. Returns the InventoryTransfer log rows.
+    """
+    lines = _requested_lines(products)
+    if not lines:
+        raise TransferError("No valid source items provided.")
+
+    with transaction.atomic():
+        Clinic.objects.select_for_update().get(pk=to_clinic.pk)
+
+        sources = {
+            item.id: item
+            for item in InventoryItem.objects.select_for_update(of=('self',)).select_related(
+                'brand', 'model_type', 'clinic',
+            ).filter(id__in=[source_id for source_id, _, _ in lines]).order_by('id')
+        }
+        if len(sources) != len(lines):
+            raise TransferError("One or more source items not found.")
+
+        # Validate every line before writing anything
+        requested_serials = {}
+        for source_id, quantity, serial_numbers in lines:
+            source = sources[source_id]
+            if source.clinic_id == to_clinic.id:
+                raise TransferError(f"Item '{source.product_name}' is already in the destination clinic.")
+            if source.stock_type == 'Serialized':
+                if not serial_numbers:
+                    raise TransferError(f"Serial numbers required for {source.product_name}")
+                if len(set(serial_numbers)) != len(serial_numbers):
+                    raise TransferError(f"Invalid or unavailable serials for {source.product_name}")
+                requested_serials[source_id] = set(serial_numbers)
+            else:
+                if quantity <= 0:
+                    raise TransferError(f"Quantity must be > 0 for {source.product_name}")
+                if source.quantity_in_stock < quantity:
+                    raise TransferError(
+                        f"Insufficient stock for {source.product_name}. Available: {source.quantity_in_stock}"
+                    )
+
+        serials = list(InventorySerial.objects.select_for_update().filter(
+            inventory_item_id__in=list(requested_serials),
+            serial_number__in=[number for numbers in requested_serials.values() for number in numbers],
+            status='In Stock',
+        ).order_by('id'))
+        found_serials = {}
+        for serial in serials:
+            found_serials.setdefault(serial.inventory_item_id, set()).add(serial.serial_number)
+        for source_id, numbers in requested_serials.items():
+            if found_serials.get(source_id, set()) != numbers:
+                raise TransferError(f"Invalid or unavailable serials for {sources[source_id].product_name}")
+
+        # Destination items: reuse, link to the master item, or create in bulk
+        destinations = _destination_items(sources.values(), to_clinic)
+        relinked = []
+        for source_id, dest in destinations.items():
+            source = sources[source_id]
+            if not dest.master_item_id:
+                dest.master_item_id = source.master_item_id or source.id
+                relinked.append(dest)
+        InventoryItem.objects.bulk_update(relinked, ['master_item'])
+
+        # Sources sharing a SKU (copies from different clinics) share one new item
+        to_create = {}
+        for source in sources.values():
+            if source.id not in destinations:
+                to_create.setdefault(source.sku or source.id, []).append(source)
+        created = InventoryItem.objects.bulk_create([
+            InventoryItem(
+                clinic=to_clinic,
+                product_name=source.product_name,
+                brand=source.brand,
+                model_type=source.model_type,
+                category=source.category,
+                stock_type=source.stock_type,
+                sku=source.sku or InventoryItem.new_sku(),
+                master_item_id=source.master_item_id or source.id,
+                description=source.description,
+                reorder_level=source.reorder_level,
+                unit_price=source.unit_price,
+                use_in_trial=source.use_in_trial,
+                quantity_in_stock=0,
+            )
+            for source, *_ in to_create.values()
+        ])
+        for group, dest in zip(to_create.values(), created):
+            destinations.update({source.id: dest for source in group})
+
+        # Apply the moves
+        moved = Counter()
+        move_serials(serials, {source_id: destinations[source_id].id for source_id in requested_serials})
+        for source_id, numbers in requested_serials.items():
+            moved[source_id] = len(numbers)
+        for source_id, quantity, _ in lines:
+            if source_id not in requested_serials:
+                moved[source_id] = quantity
+
+        for source_id, quantity in moved.items():
+            sources[source_id].quantity_in_stock = max(sources[source_id].quantity_in_stock - quantity, 0)
+        InventoryItem.objects.bulk_update([sources[source_id] for source_id in moved], ['quantity_in_stock'])
+
+        received = Counter()
+        for source_id, quantity in moved.items():
+            received[destinations[source_id].id] += quantity
+        InventoryItem.objects.filter(id__in=list(received)).update(
+            quantity_in_stock=F('quantity_in_stock') + Case(
+                *[When(id=dest_id, then=Value(quantity)) for dest_id, quantity in received.items()],
+                default=Value(0),
+            ),
+        )
+
+        return InventoryTransfer.objects.bulk_create([
+            InventoryTransfer(
+                item_name=sources[source_id].product_name,
+                category=sources[source_id].category,
+                brand=sources[source_id].brand.name if sources[source_id].brand else '',
+                model=sources[source_id].model_type.name if sources[source_id].model_type else '',
+                from_clinic=sources[source_id].clinic,
+                to_clinic=to_clinic,
+                quantity=moved[source_id],
+                serial_numbers=serial_numbers if source_id in requested_serials else [],
+                transferred_by=user,
+                notes=notes,
+            )
+            for source_id, _, serial_numbers in lines
+        ])
@@ -0,0 +1,237 @@
+"""
+Django management command to load test the polled read endpoints served by
+one WSGI worker (sync views) and by one ASGI worker (async views).
+
+Usage:
+    # 8 / 32 / 128 concurrent clients, 10 seconds each
+        python manage.py benchmark_asgi
+
+    # More clients, a stricter latency target, a bigger thread pool / DB pool
+        python manage.py benchmark_asgi --concurrency 64 256 512 --slo-ms 500 --threads 16 --pool-size 20
+
+Two servers are started in turn on a free local port, as they would be
+deployed (needs gunicorn and uvicorn):
+
+    wsgi  gunicorn clinical_be.wsgi, 1 gthread worker with --threads threads,
+          persistent DB connections (DB_CONN_MAX_AGE)
+    asgi  uvicorn clinical_be.asgi, 1 worker, the async views
+          (ASYNC_READ_VIEWS) and a DB pool of --pool-size
+
+Each client opens a new connection per request, like desks polling from
+their own browsers, and cycles through today's visits, dashboard stats and
+follow-ups (as a Reception user) and the audiologist queue (as an
+Audiologist) of the busiest clinic. Both users are created for the run and
+deleted afterwards. A request that fails, is not 200 or takes over
+--timeout seconds is an error.
+
+The capacity of a worker is the highest concurrency it served with no
+errors and p99 latency under --slo-ms. The client shares the machine with
+the server, so absolute numbers are on the low side; compare the two rows.
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Clinic, Role, User
+from clinical.models import PatientVisit
+
+from .benchmark_db_connections import ConnectionSampler, percentile
+
+API_PREFIX = '/api/clinical/'
+ENDPOINTS = [
+    ('Reception', 'patient/visits/today/?pageSize=20'),
+    ('Reception', 'dashboard/stats/'),
+    ('Audiologist', 'audiologits/queue/?pageSize=20'),
+    ('Reception', 'patient-visits/followup?pageSize=20'),
+]
+STARTUP_TIMEOUT = 60
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def fetch(port, path, token, timeout):
+    """Status code of a GET on a new connection."""
+    async def request():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n'
+                f'Connection: close\r\n\r\n'.encode()
+            )
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        return int(response.split(b' ', 2)[1]) if response else 0
+
+    return await asyncio.wait_for(request(), timeout)
+
+
+class Command(BaseCommand):
+    help = 'Load test the polled read endpoints under one WSGI worker (sync views) and one ASGI worker (async views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128],
+                            help='Concurrent clients per round (default: 8 32 128)')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per round (default: 10)')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the WSGI worker (default: 8)')
+        parser.add_argument('--pool-size', type=int, default=10, help='DB pool of the ASGI worker (default: 10)')
+        parser.add_argument('--slo-ms', type=float, default=1000, help='p99 latency target (default: 1000)')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds before a request is an error')
+        parser.add_argument('--clinic-id', type=int, help='Clinic to read (default: the one with most visits)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('benchmark_asgi needs PostgreSQL.')
+        # (name, server arguments for a port, environment)
+        deployments = [
+            ('wsgi', lambda port: [
+                '-m', 'gunicorn', 'clinical_be.wsgi:application', '--workers', '1', '--worker-class', 'gthread',
+                '--threads', str(options['threads']), '--log-level', 'warning', '--bind', f'127.0.0.1:{port}',
+            ], {'ASYNC_READ_VIEWS': '0', 'DB_POOL_MAX_SIZE': '0'}),
+            ('asgi', lambda port: [
+                '-m', 'uvicorn', 'clinical_be.asgi:application', '--workers', '1', '--no-access-log',
+                '--log-level', 'warning', '--port', str(port),
+            ], {'ASYNC_READ_VIEWS': '1', 'DB_POOL_MAX_SIZE': str(options['pool_size'])}),
+        ]
+
+        users = self.create_users(self.get_clinic(options['clinic_id']))
+        try:
+            tokens = {role: str(AccessToken.for_user(user)) for role, user in users.items()}
+            results = {name: self.run_deployment(name, args, env, tokens, options) for name, args, env in deployments}
+        finally:
+            for user in users.values():
+                user.delete()
+
+        self.stdout.write(
+            f"\n{'server':7} {'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'peak conns':>10}"
+        )
+        for name, rounds in results.items():
+            for concurrency, row in rounds:
+                self.stdout.write(
+                    f"{name:7} {concurrency:7} {row['throughput']:7.0f} {row['p50']:8.1f} {row['p99']:8.1f} "
+                    f"{row['errors']:7} {row['peak']:10}"
+                )
+        self.stdout.write('')
+        for name, rounds in results.items():
+            served = [c for c, row in rounds if not row['errors'] and row['p99'] <= options['slo_ms']]
+            capacity = max(served) if served else 0
+            self.stdout.write(
+                f"{name}: {capacity} concurrent clients per worker within p99 {options['slo_ms']:.0f} ms"
+            )
+
+    def get_clinic(self, clinic_id):
+        if clinic_id:
+            clinic = Clinic.objects.filter(pk=clinic_id).first()
+        else:
+            busiest = PatientVisit.objects.values('clinic_id').annotate(visits=Count('pk')).order_by('-visits').first()
+            clinic = Clinic.objects.filter(pk=busiest['clinic_id']).first() if busiest else None
+        if clinic is None:
+            raise CommandError('No clinic to benchmark; seed one with benchmark_list_queries first.')
+        return clinic
+
+    def create_users(self, clinic):
+        # Committed, the servers authenticate as these users
+        users = {}
+        for role_name in ('Reception', 'Audiologist'):
+            email = f'asgi-benchmark-{role_name.lower()}@example.com'
+            User.objects.filter(email=email).delete()
+            role, _ = Role.objects.get_or_create(name=role_name)
+            users[role_name] = User.objects.create(
+                email=email, name=f'ASGI benchmark {role_name}', clinic=clinic, role=role, is_approved=True,
+            )
+        return users
+
+    def run_deployment(self, name, args, env, tokens, options):
+        """[(concurrency, stats)] of one server."""
+        port = free_port()
+        with tempfile.TemporaryFile() as log:
+            server = subprocess.Popen(
+                [sys.executable, *args(port)], cwd=settings.BASE_DIR, env={**os.environ, **env},
+                stdout=log, stderr=log,
+            )
+            try:
+                self.wait_ready(server, port, tokens, log)
+                rounds = []
+                for concurrency in options['concurrency']:
+                    sampler = ConnectionSampler(exclude_pid=self.backend_pid())
+                    sampler.start()
+                    try:
+                        row = asyncio.run(self.load(port, tokens, concurrency, options))
+                    finally:
+                        sampler.stop()
+                    row['peak'] = sampler.peak
+                    rounds.append((concurrency, row))
+                    self.stdout.write(f'{name}, {concurrency} clients: {row["throughput"]:.0f} req/s')
+                return rounds
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    def wait_ready(self, server, port, tokens, log):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'Server exited:\n{log.read().decode(errors="replace")}')
+            try:
+                # Warms every endpoint too
+                statuses = [asyncio.run(fetch(port, API_PREFIX + url, tokens[role], 30)) for role, url in ENDPOINTS]
+            except OSError:
+                time.sleep(0.5)
+                continue
+            if any(status != 200 for status in statuses):
+                raise CommandError(f'Warm-up requests answered {statuses}')
+            return
+        raise CommandError(f'Server did not start within {STARTUP_TIMEOUT} seconds')
+
+    def backend_pid(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    async def load(self, port, tokens, concurrency, options):
+        timings, errors = [], 0
+        deadline = time.monotonic() + options['duration']
+
+        async def client(offset):
+            nonlocal errors
+            index = offset
+            while time.monotonic() < deadline:
+                role, url = ENDPOINTS[index % len(ENDPOINTS)]
+                index += 1
+                started = time.perf_counter()
+                try:
+                    ok = await fetch(port, API_PREFIX + url, tokens[role], options['timeout']) == 200
+                except (OSError, asyncio.TimeoutError):
+                    ok = False
+                if ok:
+                    timings.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+        seconds = time.monotonic() - started
+        return {
+            'throughput': len(timings) / seconds,
+            'p50': statistics.median(timings) if timings else float('nan'),
+            'p99': percentile(timings, 99) if timings else float('nan'),
+            'errors': errors,
+        }
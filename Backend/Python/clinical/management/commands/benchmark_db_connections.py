@@ -0,0 +1,239 @@
+"""
+Django management command to compare per-request, persistent and pooled
+PostgreSQL connections under concurrent load.
+
+Usage:
+    # Reconnect per request, persistent (60 s), pools of 2 / 4 / 8
+        python manage.py benchmark_db_connections
+
+    # Other configurations and load
+        python manage.py benchmark_db_connections --configs 0 300 pool:4 pool:16 \\
+            --concurrency 32 --requests 2000
+
+Each configuration runs in a child process started with the matching
+DB_CONN_MAX_AGE / DB_POOL_MAX_SIZE environment (see settings.py), the way a
+server process would be. The child keeps --concurrency threads busy calling
+the WSGI application directly, as the threads of a gthread worker would, so
+Django opens and releases connections exactly as it does behind a real
+server (request_started / request_finished); only the socket layer is
+skipped. Requests go round robin to a few list endpoints as a Reception user
+of the busiest clinic, created for the run and deleted afterwards.
+
+While a child runs, this process samples pg_stat_activity for the peak
+number of open connections to the database, and reads how many sessions
+were opened from pg_stat_database (PostgreSQL 14+). Other clients of the same
+database show up in the peak, so run it against a quiet one.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Clinic, Role, User
+from clinical.models import PatientVisit
+
+API_PREFIX = '/api/clinical/'
+ENDPOINTS = [
+    ('doctor flat list', 'doctor/flat-list/'),
+    ('visit list (20)', 'patient/visit/?pageSize=20'),
+    ('pending bills (20)', 'bill/pending/?pageSize=20'),
+    ('today visits', 'patient/visits/today/'),
+]
+BENCHMARK_EMAIL = 'connection-benchmark@example.com'
+SAMPLE_INTERVAL = 0.02
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1] if len(values) > 1 else values[0]
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 latency and connection counts of persistent vs pooled DB connections under load'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--configs', nargs='+', default=['0', '60', 'pool:2', 'pool:4', 'pool:8'],
+            help='CONN_MAX_AGE seconds, or pool:<max size> (default: 0 60 pool:2 pool:4 pool:8)',
+        )
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent requests (default: 16)')
+        parser.add_argument('--requests', type=int, default=800, help='Requests per configuration (default: 800)')
+        parser.add_argument('--clinic-id', type=int, help='Clinic to read (default: the one with most visits)')
+        # Internal: run the load in this process and print the timings as JSON
+        parser.add_argument('--child-token', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['child_token']:
+            self.run_load(options['child_token'], options['concurrency'], options['requests'])
+            return
+        if connection.vendor != 'postgresql':
+            raise CommandError('benchmark_db_connections needs PostgreSQL.')
+        configs = [self.parse_config(config) for config in options['configs']]
+
+        user = self.create_user(self.get_clinic(options['clinic_id']))
+        try:
+            token = str(AccessToken.for_user(user))
+            self.stdout.write(
+                f'{options["requests"]} requests per configuration, {options["concurrency"]} at a time, '
+                f'clinic id {user.clinic_id}'
+            )
+            rows = [(label, *self.run_child(env, token, options)) for label, env in configs]
+        finally:
+            user.delete()
+
+        self.stdout.write(
+            f"\n{'configuration':18} {'endpoint':20} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'req/s':>7} {'peak conns':>10} {'opened':>7}"
+        )
+        for label, result, peak, opened in rows:
+            if result['errors']:
+                self.stderr.write(f'{label}: {result["errors"]} failed requests')
+            timings = result['timings']
+            everything = [ms for values in timings.values() for ms in values]
+            throughput = len(everything) / result['seconds']
+            for name, values in [*timings.items(), ('all', everything)]:
+                summary = name == 'all'
+                self.stdout.write(
+                    f'{label if summary else "":18} {name:20} {statistics.median(values):8.1f} '
+                    f'{percentile(values, 99):8.1f} '
+                    + (f'{throughput:7.0f} {peak:10} {opened:7}' if summary else '')
+                )
+
+    def parse_config(self, config):
+        if config.startswith('pool:'):
+            size = int(config.split(':', 1)[1])
+            return f'pool {size}', {'DB_POOL_MAX_SIZE': str(size)}
+        max_age = int(config)
+        label = 'per request' if max_age == 0 else f'persistent {max_age}s'
+        return label, {'DB_CONN_MAX_AGE': str(max_age), 'DB_POOL_MAX_SIZE': '0'}
+
+    def get_clinic(self, clinic_id):
+        if clinic_id:
+            clinic = Clinic.objects.filter(pk=clinic_id).first()
+        else:
+            busiest = PatientVisit.objects.values('clinic_id').annotate(visits=Count('pk')).order_by('-visits').first()
+            clinic = Clinic.objects.filter(pk=busiest['clinic_id']).first() if busiest else None
+        if clinic is None:
+            raise CommandError('No clinic to benchmark; seed one with benchmark_list_queries first.')
+        return clinic
+
+    def create_user(self, clinic):
+        # Committed, the child processes authenticate as this user
+        User.objects.filter(email=BENCHMARK_EMAIL).delete()
+        role, _ = Role.objects.get_or_create(name='Reception')
+        return User.objects.create(
+            email=BENCHMARK_EMAIL, name='Connection benchmark', clinic=clinic, role=role, is_approved=True,
+        )
+
+    def run_child(self, env, token, options):
+        """Run one configuration; (timings, peak open connections, sessions opened)."""
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_db_connections',
+            '--child-token', token, '--concurrency', str(options['concurrency']),
+            '--requests', str(options['requests']),
+        ]
+        sessions_before = self.sessions_opened()
+        sampler = ConnectionSampler(exclude_pid=self.backend_pid())
+        sampler.start()
+        try:
+            child = subprocess.run(
+                command, env={**os.environ, **env}, capture_output=True, text=True, check=False,
+            )
+        finally:
+            sampler.stop()
+        if child.returncode != 0:
+            raise CommandError(f'Benchmark child failed:\n{child.stderr}')
+        # -1: this process's own session count does not change, the sampler's does
+        opened = self.sessions_opened() - sessions_before - 1
+        return json.loads(child.stdout.strip().splitlines()[-1]), sampler.peak, opened
+
+    def backend_pid(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def sessions_opened(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT sessions FROM pg_stat_database WHERE datname = current_database()')
+            return cursor.fetchone()[0]
+
+    def run_load(self, token, concurrency, total):
+        from django.core.wsgi import get_wsgi_application
+
+        application = get_wsgi_application()
+
+        def request(index):
+            name, url = ENDPOINTS[index % len(ENDPOINTS)]
+            path, _, query = (API_PREFIX + url).partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'HTTP_AUTHORIZATION': f'Bearer {token}', 'wsgi.input': BytesIO(),
+            }
+            setup_testing_defaults(environ)
+            statuses = []
+            started = time.perf_counter()
+            body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()  # request_finished: Django closes or releases the connection
+            return name, (time.perf_counter() - started) * 1000, statuses[0].startswith('200')
+
+        # One request per endpoint first, so imports and caches are warm
+        for index in range(len(ENDPOINTS)):
+            request(index)
+        connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(request, range(total)))
+        seconds = time.perf_counter() - started
+
+        timings = {name: [] for name, _ in ENDPOINTS}
+        for name, ms, _ in results:
+            timings[name].append(ms)
+        errors = sum(1 for *_, ok in results if not ok)
+        self.stdout.write(json.dumps({'timings': timings, 'seconds': seconds, 'errors': errors}))
+
+
+class ConnectionSampler(threading.Thread):
+    """Polls pg_stat_activity for the peak number of other client connections to the database."""
+
+    def __init__(self, exclude_pid):
+        super().__init__(daemon=True)
+        self.exclude_pid = exclude_pid
+        self.peak = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            with connections['default'].cursor() as cursor:
+                while not self._stopped.is_set():
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() "
+                        "AND backend_type = 'client backend' AND pid <> pg_backend_pid() "
+                        "AND pid <> %s",
+                        [self.exclude_pid],
+                    )
+                    self.peak = max(self.peak, cursor.fetchone()[0])
+                    self._stopped.wait(SAMPLE_INTERVAL)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
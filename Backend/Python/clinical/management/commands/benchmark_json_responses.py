@@ -0,0 +1,144 @@
+"""
+Django management command to compare JSON encoding and compression of the
+largest API responses.
+
+Usage:
+    # Benchmark clinics seeded by benchmark_list_queries (the busiest one)
+        python manage.py benchmark_json_responses
+
+    # A given clinic, more timing runs
+        python manage.py benchmark_json_responses --clinic-id 3 --runs 20
+
+Each endpoint is requested once as a Reception / Admin user of the clinic
+(created inside a transaction that is rolled back). The payload is then
+encoded with the stdlib encoder it used before (DRF's JSONRenderer, or
+json.dumps with DjangoJSONEncoder for JsonResponse views) and with the
+orjson one now in place (clinical_be.utils.renderers), and the body is
+compressed as CompressionMiddleware would. JsonResponse payloads are read
+back from the response body, so their Decimals and dates are already
+strings and the speed-up shown for them is on the low side.
+"""
+
+import json
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import Clinic, Role, User
+from clinical.models import PatientVisit
+from clinical_be.utils.compression import BROTLI_QUALITY, brotli
+from clinical_be.utils.renderers import fast_django_json_dumps, fast_json_dumps
+
+API_PREFIX = '/api/clinical/'
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare stdlib vs orjson encoding time and raw / gzip / brotli size of the largest API responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic-id', type=int, help='Clinic to read (default: the one with most visits)')
+        parser.add_argument('--runs', type=int, default=10, help='Timing runs per encoder (median is reported)')
+
+    def handle(self, *args, **options):
+        clinic = self.get_clinic(options['clinic_id'])
+        self.stdout.write(f'Clinic: {clinic.name} (id {clinic.pk})')
+        rows = []
+        try:
+            with transaction.atomic():
+                clients = self.clients(clinic)
+                for label, role, url in self.endpoints(clinic):
+                    response = clients[role].get(API_PREFIX + url)
+                    if response.status_code != 200:
+                        self.stderr.write(f'{label}: HTTP {response.status_code}, skipped')
+                        continue
+                    rows.append((label, *self.measure(response, options['runs'])))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write(
+            f"{'endpoint':28} {'stdlib ms':>10} {'orjson ms':>10} {'speed-up':>9} "
+            f"{'raw KB':>9} {'gzip KB':>9} {'br KB':>9}"
+        )
+        for label, stdlib_ms, fast_ms, raw, gzipped, brotlied in rows:
+            self.stdout.write(
+                f'{label:28} {stdlib_ms:10.2f} {fast_ms:10.2f} {stdlib_ms / fast_ms:8.1f}x '
+                f'{raw / 1024:9.1f} {gzipped / 1024:9.1f} {brotlied / 1024 if brotlied else float("nan"):9.1f}'
+            )
+
+    def get_clinic(self, clinic_id):
+        if clinic_id:
+            clinic = Clinic.objects.filter(pk=clinic_id).first()
+        else:
+            busiest = PatientVisit.objects.values('clinic_id').annotate(visits=Count('pk')).order_by('-visits').first()
+            clinic = Clinic.objects.filter(pk=busiest['clinic_id']).first() if busiest else None
+        if clinic is None:
+            raise CommandError('No clinic to benchmark; seed one with benchmark_list_queries first.')
+        return clinic
+
+    def clients(self, clinic):
+        clients = {}
+        for role_name in ('Reception', 'Admin'):
+            role, _ = Role.objects.get_or_create(name=role_name)
+            user = User.objects.create(
+                email=f'json-benchmark-{role_name.lower()}@example.com', name=f'JSON benchmark {role_name}',
+                clinic=clinic, role=role, is_approved=True,
+            )
+            clients[role_name] = APIClient()
+            clients[role_name].force_authenticate(user)
+        return clients
+
+    def endpoints(self, clinic):
+        today = timezone.localdate()
+        visits = PatientVisit.objects.filter(clinic=clinic).order_by('-created_at')
+        # The richest details payload: a visit with a trial, else the latest one
+        visit = visits.filter(trial__isnull=False).first() or visits.first()
+        month = f'start_date={today - timedelta(days=30):%Y-%m-%d}&end_date={today:%Y-%m-%d}&clinic_id={clinic.pk}'
+        endpoints = [
+            ('visit list (100)', 'Reception', 'patient/visit/?pageSize=100'),
+            ('patient flat list', 'Reception', 'patient/flat-list/'),
+            ('trials (100)', 'Reception', 'trials/?pageSize=100'),
+            ('inventory dropdowns', 'Reception', 'inventory/dropdowns/?category=Hearing Aid'),
+            ('clinic report (30 days)', 'Admin', f'admin/clinic-report/?{month}'),
+            ('revenue report (30 days)', 'Admin', f'admin/revenue-reports/?type=clinic&{month}'),
+        ]
+        if visit is not None:
+            endpoints.insert(0, ('visit full details', 'Reception', f'patient/visit/{visit.pk}/full/'))
+        return endpoints
+
+    def measure(self, response, runs):
+        if hasattr(response, 'data'):  # DRF Response
+            payload = response.data
+            stdlib, fast = JSONRenderer().render, fast_json_dumps
+        else:  # JsonResponse
+            payload = json.loads(response.content)
+            stdlib, fast = (lambda data: json.dumps(data, cls=DjangoJSONEncoder).encode()), fast_django_json_dumps
+        body = fast(payload)
+        return (
+            self.median_ms(stdlib, payload, runs),
+            self.median_ms(fast, payload, runs),
+            len(body),
+            len(compress_string(body)),
+            len(brotli.compress(body, quality=BROTLI_QUALITY)) if brotli else 0,
+        )
+
+    def median_ms(self, encode, payload, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            encode(payload)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
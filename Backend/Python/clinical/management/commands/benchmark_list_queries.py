@@ -0,0 +1,286 @@
+"""
+Django management command to benchmark the list / report queries against a
+large seeded data set, with and without the list-query indexes.
+
+Usage:
+    # Seed 1M visits into benchmark clinics and report plans + latency
+        python manage.py benchmark_list_queries
+
+    # Smaller data set, more timing runs
+        python manage.py benchmark_list_queries --visits 200000 --runs 10
+
+    # 1M patients for the patient search queries
+        python manage.py benchmark_list_queries --patients 1000000
+
+    # Re-use previously seeded data
+        python manage.py benchmark_list_queries --skip-seed
+
+    # Remove the benchmark clinics and everything seeded under them
+        python manage.py benchmark_list_queries --cleanup
+
+For every query the command prints the EXPLAIN ANALYZE plan summary, whether
+it contains a sequential scan, and the median latency, first with the
+indexes and then with them dropped inside a transaction that is rolled back
+("before" numbers). Requires PostgreSQL.
+"""
+
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import Clinic, User
+from clinical.date_utils import day_bounds
+from clinical.models import Bill, InventoryItem, InventorySerial, Patient, PatientVisit, Trial
+from clinical.patient_search import TRIGRAM_INDEX_NAMES, digits_only, patient_search_q, search_patients
+from clinical.serial_counts import create_serials
+
+BENCHMARK_CLINIC_PREFIX = 'Benchmark Clinic'
+
+VISIT_STATUSES = [
+    'Test pending', 'Pending', 'Test Performed', 'Trial Active', 'Decision Pending',
+    'Follow up', 'Pending for Service', 'Service Completed', 'Book - Device Allocated',
+]
+
+DEEP_PAGE_OFFSET = 4990  # page 500 of 10
+
+QUEUE_STATUSES = ['Test pending', 'Pending', 'Test and Trial Pending', 'Followup Pending', 'Test Pending']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Seed a large data set and report EXPLAIN plans / latency of list queries with and without indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visits', type=int, default=1_000_000, help='Number of visits to seed (default 1,000,000)')
+        parser.add_argument('--clinics', type=int, default=10, help='Number of benchmark clinics')
+        parser.add_argument('--patients', type=int, help='Number of patients to seed (default a quarter of --visits)')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='bulk_create batch size')
+        parser.add_argument('--runs', type=int, default=5, help='Timed executions per query')
+        parser.add_argument('--skip-seed', action='store_true', help='Use already seeded benchmark data')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the benchmark clinics and their data, then exit')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('benchmark_list_queries needs PostgreSQL (EXPLAIN ANALYZE and transactional DROP INDEX).')
+
+        if options['cleanup']:
+            self.cleanup()
+            return
+
+        if not options['skip_seed']:
+            self.seed(options['visits'], options['clinics'], options['batch_size'], options['patients'])
+
+        clinics = list(Clinic.objects.filter(name__startswith=BENCHMARK_CLINIC_PREFIX))
+        if not clinics:
+            raise CommandError('No benchmark data found, run without --skip-seed first.')
+
+        queries = self.build_queries(clinics[0])
+        after = {name: self.measure(qs, options['runs']) for name, qs in queries}
+        before = self.measure_without_indexes(queries, options['runs'])
+
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<34} {'before ms':>10} {'after ms':>10}  before plan -> after plan")
+        for name, _ in queries:
+            b, a = before[name], after[name]
+            self.stdout.write(
+                f"{name:<34} {b['median_ms']:>10.2f} {a['median_ms']:>10.2f}  {b['plan']} -> {a['plan']}"
+            )
+            if a['seq_scan']:
+                self.stdout.write(self.style.WARNING(f'  {name} still uses a sequential scan'))
+
+    # ------------------------------------------------------------------ seeding
+
+    def seed(self, visit_count, clinic_count, batch_size, patient_count=None):
+        rng = random.Random(42)
+        self.stdout.write(f'Seeding {visit_count} visits across {clinic_count} clinics...')
+        started = time.perf_counter()
+
+        clinics = Clinic.objects.bulk_create([
+            Clinic(name=f'{BENCHMARK_CLINIC_PREFIX} {i}', address='Benchmark', phone='0') for i in range(clinic_count)
+        ])
+        staff = []
+        for clinic in clinics:
+            for j in range(5):
+                staff.append(User(
+                    email=f'bench-{clinic.id}-{j}@example.com', name=f'Bench Staff {clinic.id}-{j}',
+                    clinic=clinic, is_approved=True, is_active=True,
+                ))
+        staff = User.objects.bulk_create(staff)
+        staff_by_clinic = {}
+        for user in staff:
+            staff_by_clinic.setdefault(user.clinic_id, []).append(user)
+
+        patient_count = patient_count or max(1, visit_count // 4)
+        patients = []
+        for start in range(0, patient_count, batch_size):
+            batch = [
+                Patient(
+                    clinic=clinics[i % clinic_count], name=f'Bench Patient {i}', gender='Male',
+                    phone_primary=f'9{i:09d}', phone_digits=f'9{i:09d}', city='Benchmark',
+                )
+                for i in range(start, min(start + batch_size, patient_count))
+            ]
+            patients.extend(p.id for p in Patient.objects.bulk_create(batch))
+
+        today = timezone.now().date()
+        for start in range(0, visit_count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, visit_count)):
+                clinic = clinics[i % clinic_count]
+                batch.append(PatientVisit(
+                    clinic=clinic, patient_id=patients[i % len(patients)],
+                    seen_by=rng.choice(staff_by_clinic[clinic.id]), visit_type='New',
+                    status=rng.choice(VISIT_STATUSES),
+                    appointment_date=today - timedelta(days=rng.randint(0, 365)),
+                ))
+            visits = PatientVisit.objects.bulk_create(batch)
+
+            trials, bills = [], []
+            for visit in visits:
+                if rng.random() < 0.2:
+                    trials.append(Trial(
+                        clinic_id=visit.clinic_id, visit=visit, assigned_patient_id=visit.patient_id,
+                        serial_number=f'BENCH-SN-{visit.id}',
+                        trial_end_date=visit.appointment_date + timedelta(days=7),
+                        followup_date=visit.appointment_date + timedelta(days=10),
+                    ))
+                if rng.random() < 0.5:
+                    bills.append(Bill(
+                        visit=visit, clinic_id=visit.clinic_id, bill_number=f'BENCH-{visit.id}',
+                        payment_status=rng.choice(['Paid', 'Pending']), total_amount=rng.randint(100, 5000),
+                    ))
+            Trial.objects.bulk_create(trials)
+            Bill.objects.bulk_create(bills)
+            self.stdout.write(f'  {start + len(batch)} visits')
+
+        items = InventoryItem.objects.bulk_create([
+            InventoryItem(
+                clinic=clinics[i % clinic_count], category='Hearing Aid', product_name=f'Bench Device {i}',
+                sku=f'BENCH-SKU-{i}', stock_type='Serialized', use_in_trial=True, is_approved=True,
+            )
+            for i in range(200)
+        ])
+        serials = [
+            InventorySerial(
+                inventory_item=items[i % len(items)], serial_number=f'BENCH-INV-{i}',
+                status=rng.choice(['In Stock', 'Sold', 'Use in Trial']),
+            )
+            for i in range(max(1000, visit_count // 20))
+        ]
+        create_serials(serials, batch_size=batch_size)
+
+        # auto_now_add stamps every row with "now"; spread them over the last year
+        clinic_ids = [c.id for c in clinics]
+        with connection.cursor() as cursor:
+            for model in (PatientVisit, Trial, Bill):
+                cursor.execute(
+                    f"UPDATE {model._meta.db_table} SET created_at = now() - random() * interval '365 days' "
+                    f"WHERE clinic_id = ANY(%s)",
+                    [clinic_ids],
+                )
+            for model in (PatientVisit, Trial, Bill, InventorySerial, Patient):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - started:.1f}s'))
+
+    def cleanup(self):
+        clinics = Clinic.objects.filter(name__startswith=BENCHMARK_CLINIC_PREFIX)
+        with transaction.atomic():
+            Patient.objects.filter(clinic__in=clinics).delete()
+            InventoryItem.objects.filter(clinic__in=clinics).delete()
+            User.objects.filter(clinic__in=clinics).delete()
+            deleted, _ = clinics.delete()
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} benchmark clinics'))
+
+    # ------------------------------------------------------------------ queries
+
+    def build_queries(self, clinic):
+        """The filters used by the list views / reports, on one benchmark clinic."""
+        today = timezone.now().date()
+        staff = User.objects.filter(clinic=clinic).first()
+        item = InventoryItem.objects.filter(clinic=clinic).first()
+        serial = Trial.objects.filter(clinic=clinic).values_list('serial_number', flat=True).first()
+        phone = Patient.objects.filter(clinic=clinic).values_list('phone_primary', flat=True).last() or ''
+        clinic_patients = Patient.objects.filter(clinic=clinic)
+        range_start, range_end = day_bounds(today - timedelta(days=2), today)
+        visits = PatientVisit.objects.filter(clinic=clinic)
+        # Where page 500 starts, as a keyset cursor would carry it
+        deep_created_at, deep_id = visits.order_by('-created_at', '-id').values_list(
+            'created_at', 'id')[DEEP_PAGE_OFFSET - 1]
+
+        return [
+            ('today visits', PatientVisit.objects.filter(clinic=clinic, appointment_date=today).order_by('-created_at')[:10]),
+            ('visit list', visits.order_by('-created_at', '-id')[:10]),
+            ('visit list page 500 (OFFSET)', visits.order_by('-created_at', '-id')[DEEP_PAGE_OFFSET:DEEP_PAGE_OFFSET + 10]),
+            ('visit list page 500 (cursor)', visits.filter(
+                Q(created_at__lt=deep_created_at) | Q(created_at=deep_created_at, id__lt=deep_id),
+                created_at__lte=deep_created_at,
+            ).order_by('-created_at', '-id')[:10]),
+            ('audiologist queue', PatientVisit.objects.filter(
+                clinic=clinic, seen_by=staff, status__in=QUEUE_STATUSES).order_by('created_at')[:10]),
+            ('follow-up list', PatientVisit.objects.filter(
+                clinic=clinic, status__in=['Follow up']).order_by('-appointment_date', '-created_at')[:10]),
+            ('dashboard pending service', PatientVisit.objects.filter(
+                clinic=clinic, status='Pending for Service').values('pk')),
+            ('clinic report visits', PatientVisit.objects.filter(
+                clinic=clinic, created_at__gte=range_start, created_at__lt=range_end).order_by('-created_at')),
+            ('trials ending today', Trial.objects.filter(trial_end_date=today)),
+            ('trials follow-up today', Trial.objects.filter(followup_date=today)),
+            ('trial by serial', Trial.objects.filter(serial_number=serial)),
+            ('serials in stock', InventorySerial.objects.filter(inventory_item=item, status='In Stock').values('pk')),
+            ('pending bills', Bill.objects.filter(clinic=clinic, payment_status='Pending').order_by('-created_at', '-id')[:10]),
+            ('revenue report bills', Bill.objects.filter(
+                payment_status='Paid', created_at__gte=range_start, created_at__lt=range_end)),
+            ('patient typeahead name', search_patients(clinic_patients, 'patient 12')[:10]),
+            ('patient typeahead phone suffix', search_patients(clinic_patients, digits_only(phone)[-4:])[:10]),
+            ('patient typeahead full phone', search_patients(clinic_patients, phone)[:10]),
+            ('visit list patient search', PatientVisit.objects.filter(clinic=clinic).filter(
+                patient_search_q([digits_only(phone)[-6:]], 'patient__')).order_by('-created_at')[:10]),
+        ]
+
+    def measure(self, queryset, runs):
+        plan = queryset.explain(analyze=True)
+        # Summarise the plan by its scan nodes, e.g. "Index Scan using visit_clinic_status_idx"
+        scans = []
+        for line in plan.splitlines():
+            node = line.strip().lstrip('->').strip().split('  (')[0]
+            if 'Scan' in node:
+                scans.append(node.split(' on ')[0] if ' using ' in node else node)
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            list(queryset.all())  # fresh clone, no result cache
+            timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'plan': ', '.join(scans) or plan.splitlines()[0].split('  (')[0].strip(),
+            'seq_scan': any(scan.startswith('Seq Scan') for scan in scans),
+            'median_ms': statistics.median(timings),
+        }
+
+    def measure_without_indexes(self, queries, runs):
+        """Drop the designed indexes in a transaction, measure, then roll the drop back."""
+        index_names = [
+            index.name
+            for model in (PatientVisit, Trial, Bill, InventorySerial)
+            for index in model._meta.indexes
+        ] + list(TRIGRAM_INDEX_NAMES)
+        results = {}
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in index_names:
+                        cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+                results = {name: self.measure(qs, runs) for name, qs in queries}
+                raise _Rollback()
+        except _Rollback:
+            pass
+        return results
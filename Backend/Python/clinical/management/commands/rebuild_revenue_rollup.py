@@ -0,0 +1,46 @@
+"""
+Django management command to rebuild DailyRevenueRollup from the paid bills.
+
+Usage:
+    # Rebuild every day
+        python manage.py rebuild_revenue_rollup
+
+    # Rebuild a date range (inclusive), e.g. after correcting old bills
+        python manage.py rebuild_revenue_rollup --start 2025-01-01 --end 2025-03-31
+
+The rollup is kept up to date when bills are marked paid; run this after
+bulk imports, direct SQL changes, or edits to bills that were already paid.
+"""
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from clinical.revenue_rollup import rebuild_rollup
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", use YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily revenue rollup used by the admin revenue report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start = _parse_date(options['start']) if options['start'] else None
+        end = _parse_date(options['end']) if options['end'] else None
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+
+        started = time.perf_counter()
+        written = rebuild_rollup(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt revenue rollup: {written} rows in {time.perf_counter() - started:.1f}s'
+        ))
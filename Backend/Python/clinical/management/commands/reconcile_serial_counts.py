@@ -0,0 +1,46 @@
+"""
+Django management command to check the per-status serial counters
+(InventorySerialCount) and quantity_in_stock of serialized items against
+the InventorySerial rows, and fix any drift.
+
+Usage:
+    # Report drift without changing anything
+        python manage.py reconcile_serial_counts --dry-run
+
+    # Fix counters and serialized quantities, 500 items per transaction
+        python manage.py reconcile_serial_counts --chunk-size 500
+
+The counters follow InventorySerial.save() / delete(); run this after
+bulk imports or direct SQL changes. It also runs nightly from Celery beat.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from clinical.serial_counts import RECONCILE_CHUNK_SIZE, reconcile_serial_counts
+
+
+class Command(BaseCommand):
+    help = 'Reconcile the inventory serial counters with the serials'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE, help='Items per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be fixed')
+        parser.add_argument(
+            '--skip-quantities', action='store_true', help='Leave quantity_in_stock of serialized items alone',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        started = time.perf_counter()
+        summary = reconcile_serial_counts(
+            chunk_size=options['chunk_size'], fix=not options['dry_run'],
+            fix_quantities=not options['skip_quantities'],
+        )
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {summary['items']} items in {time.perf_counter() - started:.1f}s: "
+            f"{verb} {summary['counters_fixed']} counters, {summary['quantities_fixed']} quantities"
+        ))
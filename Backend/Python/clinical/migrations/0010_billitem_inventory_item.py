@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_inventory_items(apps, schema_editor):
+    """
+    Backfill BillItem.inventory_item for purchase / service part lines, which
+    used to be matched to their inventory item by product name in the description.
+    """
+    BillItem = apps.get_model('clinical', 'BillItem')
+    PatientPurchase = apps.get_model('clinical', 'PatientPurchase')
+    ServicePartUsed = apps.get_model('clinical', 'ServicePartUsed')
+
+    items = BillItem.objects.filter(
+        item_type__in=['Purchase', 'Part Used in Service'],
+        inventory_item__isnull=True,
+    ).select_related('bill')
+    for item in items.iterator(chunk_size=500):
+        if item.item_type == 'Purchase':
+            candidates = PatientPurchase.objects.filter(visit_id=item.bill.visit_id)
+        else:
+            candidates = ServicePartUsed.objects.filter(service__visit_id=item.bill.visit_id)
+        for candidate in candidates.select_related('inventory_item'):
+            name = candidate.inventory_item.product_name
+            if name and name in item.description:
+                BillItem.objects.filter(pk=item.pk).update(inventory_item_id=candidate.inventory_item_id)
+                break
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0009_alter_inventoryserial_inventory_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billitem',
+            name='inventory_item',
+            field=models.ForeignKey(blank=True, help_text='For Purchase / Part Used in Service items, the inventory item sold (source of GST)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bill_items', to='clinical.inventoryitem'),
+        ),
+        migrations.RunPython(link_inventory_items, migrations.RunPython.noop),
+    ]
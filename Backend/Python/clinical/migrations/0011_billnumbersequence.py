@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Start each day's counter after the highest BILL-YYYYMMDD-NNNN already issued."""
+    from datetime import datetime
+
+    Bill = apps.get_model('clinical', 'Bill')
+    BillNumberSequence = apps.get_model('clinical', 'BillNumberSequence')
+
+    last_values = {}
+    numbers = Bill.objects.filter(bill_number__startswith='BILL-').values_list('bill_number', flat=True)
+    for bill_number in numbers.iterator(chunk_size=2000):
+        parts = bill_number.split('-')
+        if len(parts) != 3 or not parts[2].isdigit():
+            continue
+        try:
+            day = datetime.strptime(parts[1], '%Y%m%d').date()
+        except ValueError:
+            continue
+        last_values[day] = max(last_values.get(day, 0), int(parts[2]))
+
+    BillNumberSequence.objects.bulk_create(
+        [BillNumberSequence(day=day, last_value=value) for day, value in last_values.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0010_billitem_inventory_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
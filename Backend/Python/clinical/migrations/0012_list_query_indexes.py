@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0011_billnumbersequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['clinic', 'status'], name='visit_clinic_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['clinic', 'appointment_date'], name='visit_clinic_appt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['seen_by', 'status'], name='visit_seen_by_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['created_at'], name='visit_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trial',
+            index=models.Index(fields=['serial_number'], name='trial_serial_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trial',
+            index=models.Index(fields=['trial_end_date'], name='trial_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trial',
+            index=models.Index(fields=['followup_date'], name='trial_followup_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trial',
+            index=models.Index(fields=['created_at'], name='trial_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['clinic', 'payment_status', '-created_at'], name='bill_clinic_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['created_at'], name='bill_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryserial',
+            index=models.Index(fields=['inventory_item', 'status'], name='serial_item_status_idx'),
+        ),
+    ]
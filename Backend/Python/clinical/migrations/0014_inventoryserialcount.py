@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_counts(apps, schema_editor):
+    from clinical.serial_counts import reconcile_serial_counts
+
+    reconcile_serial_counts(fix_quantities=False, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0013_dailyrevenuerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySerialCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='serial_counts', to='clinical.inventoryitem')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('inventory_item', 'status'), name='serial_count_item_status_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_trial_serials(apps, schema_editor):
+    InventorySerial = apps.get_model('clinical', 'InventorySerial')
+    Trial = apps.get_model('clinical', 'Trial')
+    Trial.objects.filter(inventory_serial__isnull=True, serial_number__isnull=False).update(
+        inventory_serial=models.Subquery(
+            InventorySerial.objects.filter(serial_number=models.OuterRef('serial_number')).values('pk')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0014_inventoryserialcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trial',
+            name='inventory_serial',
+            field=models.ForeignKey(blank=True, db_index=False, help_text='Serial on trial, resolved from serial_number', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trials', to='clinical.inventoryserial'),
+        ),
+        migrations.AddIndex(
+            model_name='trial',
+            index=models.Index(fields=['inventory_serial', '-created_at'], name='trial_serial_latest_idx'),
+        ),
+        migrations.RunPython(link_trial_serials, migrations.RunPython.noop),
+    ]
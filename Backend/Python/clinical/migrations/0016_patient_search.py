@@ -0,0 +1,59 @@
+import re
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 5000
+
+# pg_trgm indexes for clinical.patient_search. Kept out of Patient.Meta
+# because SQLite (and any other backend) has no GIN / gin_trgm_ops.
+TRIGRAM_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "patient_name_trgm_idx" ON "clinical_patient" USING gin ((UPPER("name")) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS "patient_phone_trgm_idx" ON "clinical_patient" USING gin ("phone_digits" gin_trgm_ops)',
+]
+
+
+def fill_phone_digits(apps, schema_editor):
+    Patient = apps.get_model('clinical', 'Patient')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"UPDATE {Patient._meta.db_table} SET phone_digits = regexp_replace(phone_primary, '\\D', '', 'g')"
+        )
+        return
+    batch = []
+    for patient in Patient.objects.only('pk', 'phone_primary').iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        patient.phone_digits = re.sub(r'\D', '', patient.phone_primary or '')
+        batch.append(patient)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            Patient.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['phone_digits'])
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in TRIGRAM_INDEXES:
+            schema_editor.execute(sql)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "patient_name_trgm_idx", "patient_phone_trgm_idx"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0015_trial_inventory_serial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', editable=False, help_text='phone_primary without formatting, for search', max_length=50),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0016_patient_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientvisit',
+            index=models.Index(fields=['clinic', '-created_at', '-id'], name='visit_clinic_created_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='bill',
+            name='bill_clinic_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['clinic', 'payment_status', '-created_at', '-id'], name='bill_clinic_status_idx'),
+        ),
+    ]
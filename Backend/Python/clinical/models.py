@@ -14,6 +14,9 @@ class Patient(models.Model):
     email = models.EmailField(blank=True, null=True)
     gender = models.CharField(max_length=50)
     phone_primary = models.CharField(max_length=50)
+    phone_digits = models.CharField(
+        max_length=50, blank=True, default='', editable=False, help_text="phone_primary without formatting, for search",
+    )
     phone_secondary = models.CharField(max_length=50, blank=True, null=True)
     city = models.CharField(max_length=255)
     address = models.TextField(null=True, blank=True)
@@ -23,6 +26,15 @@ class Patient(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        from .patient_search import digits_only
+
+        self.phone_digits = digits_only(self.phone_primary)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_primary' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+        super().save(*args, **kwargs)
+
 
 class PatientVisit(models.Model):
     clinic = models.ForeignKey(Clinic, on_delete=models.SET_NULL, null=True)
@@ -54,6 +66,18 @@ class PatientVisit(models.Model):
     cost_taken_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     mode_of_payment = models.CharField(max_length=50, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Queues / dashboards: clinic + status, today's appointments, per-audiologist queue
+            models.Index(fields=['clinic', 'status'], name='visit_clinic_status_idx'),
+            models.Index(fields=['clinic', 'appointment_date'], name='visit_clinic_appt_idx'),
+            models.Index(fields=['seen_by', 'status'], name='visit_seen_by_status_idx'),
+            # Visit list per clinic, newest first; (created_at, id) is the keyset pagination cursor
+            models.Index(fields=['clinic', '-created_at', '-id'], name='visit_clinic_created_idx'),
+            # Date-range reports and recent-first lists
+            models.Index(fields=['created_at'], name='visit_created_at_idx'),
+        ]
+
 
 class AudiologistCaseHistory(models.Model):
     """
@@ -164,6 +188,11 @@ class Trial(models.Model):
     visit = models.ForeignKey(PatientVisit, on_delete=models.CASCADE, null=True)
     device_inventory_id = models.ForeignKey('InventoryItem', on_delete=models.CASCADE, null=True, blank=True)
     serial_number = models.CharField(max_length=255, blank=True, null=True)
+    # Indexed (with created_at) by trial_serial_latest_idx; linked from serial_number on save
+    inventory_serial = models.ForeignKey(
+        'InventorySerial', on_delete=models.SET_NULL, null=True, blank=True, related_name='trials', db_index=False,
+        help_text="Serial on trial, resolved from serial_number",
+    )
     receiver_size = models.CharField(max_length=255, blank=True, null=True)
     ear_fitted = models.CharField(max_length=50, blank=True, null=True)  # Ear fitted (Right / Left / Both)
     dome_type = models.CharField(max_length=255, blank=True, null=True)  # e.g., Open, Closed, Custom
@@ -200,6 +229,23 @@ class Trial(models.Model):
     is_customization_completed = models.BooleanField(default=False)
     booked_device_serial = models.ForeignKey('InventorySerial', on_delete=models.CASCADE, null=True, blank=True, related_name='booked_trials', help_text="Serial number of booked device")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['serial_number'], name='trial_serial_number_idx'),
+            models.Index(fields=['trial_end_date'], name='trial_end_date_idx'),
+            models.Index(fields=['followup_date'], name='trial_followup_date_idx'),
+            models.Index(fields=['created_at'], name='trial_created_at_idx'),
+            models.Index(fields=['inventory_serial', '-created_at'], name='trial_serial_latest_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.serial_number and self.inventory_serial_id is None:
+            self.inventory_serial = InventorySerial.objects.filter(serial_number=self.serial_number).first()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'serial_number' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'inventory_serial'}
+        super().save(*args, **kwargs)
+
 class TestType(models.Model):
     """
     Model to store test types and their associated costs.
@@ -221,6 +267,41 @@ class TestType(models.Model):
         return f"{self.name} - ₹{self.cost}"
 
 
+class BillNumberSequence(models.Model):
+    """
+    Last bill number handed out per day, used to build BILL-YYYYMMDD-NNNN.
+    One row per day; the unique index on `day` makes each allocation a single
+    keyed row update.
+    """
+    day = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.last_value}"
+
+    @classmethod
+    def next_value(cls, day):
+        """Atomically increment and return the counter for `day`."""
+        from django.db import connection
+        from django.db.models import F
+
+        if connection.vendor == 'postgresql':
+            # Single statement: creates the day's row or bumps it under its row lock
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {cls._meta.db_table} (day, last_value) VALUES (%s, 1) "
+                    f"ON CONFLICT (day) DO UPDATE SET last_value = {cls._meta.db_table}.last_value + 1 "
+                    f"RETURNING last_value",
+                    [day],
+                )
+                return cursor.fetchone()[0]
+
+        with transaction.atomic():
+            sequence, _ = cls.objects.select_for_update().get_or_create(day=day)
+            cls.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + 1)
+            return cls.objects.values_list('last_value', flat=True).get(pk=sequence.pk)
+
+
 class Bill(models.Model):
     """
     Main bill model linked to a PatientVisit.
@@ -260,6 +341,11 @@ class Bill(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Paid / pending bill lists per clinic, newest first; revenue reports by date
+            models.Index(fields=['clinic', 'payment_status', '-created_at', '-id'], name='bill_clinic_status_idx'),
+            models.Index(fields=['created_at'], name='bill_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"Bill {self.bill_number or self.id} - {self.visit.patient.name}"
@@ -308,17 +394,85 @@ class Bill(models.Model):
     def generate_bill_number(self):
         if not self.bill_number:
             from datetime import datetime
-            date_prefix = datetime.now().strftime('%Y%m%d')
-            last = Bill.objects.filter(bill_number__startswith=f'BILL-{date_prefix}-').order_by('-bill_number').first()
-            n = int(last.bill_number.split('-')[-1]) if last and last.bill_number else 0
-            self.bill_number = f"BILL-{date_prefix}-{n+1:04d}"
+            today = datetime.now().date()
+            # Atomic per-day counter, no scan of existing bill numbers
+            n = BillNumberSequence.next_value(today)
+            self.bill_number = f"BILL-{today.strftime('%Y%m%d')}-{n:04d}"
         return self.bill_number
 
+    @staticmethod
+    def shift_total(bill_id, delta):
+        """
+        Shift total_amount of bill `bill_id` by `delta` with an F() expression, so
+        concurrent item edits on the same bill don't overwrite each other.
+        Skipped while a deferred_total() block is open for that bill.
+        """
+        from decimal import Decimal
+        from django.db.models import F, Value
+        from django.db.models.functions import Greatest
+        from .billing import is_total_deferred
+        from .conditional import touch_bill_clinic_version
+
+        if not delta or not bill_id or is_total_deferred(bill_id):
+            return False
+        Bill.objects.filter(pk=bill_id).update(
+            total_amount=Greatest(F('total_amount') + delta, Value(Decimal('0.00')))
+        )
+        touch_bill_clinic_version(bill_id)
+        return True
+
+    def apply_total_delta(self, delta):
+        """shift_total() for this bill, keeping the instance in line with the row without re-reading it"""
+        from decimal import Decimal
+        if Bill.shift_total(self.pk, delta):
+            self.total_amount = max(Decimal('0.00'), Decimal(str(self.total_amount or 0)) + delta)
+
+    def add_items(self, items):
+        """
+        Add several BillItems with one INSERT and one total update instead of a
+        recalculation per item.
+        """
+        items = list(items)
+        for item in items:
+            item.bill = self
+            item.full_clean()
+        with transaction.atomic():
+            created = BillItem.objects.bulk_create(items)
+            self.apply_total_delta(sum((item.get_line_amount() for item in items), 0))
+        return created
+
+    def deferred_total(self):
+        """Context manager: skip per-item total updates and recalculate once at the end."""
+        from .billing import deferred_bill_total
+        return deferred_bill_total(self)
+
     def save(self, *args, **kwargs):
-        """Override save to auto-generate bill number and handle cost_taken_amount"""
+        """
+        Override save to auto-generate bill number and handle cost_taken_amount.
+        Moving a bill into or out of 'Paid' updates DailyRevenueRollup.
+        """
         if not self.bill_number:
             self.generate_bill_number()
-        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'payment_status' not in update_fields:
+            super().save(*args, **kwargs)
+            return
+
+        from .revenue_rollup import record_paid_bill
+
+        with transaction.atomic():
+            # The stored status, locked: two stale copies saved as Paid must count once
+            stored = None
+            if not self._state.adding and self.pk is not None:
+                stored = Bill.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'payment_status', flat=True
+                ).first()
+            was_paid = stored == 'Paid'
+            super().save(*args, **kwargs)
+            is_paid = self.payment_status == 'Paid'
+            if was_paid != is_paid:
+                record_paid_bill(self, 1 if is_paid else -1)
 
 
 class BillItem(models.Model):
@@ -360,6 +514,14 @@ class BillItem(models.Model):
         related_name="bill_items",
         help_text="If item_type is 'Service', link to ServiceVisit",
     )
+    inventory_item = models.ForeignKey(
+        'InventoryItem',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bill_items',
+        help_text="For Purchase / Part Used in Service items, the inventory item sold (source of GST)",
+    )
     description = models.CharField(max_length=255, help_text="Description of the item")
     cost = models.DecimalField(max_digits=10, decimal_places=2, help_text="Cost of this item")
     quantity = models.IntegerField(default=1, help_text="Quantity (usually 1 for tests/trials)")
@@ -381,6 +543,11 @@ class BillItem(models.Model):
         """Calculate total for this item after discount"""
         return float((self.cost * self.quantity) - self.discount_amount)
     
+    def get_line_amount(self):
+        """Amount this item adds to the bill total (cost * quantity - discount), as Decimal"""
+        from decimal import Decimal
+        return Decimal(str(self.cost)) * int(self.quantity) - Decimal(str(self.discount_amount or 0))
+
     def get_effective_cost(self):
         """Get effective cost per unit after discount"""
         if self.quantity > 0:
@@ -414,18 +581,64 @@ class BillItem(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
-        # Recalculate bill total after saving
-        if self.bill:
-            self.bill.calculate_total()
+        with transaction.atomic():
+            old = None
+            if self.pk:
+                old = BillItem.objects.filter(pk=self.pk).only('bill', 'cost', 'quantity', 'discount_amount').first()
+            super().save(*args, **kwargs)
+            # Move the bill total by the change in this line instead of re-aggregating
+            if old is not None and old.bill_id != self.bill_id:
+                Bill.shift_total(old.bill_id, -old.get_line_amount())
+                old = None
+            self._shift_bill_total(self.get_line_amount() - (old.get_line_amount() if old else 0))
 
     def delete(self, *args, **kwargs):
-        bill = self.bill
-        result = super().delete(*args, **kwargs)
-        if bill:
-            bill.calculate_total()
+        with transaction.atomic():
+            line_amount = self.get_line_amount()
+            result = super().delete(*args, **kwargs)
+            self._shift_bill_total(-line_amount)
         return result
 
+    def _shift_bill_total(self, delta):
+        # Update the loaded Bill instance too when there is one, without fetching it otherwise
+        if self._meta.get_field('bill').is_cached(self):
+            self.bill.apply_total_delta(delta)
+        else:
+            Bill.shift_total(self.bill_id, delta)
+
+class DailyRevenueRollup(models.Model):
+    """
+    Paid-bill revenue pre-aggregated per clinic x day x staff x item type,
+    read by the admin revenue report for closed days.
+
+    `day` is the local date of the bill's created_at and `staff` the user who
+    created the bill. Rows with an empty item_type hold bill totals
+    (entry_count = bills, revenue = sum of final_amount); the other rows hold
+    the bill items of that type (entry_count = items, revenue = cost x quantity).
+
+    Kept up to date by Bill.save() when a bill is marked paid (see
+    clinical.revenue_rollup) and rebuilt with `manage.py rebuild_revenue_rollup`.
+    """
+    BILL_TOTAL = ''
+
+    day = models.DateField()
+    clinic = models.ForeignKey(Clinic, on_delete=models.SET_NULL, null=True, related_name='revenue_rollups')
+    staff = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='revenue_rollups')
+    item_type = models.CharField(max_length=50, blank=True, default=BILL_TOTAL)
+    entry_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        # No unique key: readers always SUM, so a duplicate row from two
+        # concurrent first payments (or SET_NULL merging keys) stays correct.
+        indexes = [
+            models.Index(fields=['day', 'clinic'], name='revenue_rollup_day_clinic_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.clinic_id}/{self.staff_id}/{self.item_type or 'bills'}: {self.revenue}"
+
+
 class PatientPurchase(models.Model):
     PURCHASE_TYPE = [
         ('Consumable', 'Consumable'),   # battery, dome, receiver
@@ -573,12 +786,16 @@ class InventoryItem(models.Model):
             return 0 <= (self.expiry_date - timezone.now().date()).days <= 30
         return False
 
+    # status thresholds, shared with InventoryItemSerializer.setup_eager_loading
+    CRITICAL_STOCK_LEVEL = 1
+    LOW_STOCK_LEVEL = 5
+
     @property
     def status(self):
         """Return inventory status based on quantity."""
-        if self.quantity_in_stock <= 1:
+        if self.quantity_in_stock <= self.CRITICAL_STOCK_LEVEL:
             return 'Critical'
-        elif self.quantity_in_stock < 5:
+        elif self.quantity_in_stock < self.LOW_STOCK_LEVEL:
             return 'Low'
         else:
             return 'Good'
@@ -591,10 +808,14 @@ class InventoryItem(models.Model):
         self.quantity_in_stock = count
         self.save(update_fields=["quantity_in_stock"])
 
+    @staticmethod
+    def new_sku():
+        import uuid
+        return f"SKU-{uuid.uuid4().hex[:10].upper()}"
+
     def save(self, *args, **kwargs):
         if not self.sku:
-            import uuid
-            self.sku = f"SKU-{uuid.uuid4().hex[:10].upper()}"
+            self.sku = self.new_sku()
         super().save(*args, **kwargs)
 
 class InventorySerial(models.Model):
@@ -614,6 +835,70 @@ class InventorySerial(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['inventory_item', 'status'], name='serial_item_status_idx'),
+        ]
+
+    STOCK_FIELDS = {'inventory_item', 'inventory_item_id', 'status'}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the serial is counted so save() can move it in InventorySerialCount
+        if 'inventory_item_id' in instance.__dict__ and 'status' in instance.__dict__:
+            instance._loaded_stock_key = (instance.inventory_item_id, instance.status)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Saving a new serial, or changing its status / item, updates InventorySerialCount."""
+        update_fields = kwargs.get('update_fields')
+        tracked = self._state.adding or hasattr(self, '_loaded_stock_key')
+        if not tracked or (update_fields is not None and not self.STOCK_FIELDS & set(update_fields)):
+            super().save(*args, **kwargs)
+            return
+
+        from .serial_counts import adjust_serial_counts
+
+        old_key = None if self._state.adding else self._loaded_stock_key
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            new_key = (self.inventory_item_id, self.status)
+            if old_key != new_key:
+                deltas = {new_key: 1}
+                if old_key is not None:
+                    deltas[old_key] = -1
+                adjust_serial_counts(deltas)
+        self._loaded_stock_key = new_key
+
+    def delete(self, *args, **kwargs):
+        from .serial_counts import adjust_serial_counts
+
+        key = getattr(self, '_loaded_stock_key', (self.inventory_item_id, self.status))
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            adjust_serial_counts({key: -1})
+        return result
+
+
+class InventorySerialCount(models.Model):
+    """
+    Number of serials of an item in each status, kept current by
+    InventorySerial.save() / delete() and the helpers in
+    clinical.serial_counts, and checked by `reconcile_serial_counts`.
+    """
+    inventory_item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE, related_name='serial_counts')
+    status = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['inventory_item', 'status'], name='serial_count_item_status_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_item_id} {self.status}: {self.count}"
+
 
 class ServiceVisit(models.Model):
     SERVICE_TYPE_CHOICES = [
@@ -0,0 +1,92 @@
+"""
+Patient search by name or phone number.
+
+Name terms match anywhere in the name (``UPPER(name) LIKE '%TERM%'``),
+served on PostgreSQL by the pg_trgm GIN index on UPPER(name); one and two
+character terms match the start of the name instead, which the trigram
+index can also serve. Phone terms (4+ digits, any formatting) match
+Patient.phone_digits, the digits-only copy of phone_primary kept by
+Patient.save(), through the trigram index on that column, so "98765 43210",
+"+91-9876543210" and the last four digits read out over the phone all find
+the patient. The indexes (TRIGRAM_INDEX_NAMES) are created by migration 0016.
+
+PatientSearchFilter plugs this into list views in place of DRF's
+SearchFilter; search_patients() is the ranked typeahead.
+"""
+
+import re
+
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework.filters import SearchFilter
+
+MIN_PHONE_DIGITS = 4
+MIN_INFIX_NAME_LENGTH = 3  # shortest term the trigram index can serve as '%term%'
+TYPEAHEAD_LIMIT = 10
+MAX_TYPEAHEAD_LIMIT = 25
+TRIGRAM_INDEX_NAMES = ('patient_name_trgm_idx', 'patient_phone_trgm_idx')
+
+
+def digits_only(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def patient_term_q(term, path=''):
+    """Q for one search term against the patient at `path` ('' for Patient, 'patient__' for visits)."""
+    if len(term) < MIN_INFIX_NAME_LENGTH:
+        match = Q(**{f'{path}name__istartswith': term})
+    else:
+        match = Q(**{f'{path}name__icontains': term})
+    digits = digits_only(term)
+    if len(digits) >= MIN_PHONE_DIGITS:
+        match |= Q(**{f'{path}phone_digits__contains': digits})
+    return match
+
+
+def patient_search_q(terms, path=''):
+    """Every term has to match the name or the phone (like SearchFilter)."""
+    query = Q()
+    for term in terms:
+        query &= patient_term_q(term, path)
+    return query
+
+
+def search_patients(queryset, query):
+    """
+    Rank the patients in `queryset` matching `query`: exact phone, then phone
+    ending with the digits, then name starting with the query, then a later
+    word of the name starting with it, then anything else; alphabetically
+    within a rank.
+    """
+    query = query.strip()
+    terms = query.split()
+    if not terms:
+        return queryset.none()
+    digits = digits_only(query)
+
+    ranks = [
+        When(name__istartswith=query, then=Value(3)),
+        When(name__icontains=f' {query}', then=Value(2)),
+    ]
+    if len(digits) >= MIN_PHONE_DIGITS:
+        ranks = [
+            When(phone_digits=digits, then=Value(5)),
+            When(phone_digits__endswith=digits, then=Value(4)),
+            *ranks,
+        ]
+    return queryset.filter(patient_search_q(terms)).annotate(
+        search_rank=Case(*ranks, default=Value(1), output_field=IntegerField()),
+    ).order_by('-search_rank', 'name', 'id')
+
+
+class PatientSearchFilter(SearchFilter):
+    """
+    ?search= for patient lists, through patient_search_q() instead of
+    icontains on each of search_fields. Views set patient_search_path to the
+    patient relation ('patient__' by default, '' for Patient querysets).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return queryset.filter(patient_search_q(terms, getattr(view, 'patient_search_path', 'patient__')))
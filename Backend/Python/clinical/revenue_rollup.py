@@ -0,0 +1,199 @@
+"""
+DailyRevenueRollup maintenance and the revenue report built on it.
+
+Closed days are read from the rollup; only today (the day still taking
+payments) is aggregated from Bill / BillItem.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .date_utils import day_bounds
+
+BILL_TOTAL = ''
+ROLLUP_BATCH_SIZE = 1000
+CENTS = Decimal('0.01')
+
+
+def _rollup_model(apps=global_apps):
+    return apps.get_model('clinical', 'DailyRevenueRollup')
+
+
+def bill_contributions(bill):
+    """{item_type: (entry_count, revenue)} that a paid `bill` adds to its day."""
+    contributions = {BILL_TOTAL: (1, Decimal(str(bill.final_amount or 0)))}
+    items = bill.bill_items.values('item_type').annotate(
+        entries=Count('id'),
+        revenue=Sum(F('cost') * F('quantity'), output_field=DecimalField()),
+    )
+    for row in items:
+        contributions[row['item_type']] = (row['entries'], row['revenue'] or Decimal('0'))
+    return contributions
+
+
+def record_paid_bill(bill, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) a paid bill's revenue from the rollup,
+    with F() updates so concurrent payments on the same day don't overwrite
+    each other.
+    """
+    Rollup = _rollup_model()
+    key = {
+        'day': timezone.localdate(bill.created_at),
+        'clinic_id': bill.clinic_id,
+        'staff_id': bill.created_by_id,
+    }
+    with transaction.atomic():
+        for item_type, (entries, revenue) in bill_contributions(bill).items():
+            row_id = Rollup.objects.filter(**key, item_type=item_type).values_list('pk', flat=True).first()
+            if row_id is None:
+                Rollup.objects.create(**key, item_type=item_type, entry_count=sign * entries, revenue=sign * revenue)
+            else:
+                Rollup.objects.filter(pk=row_id).update(
+                    entry_count=F('entry_count') + sign * entries,
+                    revenue=F('revenue') + sign * revenue,
+                )
+
+
+def rebuild_rollup(start_date=None, end_date=None, apps=global_apps):
+    """
+    Recompute the rollup from the paid bills of [start_date, end_date]
+    (all days when omitted) with two grouped queries. Returns the number of
+    rows written. `apps` lets migrations run it against historical models.
+    """
+    Bill = apps.get_model('clinical', 'Bill')
+    BillItem = apps.get_model('clinical', 'BillItem')
+    Rollup = _rollup_model(apps)
+    tz = timezone.get_current_timezone()
+
+    bills = Bill.objects.filter(payment_status='Paid')
+    rollups = Rollup.objects.all()
+    if start_date:
+        bills = bills.filter(created_at__gte=day_bounds(start_date, start_date)[0])
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        bills = bills.filter(created_at__lt=day_bounds(end_date, end_date)[1])
+        rollups = rollups.filter(day__lte=end_date)
+
+    bill_rows = bills.annotate(day=TruncDate('created_at', tzinfo=tz)).values(
+        'day', 'clinic_id', 'created_by_id',
+    ).annotate(entries=Count('id'), revenue=Sum('final_amount')).order_by()
+    item_rows = BillItem.objects.filter(bill__in=bills).annotate(day=TruncDate('bill__created_at', tzinfo=tz)).values(
+        'day', 'bill__clinic_id', 'bill__created_by_id', 'item_type',
+    ).annotate(
+        entries=Count('id'), revenue=Sum(F('cost') * F('quantity'), output_field=DecimalField()),
+    ).order_by()
+
+    def build():
+        for row in bill_rows.iterator(chunk_size=ROLLUP_BATCH_SIZE):
+            yield Rollup(
+                day=row['day'], clinic_id=row['clinic_id'], staff_id=row['created_by_id'], item_type=BILL_TOTAL,
+                entry_count=row['entries'], revenue=row['revenue'] or 0,
+            )
+        for row in item_rows.iterator(chunk_size=ROLLUP_BATCH_SIZE):
+            yield Rollup(
+                day=row['day'], clinic_id=row['bill__clinic_id'], staff_id=row['bill__created_by_id'],
+                item_type=row['item_type'], entry_count=row['entries'], revenue=row['revenue'] or 0,
+            )
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for rollup in build():
+            batch.append(rollup)
+            if len(batch) >= ROLLUP_BATCH_SIZE:
+                written += len(Rollup.objects.bulk_create(batch))
+                batch = []
+        written += len(Rollup.objects.bulk_create(batch))
+    return written
+
+
+# ---------------------------------------------------------------- reporting
+
+def _merge(totals, rows, key_fields):
+    for row in rows:
+        key = tuple(row[field] for field in key_fields)
+        entries, revenue = totals.get(key, (0, Decimal('0')))
+        totals[key] = (entries + row['entries'], revenue + (row['revenue'] or 0))
+
+
+def _report_rows(totals, key_fields, count_field, with_average):
+    rows = []
+    for key, (entries, revenue) in totals.items():
+        if not entries:
+            continue
+        row = dict(zip(key_fields, key))
+        row['total_revenue'] = Decimal(revenue).quantize(CENTS)
+        row[count_field] = entries
+        if with_average:
+            row['avg_bill_amount'] = (row['total_revenue'] / entries).quantize(CENTS)
+        rows.append(row)
+    rows.sort(key=lambda row: (-row['total_revenue'], [str(row[field]) for field in key_fields]))
+    return rows
+
+
+def revenue_report(report_type, start_date, end_date, clinic_id=None):
+    """
+    Rows for AdminRevenueReportsView: (revenue_data, staff_revenue_data).
+
+    report_type 'clinic' groups bills by clinic name, 'category' groups bill
+    items by item type; staff_revenue_data groups bills by their creator.
+    """
+    Rollup = _rollup_model()
+    today = timezone.localdate()
+    last_closed_day = min(end_date, today - timedelta(days=1))
+
+    rollups = Rollup.objects.none()
+    if start_date <= last_closed_day:
+        rollups = Rollup.objects.filter(day__gte=start_date, day__lte=last_closed_day)
+        if clinic_id:
+            rollups = rollups.filter(clinic_id=clinic_id)
+    bill_rollups = rollups.filter(item_type=BILL_TOTAL)
+
+    Bill = global_apps.get_model('clinical', 'Bill')
+    BillItem = global_apps.get_model('clinical', 'BillItem')
+    live_bills = Bill.objects.none()
+    if end_date >= today:
+        range_start, range_end = day_bounds(max(start_date, today), end_date)
+        live_bills = Bill.objects.filter(payment_status='Paid', created_at__gte=range_start, created_at__lt=range_end)
+        if clinic_id:
+            live_bills = live_bills.filter(clinic_id=clinic_id)
+
+    def rolled(queryset, *fields):
+        return queryset.values(*fields).annotate(entries=Sum('entry_count'), revenue=Sum('revenue')).order_by()
+
+    def live(queryset, *fields):
+        return queryset.values(*fields).annotate(entries=Count('id'), revenue=Sum('final_amount')).order_by()
+
+    if report_type == 'clinic':
+        totals = {}
+        _merge(totals, rolled(bill_rollups, 'clinic__name'), ['clinic__name'])
+        _merge(totals, live(live_bills, 'clinic__name'), ['clinic__name'])
+        revenue_data = _report_rows(totals, ['clinic__name'], 'total_bills', with_average=True)
+    elif report_type == 'category':
+        totals = {}
+        _merge(totals, rolled(rollups.exclude(item_type=BILL_TOTAL), 'item_type'), ['item_type'])
+        _merge(totals, BillItem.objects.filter(bill__in=live_bills).values('item_type').annotate(
+            entries=Count('id'), revenue=Sum(F('cost') * F('quantity'), output_field=DecimalField()),
+        ).order_by(), ['item_type'])
+        revenue_data = _report_rows(totals, ['item_type'], 'total_items', with_average=False)
+    else:
+        raise ValueError(f'Invalid report type: {report_type}')
+
+    staff_totals = {}
+    _merge(staff_totals, [
+        {'created_by__name': row['staff__name'], 'created_by__id': row['staff_id'], **row}
+        for row in rolled(bill_rollups, 'staff__name', 'staff_id')
+    ], ['created_by__name', 'created_by__id'])
+    _merge(staff_totals, live(live_bills, 'created_by__name', 'created_by__id'), ['created_by__name', 'created_by__id'])
+    staff_revenue_data = _report_rows(
+        staff_totals, ['created_by__name', 'created_by__id'], 'total_bills', with_average=True,
+    )
+    return revenue_data, staff_revenue_data
@@ -0,0 +1,208 @@
+"""
+Per-item, per-status serial counters (InventorySerialCount).
+
+InventorySerial.save() / delete() keep the counters current in the same
+transaction as the serial change. Bulk writes that bypass save() go
+through create_serials() / update_serials() / move_serials(). Anything else (raw SQL,
+fixtures, older rows) is caught by reconcile_serial_counts(), which the
+``reconcile_serial_counts`` management command runs in chunks.
+"""
+
+from collections import Counter
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+RECONCILE_CHUNK_SIZE = 1000
+
+
+def _count_model(apps=global_apps):
+    return apps.get_model('clinical', 'InventorySerialCount')
+
+
+def adjust_serial_counts(deltas):
+    """
+    Apply {(inventory_item_id, status): delta} to the counters: the items'
+    counters are locked with one SELECT ... FOR UPDATE, rewritten with one
+    bulk_update and missing ones inserted with one bulk_create.
+    """
+    SerialCount = _count_model()
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        counters = {
+            (counter.inventory_item_id, counter.status): counter
+            for counter in SerialCount.objects.select_for_update().filter(
+                inventory_item_id__in={item_id for item_id, _ in deltas},
+            ).order_by('pk')
+        }
+        changed = []
+        for key, delta in deltas.items():
+            if key in counters:
+                counters[key].count += delta
+                changed.append(counters[key])
+        SerialCount.objects.bulk_update(changed, ['count'])
+
+        # A missing counter is never created by a decrement: the item may be
+        # going away with it (cascade), reconciliation fills such gaps
+        missing = {key: delta for key, delta in sorted(deltas.items()) if key not in counters and delta > 0}
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                SerialCount.objects.bulk_create([
+                    SerialCount(inventory_item_id=item_id, status=serial_status, count=delta)
+                    for (item_id, serial_status), delta in missing.items()
+                ])
+        except IntegrityError:
+            # Some were created by a concurrent transaction in the meantime
+            for (item_id, serial_status), delta in missing.items():
+                counters = SerialCount.objects.filter(inventory_item_id=item_id, status=serial_status)
+                if not counters.update(count=F('count') + delta):
+                    SerialCount.objects.create(inventory_item_id=item_id, status=serial_status, count=delta)
+
+
+def _count_serials(InventorySerial, item_ids):
+    """{(inventory_item_id, status): number of serials} of the given items."""
+    return {
+        (row['inventory_item_id'], row['status']): row['total']
+        for row in InventorySerial.objects.filter(inventory_item_id__in=item_ids).values(
+            'inventory_item_id', 'status',
+        ).annotate(total=Count('pk')).order_by()
+    }
+
+
+def create_serials(serials, **kwargs):
+    """bulk_create InventorySerial rows and count them."""
+    InventorySerial = global_apps.get_model('clinical', 'InventorySerial')
+    with transaction.atomic():
+        created = InventorySerial.objects.bulk_create(serials, **kwargs)
+        adjust_serial_counts(Counter((serial.inventory_item_id, serial.status) for serial in created))
+    for serial in created:
+        serial._loaded_stock_key = (serial.inventory_item_id, serial.status)
+    return created
+
+
+def update_serials(queryset, **changes):
+    """
+    queryset.update(**changes) for InventorySerial rows, moving the counts
+    of the updated rows. Returns the number of rows updated.
+    """
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().order_by('pk').values_list('pk', 'inventory_item_id', 'status'))
+        if not rows:
+            return 0
+        updated = queryset.model.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(**changes)
+        new_item_id = changes['inventory_item'].pk if 'inventory_item' in changes else changes.get('inventory_item_id')
+        deltas = Counter()
+        for _, item_id, serial_status in rows:
+            deltas[(item_id, serial_status)] -= 1
+            deltas[(new_item_id or item_id, changes.get('status', serial_status))] += 1
+        adjust_serial_counts(deltas)
+    return updated
+
+
+def move_serials(serials, destinations):
+    """
+    Move already locked InventorySerial rows to other items in one UPDATE.
+    ``destinations`` maps each serial's current inventory_item_id to the
+    item it moves to. Returns the number of rows moved.
+    """
+    if not serials:
+        return 0
+    InventorySerial = global_apps.get_model('clinical', 'InventorySerial')
+    with transaction.atomic():
+        moved = InventorySerial.objects.filter(pk__in=[serial.pk for serial in serials]).update(
+            inventory_item_id=Case(
+                *[When(inventory_item_id=source_id, then=Value(dest_id)) for source_id, dest_id in destinations.items()],
+                default=F('inventory_item_id'),
+                output_field=IntegerField(),
+            ),
+        )
+        deltas = Counter()
+        for serial in serials:
+            deltas[(serial.inventory_item_id, serial.status)] -= 1
+            deltas[(destinations[serial.inventory_item_id], serial.status)] += 1
+        adjust_serial_counts(deltas)
+    for serial in serials:
+        serial.inventory_item_id = destinations[serial.inventory_item_id]
+        serial._loaded_stock_key = (serial.inventory_item_id, serial.status)
+    return moved
+
+
+def reconcile_serial_counts(chunk_size=RECONCILE_CHUNK_SIZE, fix=True, fix_quantities=True, apps=global_apps):
+    """
+    Compare the counters with the serials, RECONCILE_CHUNK_SIZE items at a
+    time, and (with fix=True) rewrite the ones that drifted. With
+    fix_quantities, serialized items whose quantity_in_stock differs from
+    their In Stock serials are corrected too.
+
+    Returns {'items', 'counters_fixed', 'quantities_fixed'}; with fix=False
+    the *_fixed values are what would have been changed.
+    """
+    InventoryItem = apps.get_model('clinical', 'InventoryItem')
+    InventorySerial = apps.get_model('clinical', 'InventorySerial')
+    SerialCount = _count_model(apps)
+
+    summary = {'items': 0, 'counters_fixed': 0, 'quantities_fixed': 0}
+    last_id = 0
+    while True:
+        items = list(
+            InventoryItem.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'stock_type', 'quantity_in_stock')[:chunk_size]
+        )
+        if not items:
+            return summary
+        last_id = items[-1][0]
+        item_ids = [pk for pk, _, _ in items]
+        summary['items'] += len(items)
+
+        with transaction.atomic():
+            # Lock the counters before counting: serial changes committed after
+            # the count then apply their delta on top of the corrected value.
+            # In pk order, like adjust_serial_counts(), so the two cannot deadlock.
+            stored = {
+                (row.inventory_item_id, row.status): row
+                for row in SerialCount.objects.select_for_update().filter(inventory_item_id__in=item_ids).order_by('pk')
+            }
+            actual = _count_serials(InventorySerial, item_ids)
+
+            stale = [row for key, row in stored.items() if row.count != actual.get(key, 0)]
+            missing = {key for key in actual if key not in stored}
+            summary['counters_fixed'] += len(stale) + len(missing)
+
+            wrong_quantities = {}
+            if fix_quantities:
+                for pk, stock_type, quantity in items:
+                    in_stock = actual.get((pk, 'In Stock'), 0)
+                    if stock_type == 'Serialized' and quantity != in_stock:
+                        wrong_quantities[pk] = in_stock
+                summary['quantities_fixed'] += len(wrong_quantities)
+
+            if not fix:
+                continue
+            for row in stale:
+                row.count = actual.get((row.inventory_item_id, row.status), 0)
+            SerialCount.objects.bulk_update(stale, ['count'])
+            SerialCount.objects.filter(pk__in=[row.pk for row in stale if not row.count]).delete()
+            SerialCount.objects.bulk_create([
+                SerialCount(inventory_item_id=item_id, status=serial_status, count=actual[(item_id, serial_status)])
+                for item_id, serial_status in missing
+            ], ignore_conflicts=True)
+            if missing:
+                # A concurrent InventorySerial.save() may have created some of
+                # them first, counting only its own serial: recount them locked
+                missing_ids = {item_id for item_id, _ in missing}
+                created = [
+                    row for row in SerialCount.objects.select_for_update().filter(
+                        inventory_item_id__in=missing_ids,
+                    ).order_by('pk')
+                    if (row.inventory_item_id, row.status) in missing
+                ]
+                recount = _count_serials(InventorySerial, missing_ids)
+                for row in created:
+                    row.count = recount.get((row.inventory_item_id, row.status), 0)
+                SerialCount.objects.bulk_update(created, ['count'])
+            for pk, in_stock in wrong_quantities.items():
+                InventoryItem.objects.filter(pk=pk).update(quantity_in_stock=in_stock)
@@ -29,6 +29,8 @@ from rest_framework import status
 from django.utils import timezone
 from django.db import models
 from django.db.models import F
+from .billing import summarize_items, item_gst_value
+from .serial_counts import create_serials
 
 
 
@@ -46,16 +48,51 @@ class PatientAllVisitSerializer(serializers.ModelSerializer):
     completed_date = serializers.SerializerMethodField()
     trial_details = serializers.SerializerMethodField()
 
+    PAID_STATUSES = ('Paid', 'Partially Paid')
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Annotate the bill fields and prefetch trials so a page of visits is
+        rendered from one visit query plus one trial query.
+        """
+        from django.db.models import Prefetch
+        return queryset.select_related('seen_by').annotate(
+            bill_total_amount=F('bill__total_amount'),
+            bill_payment_status=F('bill__payment_status'),
+            bill_paid_at=F('bill__paid_at'),
+        ).prefetch_related(
+            Prefetch(
+                'trial_set',
+                queryset=Trial.objects.select_related('device_inventory_id').order_by('id'),
+                to_attr='visit_trials',
+            )
+        )
+
+    def _bill_values(self, obj):
+        # (payment_status, total_amount, paid_at) of the visit's bill, or None
+        if hasattr(obj, 'bill_payment_status'):
+            if obj.bill_payment_status is None:
+                return None
+            return obj.bill_payment_status, obj.bill_total_amount, obj.bill_paid_at
+        bill = Bill.objects.filter(visit=obj).only('payment_status', 'total_amount', 'paid_at').first()
+        if bill is None:
+            return None
+        return bill.payment_status, bill.total_amount, bill.paid_at
+
     def get_payment_status(self, obj):
         # get the payment status from Bill
-        bills = Bill.objects.filter(visit=obj)
-        if bills.exists() and all(bill.payment_status == 'Paid' or bill.payment_status == 'Partially Paid' for bill in bills):
+        bill = self._bill_values(obj)
+        if bill and bill[0] in self.PAID_STATUSES:
             return 'Paid'
         return 'Pending'
 
 
     def get_trial_details(self, obj):
-        trial = Trial.objects.filter(visit=obj).first()
+        if hasattr(obj, 'visit_trials'):
+            trial = obj.visit_trials[0] if obj.visit_trials else None
+        else:
+            trial = Trial.objects.filter(visit=obj).first()
         if not trial:
             return None
         
@@ -74,17 +111,14 @@ class PatientAllVisitSerializer(serializers.ModelSerializer):
 
 
     def get_total_bill(self, obj):
-        from django.db.models import Sum
-        return Bill.objects.filter(visit=obj).aggregate(total_amount=Sum('total_amount'))['total_amount'] or 0
+        bill = self._bill_values(obj)
+        return bill[1] if bill else 0
 
     def get_completed_date(self, obj):
-        from django.db.models import Max
-        # Check if all bills for this visit are paid
-        bills = Bill.objects.filter(visit=obj)
-        if bills.exists() and all(bill.payment_status == 'Paid' or bill.payment_status == 'Partially Paid' for bill in bills):
-            # Return the latest payment date
-            latest_payment = bills.aggregate(latest_date=Max('paid_at'))['latest_date']
-            return latest_payment
+        # Once the bill is paid, return the payment date
+        bill = self._bill_values(obj)
+        if bill and bill[0] in self.PAID_STATUSES:
+            return bill[2]
         return None
 
     class Meta:
@@ -581,6 +615,7 @@ class PatientRegistrationSerializer(serializers.ModelSerializer):
                                     bill=bill,
                                     description=f"Purchase - {purchase.inventory_item.product_name}" + (f" : {purchase.inventory_serial.serial_number}" if purchase.inventory_serial else ""),
                                     item_type="Purchase",
+                                    inventory_item=purchase.inventory_item,
                                     cost=purchase.unit_price,
                                     quantity=purchase.quantity,
                                 ) for purchase in p_purchases
@@ -952,6 +987,7 @@ class PatientVisitCreateSerializer(serializers.Serializer):
                                     bill=bill,
                                     description=f"Purchase - {purchase.inventory_item.product_name}" + (f" : {purchase.inventory_serial.serial_number}" if purchase.inventory_serial else ""),
                                     item_type="Purchase",
+                                    inventory_item=purchase.inventory_item,
                                     cost=purchase.unit_price,
                                     quantity=purchase.quantity,
                                 ) for purchase in p_purchases
@@ -1040,7 +1076,7 @@ class TrialSerializer(serializers.ModelSerializer):
     class Meta:
         model = Trial
         fields = '__all__'
-        read_only_fields = ['clinic']
+        read_only_fields = ['clinic', 'inventory_serial']
 
 
 # Comprehensive Visit Details Serializer with Tests and Trials
@@ -1500,21 +1536,22 @@ class AudiologistCaseHistoryCreateSerializer(serializers.ModelSerializer):
                         'created_by': getattr(request, 'user', None) if request else None,
                     },
                 )
+                # Look up all test types once and add the items in a single batch
+                test_types = {test_type.name.lower(): test_type for test_type in TestType.objects.all()}
+                bill_items = []
                 for field_name, testtype_name in flag_to_testtype_name.items():
                     if getattr(test_performed_instance, field_name, False):
-                        try:
-                            test_type = TestType.objects.get(name__iexact=testtype_name)
-                        except TestType.DoesNotExist:
+                        test_type = test_types.get(testtype_name.lower())
+                        if test_type is None:
                             continue
-                        BillItem.objects.create(
-                            bill=bill,
+                        bill_items.append(BillItem(
                             item_type='Test',
                             test_type=test_type,
                             description=test_type.name,
                             cost=test_type.cost,
                             quantity=1,
-                        )
-                bill.calculate_total()
+                        ))
+                bill.add_items(bill_items)
 
             # 4. Update PatientVisit status to 'test_performed'
             if test_performed_instance:
@@ -1585,33 +1622,8 @@ class BillItemSerializer(serializers.ModelSerializer):
         return float(obj.cost * obj.quantity)
 
     def get_gst_value(self, obj):
-        quantity = obj.quantity or 1
-        print(quantity)
-
-        # if obj.item_type == 'Trial' and obj.trial and obj.trial.device_inventory_id:
-        #     gst = obj.trial.device_inventory_id.gst_value or 0
-        #     return gst * quantity
-        if obj.item_type == 'Part Used in Service' and obj.bill and hasattr(obj.bill.visit, 'service'):
-            service = obj.bill.visit.service
-            parts = service.parts_used.select_related('inventory_item').all()
-            for part in parts:
-                if part.inventory_item.product_name and part.inventory_item.product_name in obj.description:
-                    gst = part.inventory_item.gst_value or 0
-                    return gst * quantity
-        
-        if obj.item_type == 'Purchase' and obj.bill and hasattr(obj.bill, 'visit') and obj.bill.visit:
-             purchases = obj.bill.visit.purchases.select_related('inventory_item').all()
-             
-             for p in purchases:
-                 if p.inventory_item.product_name and p.inventory_item.product_name in obj.description:
-                     gst = p.inventory_item.gst_value or 0
-                     return gst * quantity
-
-        if obj.item_type == 'Service' and obj.service_visit:
-            gst = obj.service_visit.gst_charges or 0
-            return gst
-
-        return 0
+        # GST comes from the linked inventory item (purchases / service parts) or the service visit
+        return item_gst_value(obj)
 
     class Meta:
         model = BillItem
@@ -1670,33 +1682,40 @@ class BillDetailSerializer(serializers.ModelSerializer):
     items_count = serializers.SerializerMethodField()
     subtotal = serializers.SerializerMethodField()
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load the bill, its visit/patient/clinic and all line items (with GST sources) in two queries."""
+        from django.db.models import Prefetch
+        return queryset.select_related(
+            'visit',
+            'visit__patient',
+            'visit__seen_by',
+            'clinic',
+            'created_by'
+        ).prefetch_related(
+            Prefetch(
+                'bill_items',
+                queryset=BillItem.objects.select_related('test_type', 'trial', 'service_visit', 'inventory_item'),
+            )
+        )
+
+    def _summary(self, obj):
+        # Computed once per bill from the prefetched items
+        if not hasattr(obj, '_bill_summary'):
+            obj._bill_summary = summarize_items(obj.bill_items.all())
+        return obj._bill_summary
+
     def get_discounts(self, obj):
         """Calculate total discount amount from all BillItems"""
-        from django.db.models import Sum, DecimalField
-        from decimal import Decimal
-        
-        total = obj.bill_items.aggregate(
-            total=Sum('discount_amount', output_field=DecimalField())
-        )['total']
-        return float(total) if total is not None else 0.0 
+        return float(self._summary(obj)['discounts'])
     
     def get_items_count(self, obj):
         """Total number of items in the bill"""
-        return obj.bill_items.count()
+        return self._summary(obj)['items_count']
 
     def get_subtotal(self, obj):
         """Subtotal before discount and GST (just the items total)"""
-        from django.db.models import F, Sum, DecimalField
-        from decimal import Decimal
-        
-        # Calculate items total without GST
-        items_total = obj.bill_items.aggregate(
-            total=Sum(F('cost') * F('quantity'), output_field=DecimalField())
-        )['total']
-        if items_total is None:
-            items_total = Decimal('0.00')
-        
-        return float(items_total)
+        return float(self._summary(obj)['subtotal'])
 
     def get_cost_taken_amount_deducted(self, obj):
         # Returns the deducted amount for clarity
@@ -1805,9 +1824,46 @@ class InventoryItemSerializer(serializers.ModelSerializer):
     model_type_name = serializers.CharField(source='model_type.name', read_only=True)
     clinic_name = serializers.CharField(source='clinic.name', read_only=True)
     quantity_in_stock = serializers.SerializerMethodField()
-    
+    status = serializers.SerializerMethodField()
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Annotate the effective stock (the In Stock serial counter for
+        serialized items, the stored quantity otherwise) and its Critical /
+        Low / Good status, so a page of items is one query and can be
+        filtered / counted by status.
+        """
+        from django.db.models import Case, CharField, FilteredRelation, IntegerField, Q, Value, When
+        from django.db.models.functions import Coalesce
+
+        # One LEFT JOIN on the maintained counter instead of counting serials
+        return queryset.select_related('brand', 'model_type', 'clinic').annotate(
+            in_stock_counter=FilteredRelation('serial_counts', condition=Q(serial_counts__status='In Stock')),
+        ).annotate(
+            stock_quantity=Case(
+                When(stock_type='Serialized', then=Coalesce(F('in_stock_counter__count'), 0)),
+                default=F('quantity_in_stock'),
+                output_field=IntegerField(),
+            ),
+        ).annotate(
+            stock_status=Case(
+                When(stock_quantity__lte=InventoryItem.CRITICAL_STOCK_LEVEL, then=Value('Critical')),
+                When(stock_quantity__lt=InventoryItem.LOW_STOCK_LEVEL, then=Value('Low')),
+                default=Value('Good'),
+                output_field=CharField(),
+            ),
+        )
+
+    def get_status(self, obj):
+        if hasattr(obj, 'stock_status'):
+            return obj.stock_status
+        return obj.status
+
     def get_quantity_in_stock(self, obj):
         """Calculate quantity_in_stock based on stock type."""
+        if hasattr(obj, 'stock_quantity'):
+            return obj.stock_quantity
         if obj.stock_type == 'Serialized':
             # For serialized items, count only serial numbers with 'In Stock' status
             return obj.serials.filter(status='In Stock').count()
@@ -1945,7 +2001,7 @@ class InventoryItemCreateSerializer(serializers.ModelSerializer):
                         status='In Stock'
                     ) for sn in serial_numbers
                 ]
-                InventorySerial.objects.bulk_create(serials_to_create)
+                create_serials(serials_to_create)
         
         return inventory_item
 
@@ -2046,7 +2102,7 @@ class TrialCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Trial
         fields = '__all__'
-        read_only_fields = ['clinic', 'created_at', 'assigned_patient']
+        read_only_fields = ['clinic', 'created_at', 'assigned_patient', 'inventory_serial']
 
     def create(self, validated_data):
         request = self.context.get('request')
@@ -2086,6 +2142,7 @@ class TrialCreateSerializer(serializers.ModelSerializer):
         visit.save()
 
         validated_data['device_inventory_id'] = serial.inventory_item
+        validated_data['inventory_serial'] = serial
         
         with transaction.atomic():     
             trial = super().create(validated_data)
@@ -2188,6 +2245,8 @@ class TrialDeviceSerializer(serializers.ModelSerializer):
 
     def get_available_serials(self, obj):
         if obj.stock_type == 'Serialized':
+            if hasattr(obj, 'in_stock_serials'):
+                return TrialDeviceSerialSerializer(obj.in_stock_serials, many=True).data
             serials = obj.serials.filter(status='In Stock')
             return TrialDeviceSerialSerializer(serials, many=True).data
         return []
@@ -2496,7 +2555,7 @@ class PurchaseInventoryItemSerializer(serializers.ModelSerializer):
         BillItem.objects.create(
                     bill=bill,
                     item_type='Purchase',
-                    # patient_purchase=patient_purchase,
+                    inventory_item=inventoryitem,
                     description=f"Purchase of {inventoryitem.product_name}",
                     cost=patient_purchase.total_price,
                     quantity=patient_purchase.quantity,
@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from clinical_be.utils.cache import invalidate_on_change
+
+from .conditional import touch_clinic_version
+from .dashboard import invalidate_dashboard_stats_on_commit
+from .models import (AudiologistCaseHistory, Bill, Brand, ModelType, Patient, PatientVisit, TestType, Trial,
+                     VisitTestPerformed)
+from .revenue_rollup import record_paid_bill
+
+
+# Reference data served from clinical_be.utils.cache
+invalidate_on_change('test-types', TestType)
+invalidate_on_change('brands-models', Brand, ModelType)
+
+
+# Anything counted by the dashboard invalidates the cached stats of its clinic once it commits
+# and, like bills, moves the clinic version behind conditional GETs.
+# queryset.update() does not send signals; those changes show up after the TTL.
+@receiver([post_save, post_delete], sender=PatientVisit)
+@receiver([post_save, post_delete], sender=Trial)
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_clinic_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard_stats_on_commit(instance.clinic_id)
+    touch_clinic_version(instance.clinic_id)
+
+
+@receiver(post_save, sender=VisitTestPerformed)
+def invalidate_dashboard_on_test(sender, instance, **kwargs):
+    clinic_id = PatientVisit.objects.filter(pk=instance.visit_id).values_list('clinic_id', flat=True).first()
+    invalidate_dashboard_stats_on_commit(clinic_id)
+    touch_clinic_version(clinic_id)
+
+
+@receiver(post_save, sender=AudiologistCaseHistory)
+def invalidate_dashboard_on_case_history(sender, instance, **kwargs):
+    clinic_id = Patient.objects.filter(pk=instance.patient_id).values_list('clinic_id', flat=True).first()
+    invalidate_dashboard_stats_on_commit(clinic_id)
+    touch_clinic_version(clinic_id)
+
+
+@receiver([post_save, post_delete], sender=Bill)
+def touch_clinic_version_on_bill(sender, instance, **kwargs):
+    touch_clinic_version(instance.clinic_id)
+
+
+# pre_delete: the bill items are still there to be subtracted. The stored row
+# is used, the instance being deleted may be stale.
+@receiver(pre_delete, sender=Bill)
+def remove_deleted_bill_from_rollup(sender, instance, **kwargs):
+    stored = Bill.objects.filter(pk=instance.pk, payment_status='Paid').first()
+    if stored is not None:
+        record_paid_bill(stored, -1)
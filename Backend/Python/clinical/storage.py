@@ -0,0 +1,162 @@
+"""
+S3 storage for uploaded test reports.
+
+get_client() builds one boto3 client per process and reuses it: creating a
+client loads the service model and opens a fresh connection pool, which
+costs more than uploading a small report. Large reports (BERA/ASSR PDFs)
+should not pass through a request worker at all: the browser asks for a
+presigned POST or PUT (presign_report_upload()), sends the file straight to
+S3, then confirms it (confirm_report_upload()), which checks the object
+exists and records TestUpload.file_path.
+
+Set AWS_S3_ENDPOINT_URL to use a local S3 stand-in (moto server, MinIO).
+"""
+
+import uuid
+from functools import lru_cache
+from urllib.parse import urlparse
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+
+UPLOAD_METHODS = ('post', 'put')
+UPLOAD_TOKEN_SALT = 'clinical.storage.report-upload'
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+class StorageError(Exception):
+    """An upload that cannot be presigned or confirmed."""
+
+
+def _setting(name, default=None):
+    return getattr(settings, name, default)
+
+
+@lru_cache(maxsize=1)
+def get_client():
+    """The process-wide S3 client (boto3 clients are thread-safe)."""
+    return boto3.session.Session().client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        endpoint_url=_setting('AWS_S3_ENDPOINT_URL'),
+        config=Config(
+            signature_version='s3v4',
+            max_pool_connections=_setting('AWS_S3_MAX_POOL_CONNECTIONS', 10),
+            retries={'max_attempts': 3, 'mode': 'standard'},
+        ),
+    )
+
+
+def report_key(report_type, filename):
+    """Object key for a new report file: test_reports/<type>/<uuid>.<ext>"""
+    extension = filename.rsplit('.', 1)[-1] if '.' in filename else 'bin'
+    return f"test_reports/{report_type}/{uuid.uuid4()}.{extension}"
+
+
+def file_url(key):
+    endpoint = _setting('AWS_S3_ENDPOINT_URL')
+    if endpoint:
+        return f"{endpoint.rstrip('/')}/{settings.AWS_STORAGE_BUCKET_NAME}/{key}"
+    return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{key}"
+
+
+def key_from_url(url):
+    path = urlparse(url).path.lstrip('/')
+    if _setting('AWS_S3_ENDPOINT_URL'):
+        path = path.removeprefix(f"{settings.AWS_STORAGE_BUCKET_NAME}/")
+    return path
+
+
+def upload_file(fileobj, key, content_type=None):
+    """Upload through this process (small files only); returns the file URL."""
+    get_client().upload_fileobj(
+        fileobj, settings.AWS_STORAGE_BUCKET_NAME, key,
+        ExtraArgs={'ContentType': content_type or DEFAULT_CONTENT_TYPE},
+    )
+    return file_url(key)
+
+
+def delete_file(url):
+    get_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key_from_url(url))
+
+
+def presign_report_upload(test_upload, filename, content_type=None, method='post'):
+    """
+    Presigned upload for a TestUpload's file.
+
+    method='post' returns a form (url + fields) that S3 itself limits to
+    REPORT_UPLOAD_MAX_BYTES; method='put' returns a URL to PUT the raw body
+    to, with the headers it was signed for. Either way the client then sends
+    upload_token to confirm_report_upload().
+    """
+    if method not in UPLOAD_METHODS:
+        raise StorageError(f"method must be one of: {', '.join(UPLOAD_METHODS)}")
+    content_type = content_type or DEFAULT_CONTENT_TYPE
+    key = report_key(test_upload.report_type, filename)
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    expires_in = settings.AWS_PRESIGNED_EXPIRY
+
+    if method == 'post':
+        presigned = get_client().generate_presigned_post(
+            bucket, key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, settings.REPORT_UPLOAD_MAX_BYTES],
+            ],
+            ExpiresIn=expires_in,
+        )
+        upload = {'url': presigned['url'], 'fields': presigned['fields']}
+    else:
+        upload = {
+            'url': get_client().generate_presigned_url(
+                'put_object',
+                Params={'Bucket': bucket, 'Key': key, 'ContentType': content_type},
+                ExpiresIn=expires_in,
+            ),
+            'headers': {'Content-Type': content_type},
+        }
+
+    return {
+        'method': method.upper(),
+        **upload,
+        'key': key,
+        'expires_in': expires_in,
+        'upload_token': signing.dumps({'id': test_upload.id, 'key': key}, salt=UPLOAD_TOKEN_SALT),
+    }
+
+
+def confirm_report_upload(test_upload, upload_token):
+    """
+    Record a finished direct upload on ``test_upload`` and return its URL.
+    The token ties the key to this TestUpload; the object must exist and be
+    within REPORT_UPLOAD_MAX_BYTES (a PUT cannot enforce the size itself).
+    """
+    try:
+        payload = signing.loads(
+            upload_token or '', salt=UPLOAD_TOKEN_SALT, max_age=settings.AWS_PRESIGNED_EXPIRY * 2,
+        )
+    except signing.BadSignature:
+        raise StorageError("Invalid or expired upload token")
+    if payload.get('id') != test_upload.id:
+        raise StorageError("Upload token does not belong to this report")
+
+    key = payload['key']
+    try:
+        head = get_client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError as exc:
+        if exc.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise StorageError("Uploaded file not found")
+        raise
+    if head['ContentLength'] > settings.REPORT_UPLOAD_MAX_BYTES:
+        get_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+        raise StorageError("Uploaded file is too large")
+
+    test_upload.file_path = file_url(key)
+    test_upload.save(update_fields=['file_path'])
+    return test_upload.file_path
@@ -1,7 +1,16 @@
 from celery import shared_task
-from django.core.management import call_command
-from django.utils import timezone
+
+from clinical import serial_counts
+from clinical.followups import update_followup_statuses
+
 
 @shared_task
 def update_followup_status():
-    call_command('update_followup_status')
\ No newline at end of file
+    # The summary (counts per transition, duration) is stored as the task result
+    return update_followup_statuses()
+
+
+@shared_task
+def reconcile_serial_counts():
+    # {'items', 'counters_fixed', 'quantities_fixed'} is stored as the task result
+    return serial_counts.reconcile_serial_counts()
@@ -9,6 +9,7 @@ from .test_upload_serializers import (
     BulkReportTestUploadSerializer
 )
 from .file_utils import upload_file_to_s3
+from .storage import StorageError, confirm_report_upload, presign_report_upload
 
 
 class ReportTestCreateView(generics.CreateAPIView):
@@ -49,6 +50,47 @@ class ReportUploadView(generics.UpdateAPIView):
         
 
 
+class ReportUploadPresignView(generics.GenericAPIView):
+    """
+    Presigned URL for uploading a report file straight to S3.
+    Body: filename, content_type, method ('post' form upload (default) or 'put').
+    After the upload, send the returned upload_token to report-upload/<id>/complete/.
+    """
+    queryset = TestUpload.objects.all()
+    lookup_field = 'id'
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        filename = request.data.get('filename')
+        if not filename:
+            return Response({"status":status.HTTP_400_BAD_REQUEST,"message":"filename is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = presign_report_upload(
+                instance, filename, request.data.get('content_type'), str(request.data.get('method') or 'post').lower(),
+            )
+        except StorageError as e:
+            return Response({"status":status.HTTP_400_BAD_REQUEST,"message":str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status":status.HTTP_200_OK,"data":upload}, status=status.HTTP_200_OK)
+
+
+class ReportUploadCompleteView(generics.GenericAPIView):
+    """Confirm a direct-to-S3 upload (body: upload_token) and record the report's file_path"""
+    queryset = TestUpload.objects.all()
+    lookup_field = 'id'
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        try:
+            file_path = confirm_report_upload(instance, request.data.get('upload_token'))
+        except StorageError as e:
+            return Response({"status":status.HTTP_400_BAD_REQUEST,"message":str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "status":status.HTTP_200_OK,
+            "message":"File uploaded successfully",
+            "data":{"id":instance.id,"file_path":file_path},
+        }, status=status.HTTP_200_OK)
+
+
 class TestUploadListView(generics.ListAPIView):
     """List and create test upload records"""
     queryset = TestUpload.objects.all()
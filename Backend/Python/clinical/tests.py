@@ -1,3 +1,1669 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import uuid
+import warnings
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse, JsonResponse as DjangoJsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+try:
+    import requests
+    from moto import mock_aws
+except ImportError:  # moto (and requests, which it pulls in) are test-only dependencies
+    mock_aws = None
+
+from accounts.models import Clinic, Role, User
+from clinical import storage, urls as clinical_urls
+from clinical_be.utils.compression import CompressionMiddleware, brotli
+from clinical_be.utils.query_budget import QueryBudgetMiddleware
+from clinical_be.utils.renderers import FastJSONRenderer, FastJsonResponse
+from clinical.async_views import (AsyncAudiologistPatientQueueView, AsyncDashboardStatsView,
+                                  AsyncPatientVisitFollowupView, AsyncTodayPatientVisitsView)
+from clinical.followups import update_followup_statuses
+from clinical.inventory_transfer import TransferError, transfer_inventory
+from clinical.revenue_rollup import rebuild_rollup
+from clinical.serial_counts import create_serials, reconcile_serial_counts, update_serials
+from clinical.serializers import InventoryItemSerializer
+from clinical.views import AudiologistPatientQueueView, DashboardStatsView, PatientVisitFollowupView, TodayPatientVisitsView
+from clinical.models import (AudiologistCaseHistory, Bill, BillItem, BillNumberSequence, Brand, ClinicTransactions,
+                             DailyRevenueRollup,
+                             InventoryItem, InventorySerial, InventorySerialCount, InventoryTransfer, ModelType, Patient, PatientVisit,
+                             TestType, TestUpload, Trial, VisitTestPerformed)
+
+
+API_PREFIX = '/api/clinical/'
+
+# A cache every process sees, like Redis in production
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'clinical-tests-cache'),
+    }
+}
+
+# Roles tried in order until a route stops answering 403.
+ROLE_NAMES = ['Admin', 'Reception', 'Audiologist', 'Clinic Manager', 'Speech Therapist']
+
+# Routes whose query count still grows with the number of rows.
+# Remove an entry once the endpoint is fixed; new N+1s fail the suite.
+KNOWN_QUERY_GROWTH = {
+    'patient/visit/',
+    'trials/',
+    'clinic/transactions/',
+}
+
+
+def seed_clinic_data(clinic, audiologist, n, probe_patient=None):
+    """
+    Seed n patients with a test-pending visit (billed, with a trial) and a
+    follow-up visit (paid bill), plus inventory with serials. When
+    probe_patient is given it also gets n more visits so per-patient
+    endpoints grow as well.
+    """
+    today = date.today()
+    test_type, _ = TestType.objects.get_or_create(name='PTA', defaults={'cost': Decimal('500.00')})
+    brand, _ = Brand.objects.get_or_create(name='Phonak', category='Hearing Aid')
+    model_type, _ = ModelType.objects.get_or_create(brand=brand, name='Audeo')
+
+    patients = []
+    for i in range(n):
+        patient = Patient.objects.create(
+            clinic=clinic, name=f'Patient {Patient.objects.count()}', gender='Male',
+            phone_primary=f'98{Patient.objects.count():08d}', city='Pune', created_by=audiologist,
+        )
+        patients.append(patient)
+        visit = PatientVisit.objects.create(
+            clinic=clinic, patient=patient, seen_by=audiologist, visit_type='New',
+            status='Test pending', appointment_date=today,
+        )
+        followup = PatientVisit.objects.create(
+            clinic=clinic, patient=patient, seen_by=audiologist, visit_type='New',
+            status='Follow up', appointment_date=today,
+        )
+
+        item = InventoryItem.objects.create(
+            clinic=clinic, category='Hearing Aid', product_name=f'Device {InventoryItem.objects.count()}',
+            brand=brand, model_type=model_type, stock_type='Serialized', quantity_in_stock=2,
+            use_in_trial=True, is_approved=True, unit_price=Decimal('1000.00'),
+        )
+        serial = InventorySerial.objects.create(
+            inventory_item=item, serial_number=f'SN-{InventorySerial.objects.count()}', status='Use in Trial',
+        )
+        InventorySerial.objects.create(
+            inventory_item=item, serial_number=f'SN-{InventorySerial.objects.count()}', status='In Stock',
+        )
+        trial = Trial.objects.create(
+            clinic=clinic, visit=visit, device_inventory_id=item, serial_number=serial.serial_number,
+            assigned_patient=patient, cost=Decimal('100.00'), trial_start_date=today, trial_end_date=today,
+        )
+
+        bill = Bill.objects.create(visit=visit, clinic=clinic, created_by=audiologist)
+        BillItem.objects.create(bill=bill, item_type='Test', test_type=test_type, description='PTA', cost=test_type.cost)
+        BillItem.objects.create(bill=bill, item_type='Trial', trial=trial, description='Trial', cost=trial.cost)
+        paid_bill = Bill.objects.create(visit=followup, clinic=clinic, created_by=audiologist, payment_status='Paid')
+        BillItem.objects.create(bill=paid_bill, item_type='Test', test_type=test_type, description='PTA', cost=test_type.cost)
+
+        ClinicTransactions.objects.create(
+            clinic=clinic, transaction_type='Income', category='Sale', amount=Decimal('10.00'), created_by=audiologist,
+        )
+
+    if probe_patient is not None:
+        for i in range(n):
+            PatientVisit.objects.create(
+                clinic=clinic, patient=probe_patient, seen_by=audiologist, visit_type='Follow-up',
+                status='Follow up', appointment_date=today,
+            )
+    return patients
+
+
+def iter_get_routes():
+    """Yield (name, pattern, view_class) for every GET route in clinical/urls.py."""
+    for pattern in clinical_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class is None or not hasattr(view_class, 'get'):
+            continue
+        yield str(pattern.pattern), pattern, view_class
+
+
+@override_settings(QUERY_BUDGET_WARN_THRESHOLD=10_000)
+class QueryBudgetMiddlewareTests(TestCase):
+    def test_headers_report_query_count(self):
+        clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        role = Role.objects.create(name='Reception')
+        user = User.objects.create(email='r@example.com', name='R', clinic=clinic, role=role, is_approved=True)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get(reverse('patient_flat_list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+        self.assertIn('X-DB-Time-ms', response)
+
+
+@override_settings(QUERY_BUDGET_WARN_THRESHOLD=10_000)
+class ConstantQueryCountTests(TestCase):
+    """
+    Every GET route in clinical/urls.py must issue the same number of
+    queries whether the clinic has N or 2N patients/visits/bills.
+    """
+    N = 3
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1', is_main_inventory=True)
+        self.users = {}
+        for name in ROLE_NAMES:
+            role = Role.objects.create(name=name)
+            self.users[name] = User.objects.create(
+                email=f'{name.lower().replace(" ", "_")}@example.com', name=name,
+                clinic=self.clinic, role=role, is_approved=True, is_active=True,
+            )
+        self.audiologist = self.users['Audiologist']
+        self.probe_patient = seed_clinic_data(self.clinic, self.audiologist, self.N)[0]
+
+    def route_url(self, pattern):
+        """Build a concrete URL for the route, pointing detail routes at the probe patient's data."""
+        visit = self.probe_patient.visits.order_by('id').first()
+        trial = Trial.objects.filter(visit=visit).first()
+        values = {
+            'id': self.probe_patient.id,
+            'patient_id': self.probe_patient.id,
+            'visit_id': visit.id,
+            'trial_id': trial.id,
+            'bill_id': visit.bill.id,
+            'item_id': visit.bill.bill_items.first().id,
+            'inventory_item_id': trial.device_inventory_id,
+            'pk': trial.device_inventory_id,
+            'serial_number': trial.serial_number,
+        }
+        route = str(pattern.pattern)
+        # `id` means a different model depending on the route
+        if route.startswith('patient/visit/'):
+            values['id'] = visit.id
+        elif route.startswith('clinic/transactions/'):
+            values['id'] = ClinicTransactions.objects.filter(clinic=self.clinic).first().id
+        for key in pattern.pattern.converters:
+            if key not in values:
+                return None
+            route = route.replace(f'<int:{key}>', str(values[key])).replace(f'<str:{key}>', str(values[key]))
+        return API_PREFIX + route
+
+    def measure(self, url):
+        """Return (status_code, query_count) for the first role allowed on the route."""
+        # Views that blow up on a bare GET still count; they just report a 500
+        client = APIClient(raise_request_exception=False)
+        result = None
+        for name in ROLE_NAMES:
+            client.force_authenticate(self.users[name])
+            cache.clear()  # measure the cold path of cached endpoints
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get(url)
+            result = (response.status_code, len(ctx.captured_queries))
+            if response.status_code != 403:
+                break
+        return result
+
+    def test_routes_use_constant_queries(self):
+        routes = []
+        for route, pattern, view_class in iter_get_routes():
+            url = self.route_url(pattern)
+            if url is not None:
+                routes.append((route, url))
+
+        before = {route: self.measure(url) for route, url in routes}
+        seed_clinic_data(self.clinic, self.audiologist, self.N, probe_patient=self.probe_patient)
+        after = {route: self.measure(url) for route, url in routes}
+
+        for route, url in routes:
+            if route in KNOWN_QUERY_GROWTH:
+                continue
+            with self.subTest(route=route):
+                self.assertEqual(
+                    before[route][1], after[route][1],
+                    f'{url} went from {before[route][1]} to {after[route][1]} queries '
+                    f'(status {before[route][0]} -> {after[route][0]})',
+                )
+
+
+class PatientAllVisitSerializerTests(TestCase):
+    def test_annotated_queryset_matches_per_row_lookups(self):
+        from clinical.serializers import PatientAllVisitSerializer
+
+        clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        audiologist = User.objects.create(email='a@example.com', name='A', clinic=clinic)
+        patient = seed_clinic_data(clinic, audiologist, 1)[0]
+        Bill.objects.filter(visit__patient=patient, payment_status='Paid').update(paid_at='2025-01-02T10:00:00Z')
+        queryset = PatientVisit.objects.filter(patient=patient).order_by('id')
+
+        plain = PatientAllVisitSerializer(queryset, many=True).data
+        with self.assertNumQueries(2):
+            annotated = PatientAllVisitSerializer(
+                PatientAllVisitSerializer.setup_eager_loading(queryset), many=True
+            ).data
+
+        self.assertEqual(plain, annotated)
+        self.assertEqual(annotated[0]['payment_status'], 'Pending')
+        self.assertEqual(annotated[1]['payment_status'], 'Paid')
+        self.assertIsNotNone(annotated[0]['trial_details'])
+
+
+class BillDetailViewTests(TestCase):
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        role = Role.objects.create(name='Reception')
+        self.user = User.objects.create(email='r@example.com', name='R', clinic=self.clinic, role=role, is_approved=True)
+        self.patient = seed_clinic_data(self.clinic, self.user, 1)[0]
+        self.visit = self.patient.visits.order_by('id').first()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_purchase_items(self, count):
+        item = InventoryItem.objects.filter(clinic=self.clinic).first()
+        InventoryItem.objects.filter(pk=item.pk).update(gst_value=Decimal('18.00'))
+        for i in range(count):
+            BillItem.objects.create(
+                bill=self.visit.bill, item_type='Purchase', inventory_item=item,
+                description=f'Purchase of {item.product_name}', cost=Decimal('200.00'), quantity=2,
+                discount_amount=Decimal('10.00'),
+            )
+
+    def test_query_count_does_not_grow_with_items(self):
+        url = reverse('bill_detail', kwargs={'visit_id': self.visit.id})
+        self.client.get(url)  # settle the stored total
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+
+        self.add_purchase_items(5)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        data = response.json()['data']
+        self.assertEqual(data['items_count'], 7)
+        self.assertEqual(data['subtotal'], 600.0 + 5 * 400.0)
+        self.assertEqual(data['discounts'], 50.0)
+        purchase_lines = [line for line in data['bill_items'] if line['item_type'] == 'Purchase']
+        self.assertTrue(all(Decimal(str(line['gst_value'])) == Decimal('36.00') for line in purchase_lines))
+
+
+class BillTotalTests(TestCase):
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.user = User.objects.create(email='a@example.com', name='A', clinic=self.clinic)
+        patient = Patient.objects.create(clinic=self.clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        visit = PatientVisit.objects.create(clinic=self.clinic, patient=patient, visit_type='New')
+        self.bill = Bill.objects.create(visit=visit, clinic=self.clinic, gst_amount=Decimal('20.00'))
+        self.test_types = [
+            TestType.objects.create(name=f'Test {i}', cost=Decimal('100.00') * (i + 1)) for i in range(3)
+        ]
+
+    def stored_total(self):
+        return Bill.objects.get(pk=self.bill.pk).total_amount
+
+    def test_add_items_updates_total_once(self):
+        items = [
+            BillItem(item_type='Test', test_type=t, description=t.name, cost=t.cost) for t in self.test_types
+        ]
+        self.bill.calculate_total()
+        with CaptureQueriesContext(connection) as ctx:
+            self.bill.add_items(items)
+
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.stored_total(), Decimal('620.00'))
+        self.assertEqual(self.bill.total_amount, Decimal('620.00'))
+
+    def test_item_save_and_delete_apply_deltas(self):
+        self.bill.calculate_total()
+        item = BillItem.objects.create(
+            bill=self.bill, item_type='Test', test_type=self.test_types[0], description='x', cost=Decimal('100.00'),
+        )
+        self.assertEqual(self.stored_total(), Decimal('120.00'))
+
+        item.discount_amount = Decimal('30.00')
+        item.quantity = 2
+        item.save()
+        self.assertEqual(self.stored_total(), Decimal('190.00'))
+
+        item.delete()
+        self.assertEqual(self.stored_total(), Decimal('20.00'))
+
+    def test_deferred_total_recalculates_once(self):
+        with self.bill.deferred_total():
+            for t in self.test_types:
+                BillItem.objects.create(bill=self.bill, item_type='Test', test_type=t, description=t.name, cost=t.cost)
+            self.assertEqual(self.stored_total(), Decimal('0.00'))
+        self.assertEqual(self.stored_total(), Decimal('620.00'))
+
+
+class BillNumberTests(TestCase):
+    def test_numbers_are_sequential_per_day(self):
+        clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        patient = Patient.objects.create(clinic=clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        prefix = f"BILL-{datetime.now().strftime('%Y%m%d')}-"
+        BillNumberSequence.objects.create(day=datetime.now().date(), last_value=41)
+
+        numbers = [
+            Bill.objects.create(
+                visit=PatientVisit.objects.create(clinic=clinic, patient=patient, visit_type='New'), clinic=clinic,
+            ).bill_number
+            for _ in range(3)
+        ]
+
+        self.assertEqual(numbers, [f'{prefix}0042', f'{prefix}0043', f'{prefix}0044'])
+
+
+class DashboardStatsTests(TestCase):
+    URL = API_PREFIX + 'dashboard/stats/'
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.other = Clinic.objects.create(name='Other', address='Addr', phone='2')
+        self.reception = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        self.audiologist = User.objects.create(
+            email='a@example.com', name='A', clinic=self.clinic, role=Role.objects.create(name='Audiologist'),
+            is_approved=True,
+        )
+        self.patient = Patient.objects.create(clinic=self.clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        Patient.objects.create(clinic=self.other, name='O', gender='Male', phone_primary='2', city='Pune')
+        for status_, appointment_date in [
+            ('Test pending', self.today), ('Pending for Service', self.today), ('Follow up', date(2000, 1, 1)),
+            ('Follow up', None),
+        ]:
+            PatientVisit.objects.create(
+                clinic=self.clinic, patient=self.patient, visit_type='New', status=status_,
+                appointment_date=appointment_date, seen_by=self.audiologist,
+            )
+        tested = PatientVisit.objects.create(
+            clinic=self.clinic, patient=self.patient, visit_type='New', seen_by=self.audiologist, status='Test Performed',
+        )
+        VisitTestPerformed.objects.create(visit=tested)
+        VisitTestPerformed.objects.create(visit=tested)
+        AudiologistCaseHistory.objects.create(patient=self.patient)
+        Trial.objects.create(clinic=self.clinic, visit=tested)
+        PatientVisit.objects.create(clinic=self.other, patient=self.patient, visit_type='New', appointment_date=self.today)
+
+    def get_stats(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_reception_counts(self):
+        self.assertEqual(self.get_stats(self.reception), {
+            'total_patients': 1, 'todays_visits': 2, 'pending_services': 1, 'followup_visits': 2,
+        })
+
+    def test_audiologist_counts(self):
+        self.assertEqual(self.get_stats(self.audiologist), {
+            'pending_tests': 1, 'completed_tests': 2, 'trials_active': 1,
+        })
+
+    def test_cached_until_a_visit_is_saved(self):
+        self.get_stats(self.reception)
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_stats(self.reception)
+        self.assertFalse(any('clinical_patientvisit' in q['sql'] for q in ctx.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PatientVisit.objects.create(
+                clinic=self.clinic, patient=self.patient, visit_type='New', appointment_date=self.today,
+            )
+            # Invalidated on commit: a poll before it keeps the cached counters
+            self.assertEqual(self.get_stats(self.reception)['todays_visits'], 2)
+        self.assertEqual(self.get_stats(self.reception)['todays_visits'], 3)
+
+    def test_other_clinic_writes_keep_cache(self):
+        self.get_stats(self.reception)
+        PatientVisit.objects.create(clinic=self.other, patient=self.patient, visit_type='New')
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_stats(self.reception)
+        self.assertFalse(any('clinical_patientvisit' in q['sql'] for q in ctx.captured_queries))
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.other = Clinic.objects.create(name='Other', address='Addr', phone='2')
+        role = Role.objects.create(name='Reception')
+        self.reception = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=role, is_approved=True,
+        )
+        self.colleague = User.objects.create(
+            email='r2@example.com', name='R2', clinic=self.clinic, role=role, is_approved=True,
+        )
+        self.patient = Patient.objects.create(clinic=self.clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        self.visit = PatientVisit.objects.create(
+            clinic=self.clinic, patient=self.patient, visit_type='New', appointment_date=timezone.localdate(),
+        )
+        self.bill = Bill.objects.create(visit=self.visit, clinic=self.clinic, payment_status='Pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reception)
+
+    def get(self, url, **headers):
+        return self.client.get(API_PREFIX + url, headers=headers)
+
+    def assertNotModified(self, url, response):
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.get(url, If_None_Match=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+        self.assertFalse([q for q in ctx.captured_queries if 'clinical_' in q['sql']])
+
+    def test_unchanged_polls_are_not_modified(self):
+        for url in ['patient/visits/today/', 'dashboard/stats/', 'bill/pending/']:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertIn('Last-Modified', response)
+            self.assertNotModified(url, response)
+            self.assertEqual(self.get(url, If_Modified_Since=response['Last-Modified']).status_code, 304)
+
+        self.client.force_authenticate(User.objects.create(
+            email='a@example.com', name='A', clinic=self.clinic, role=Role.objects.create(name='Audiologist'),
+            is_approved=True,
+        ))
+        response = self.get('audiologits/queue/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotModified('audiologits/queue/', response)
+
+    def test_etag_is_per_user_and_url(self):
+        etag = self.get('patient/visits/today/')['ETag']
+        self.assertNotEqual(self.get('patient/visits/today/?page=1')['ETag'], etag)
+        self.client.force_authenticate(self.colleague)
+        self.assertEqual(self.get('patient/visits/today/', If_None_Match=etag).status_code, 200)
+
+    def test_writes_to_the_clinic_change_the_etag(self):
+        url = 'bill/pending/'
+        etag = self.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.create(clinic=self.other, name='O', gender='Male', phone_primary='2', city='Pune')
+        self.assertEqual(self.get(url, If_None_Match=etag).status_code, 304)
+
+        # Bill totals move with queryset.update(), which sends no signal
+        with self.captureOnCommitCallbacks(execute=True):
+            Bill.shift_total(self.bill.pk, Decimal('50.00'))
+        response = self.get(url, If_None_Match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['total_amount'], '50.00')
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.visit.status = 'Test pending'
+            self.visit.save()
+        self.assertEqual(self.get(url, If_None_Match=etag).status_code, 200)
+
+    def test_followup_job_changes_the_etag(self):
+        today = timezone.localdate()
+        self.visit.status = 'Trial Active'
+        self.visit.save()
+        Trial.objects.create(
+            clinic=self.clinic, visit=self.visit, assigned_patient=self.patient, serial_number='SN-1',
+            trial_start_date=today - timedelta(days=7), trial_end_date=today,
+        )
+        etag = self.get('patient/visits/today/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            update_followup_statuses(today)
+        self.assertEqual(self.get('patient/visits/today/', If_None_Match=etag).status_code, 200)
+
+    def test_users_without_a_clinic_are_not_conditional(self):
+        # They see every clinic's bills, so no one clinic's stamp covers their lists
+        self.client.force_authenticate(User.objects.create(
+            email='n@example.com', name='N', role=self.reception.role, is_approved=True,
+        ))
+        response = self.get('bill/pending/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.get('bill/pending/', If_None_Match='*').status_code, 200)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_disables_conditional_get(self):
+        # Another worker's writes would not touch this process's stamps
+        response = self.get('patient/visits/today/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.get('patient/visits/today/', If_None_Match='*').status_code, 200)
+
+
+class AsyncReadViewTests(TestCase):
+    """
+    The async variants of the polled endpoints answer what the sync views
+    do. They run on an event loop here, so a lazy related-object load in
+    them would raise SynchronousOnlyOperation.
+    """
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1', is_main_inventory=True)
+        self.reception = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        self.audiologist = User.objects.create(
+            email='a@example.com', name='A', clinic=self.clinic, role=Role.objects.create(name='Audiologist'),
+            is_approved=True,
+        )
+        seed_clinic_data(self.clinic, self.audiologist, 3)
+        self.factory = APIRequestFactory()
+
+    def call(self, view_class, user, url, cold=True, **headers):
+        request = self.factory.get(API_PREFIX + url, headers=headers)
+        # A fresh user (and cold caches) each time, as a new request would see
+        force_authenticate(request, User.objects.get(pk=user.pk))
+        if cold:
+            cache.clear()
+        view = view_class.as_view()
+        response = async_to_sync(view)(request) if iscoroutinefunction(view) else view(request)
+        return response.render() if hasattr(response, 'render') else response
+
+    def test_payloads_match_sync_views(self):
+        cases = [
+            (TodayPatientVisitsView, AsyncTodayPatientVisitsView, self.reception, 'patient/visits/today/?pageSize=2'),
+            (TodayPatientVisitsView, AsyncTodayPatientVisitsView, self.reception, 'patient/visits/today/?status=Follow up'),
+            (AudiologistPatientQueueView, AsyncAudiologistPatientQueueView, self.audiologist, 'audiologits/queue/'),
+            (PatientVisitFollowupView, AsyncPatientVisitFollowupView, self.reception, 'patient-visits/followup?page=2&pageSize=2'),
+            (DashboardStatsView, AsyncDashboardStatsView, self.reception, 'dashboard/stats/'),
+            (DashboardStatsView, AsyncDashboardStatsView, self.audiologist, 'dashboard/stats/'),
+        ]
+        for sync_view, async_view, user, url in cases:
+            with self.subTest(url=url, role=user.role.name):
+                expected = self.call(sync_view, user, url)
+                response = self.call(async_view, user, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    def test_checks_and_errors_match_sync_views(self):
+        self.assertEqual(self.call(AsyncAudiologistPatientQueueView, self.reception, 'audiologits/queue/').status_code, 403)
+        self.assertEqual(self.call(AsyncTodayPatientVisitsView, self.reception, 'patient/visits/today/?page=9').status_code, 404)
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_conditional_get(self):
+        response = self.call(AsyncTodayPatientVisitsView, self.reception, 'patient/visits/today/')
+        again = self.call(AsyncTodayPatientVisitsView, self.reception, 'patient/visits/today/', cold=False,
+                          If_None_Match=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertIn('no-cache', again['Cache-Control'])
+
+    def test_query_budget_counts_async_queries(self):
+        async def view(request):
+            return HttpResponse(str(await PatientVisit.objects.acount()))
+
+        response = async_to_sync(QueryBudgetMiddleware(view))(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'6')
+        self.assertEqual(response['X-DB-Query-Count'], '1')
+
+
+class JsonRenderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.user = User.objects.create(
+            email='r@example.com', name='R', clinic=clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        patient = Patient.objects.create(clinic=clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        for i in range(40):
+            PatientVisit.objects.create(
+                clinic=clinic, patient=patient, visit_type='New', appointment_date=timezone.localdate(),
+                notes=f'Visit note number {i}',
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self):
+        return {
+            'amount': Decimal('1250.50'),
+            'created_at': datetime(2025, 1, 31, 10, 15, 30, 123456, tzinfo=timezone.get_current_timezone()),
+            'naive': datetime(2025, 1, 31, 10, 15, 30),
+            'day': date(2025, 1, 31),
+            'duration': timedelta(minutes=90),
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'text': 'Bråten \u2028 line',
+            'nested': [{1: 'int key'}, ('a', 'b'), None, True, 3.25],
+        }
+
+    def test_renderer_matches_drf(self):
+        data = self.payload()
+        self.assertEqual(
+            json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)),
+        )
+        self.assertIn(b'\\u2028', FastJSONRenderer().render(data))
+        indented = FastJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_json_response_matches_django(self):
+        data = self.payload()
+        self.assertEqual(
+            json.loads(FastJsonResponse(data).content), json.loads(DjangoJsonResponse(data).content),
+        )
+        with self.assertRaises(TypeError):
+            FastJsonResponse([1, 2])
+
+    def get(self, url='patient/visits/today/?pageSize=40', **headers):
+        return self.client.get(API_PREFIX + url, headers=headers)
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_large_get_responses_are_compressed(self):
+        plain = self.get()
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        gzipped = self.get(Accept_Encoding='gzip, deflate')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(gzipped.content)), plain.json())
+        self.assertLess(len(gzipped.content), len(plain.content) / 3)
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+        self.assertTrue(gzipped['ETag'].startswith('W/'))
+        # the weak ETag still answers a conditional GET
+        self.assertEqual(self.get(Accept_Encoding='gzip', If_None_Match=gzipped['ETag']).status_code, 304)
+
+        if brotli is not None:
+            compressed = self.get(Accept_Encoding='gzip, deflate, br')
+            self.assertEqual(compressed['Content-Encoding'], 'br')
+            self.assertEqual(json.loads(brotli.decompress(compressed.content)), plain.json())
+            refused = self.get(Accept_Encoding='gzip, br;q=0')
+            self.assertEqual(refused['Content-Encoding'], 'gzip')
+
+    def test_small_and_unsafe_responses_are_not_compressed(self):
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=10 ** 6):
+            self.assertFalse(self.get(Accept_Encoding='gzip, br').has_header('Content-Encoding'))
+        middleware = CompressionMiddleware(lambda request: HttpResponse('x' * 5000))
+        post = RequestFactory().post('/', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertFalse(middleware(post).has_header('Content-Encoding'))
+        get = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(middleware(get)['Content-Encoding'], 'gzip')
+
+
+class ReferenceDataCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(email='r@example.com', name='R', is_approved=True))
+
+    def get(self, url, table):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(API_PREFIX + url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), sum(table in q['sql'] for q in ctx.captured_queries)
+
+    def test_test_types_cached_until_changed(self):
+        TestType.objects.create(name='PTA', cost=100)
+        first, queries = self.get('test-types/', 'clinical_testtype')
+        self.assertEqual(queries, 1)
+        second, queries = self.get('test-types/', 'clinical_testtype')
+        self.assertEqual((second, queries), (first, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TestType.objects.create(name='OAE', cost=200)
+            # Not bumped before commit: a read now must not re-cache the old rows as new
+            self.assertEqual(self.get('test-types/', 'clinical_testtype'), (first, 0))
+        third, queries = self.get('test-types/', 'clinical_testtype')
+        self.assertEqual(queries, 1)
+        self.assertEqual([t['name'] for t in third['data']], ['OAE', 'PTA'])
+
+    @override_settings(LOCAL_CACHE_TIMEOUT=0)
+    def test_local_memory_entries_are_short_lived(self):
+        TestType.objects.create(name='PTA', cost=100)
+        self.get('test-types/', 'clinical_testtype')
+        self.assertEqual(self.get('test-types/', 'clinical_testtype')[1], 1)
+        with self.settings(CACHES=SHARED_CACHES):
+            cache.clear()
+            self.get('test-types/', 'clinical_testtype')
+            self.assertEqual(self.get('test-types/', 'clinical_testtype')[1], 0)
+
+    def test_dropdowns_cached_per_parameters_until_changed(self):
+        brand = Brand.objects.create(category='Hearing Aid', name='Phonak')
+        ModelType.objects.create(brand=brand, name='Audeo')
+        url = 'inventory/dropdowns/?category=Hearing Aid&brand=Phonak'
+        first, queries = self.get(url, 'clinical_modeltype')
+        self.assertEqual([m['brand_name'] for m in first['models']], ['Phonak'])
+        self.assertEqual(queries, 1)
+        self.assertEqual(self.get(url, 'clinical_modeltype'), (first, 0))
+        # another parameter set has its own entry
+        self.assertEqual(self.get('inventory/dropdowns/?category=Hearing Aid', 'clinical_brand')[1], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.name = 'Phonak AG'
+            brand.save()
+        self.assertEqual(self.get(url, 'clinical_modeltype'), ({'models': []}, 1))
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        admin = User.objects.create(
+            email='admin@example.com', name='Admin', clinic=clinic, role=Role.objects.create(name='Admin'),
+            is_approved=True,
+        )
+        seed_clinic_data(clinic, admin, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def export(self, url):
+        response = self.client.get(API_PREFIX + url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        return response
+
+    def test_clinic_report_csv_streams_all_sections(self):
+        response = self.export('admin/clinic-report/?format=csv')
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+        json_data = self.client.get(API_PREFIX + 'admin/clinic-report/').json()['data']
+        header_rows = [row for row in rows if row[0] == 'section']
+        self.assertEqual(len(header_rows), 4)
+        for section in ('patients', 'new_tests', 'trials', 'bookings'):
+            self.assertEqual(sum(row[0] == section for row in rows), len(json_data[section]))
+        self.assertEqual(sum(row[0] == 'patients' for row in rows), 6)
+
+    def test_clinic_report_ndjson(self):
+        response = self.export('admin/clinic-report/?format=ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sum(r['section'] == 'trials' for r in records), 3)
+        self.assertIn('patient__phone_primary', next(r for r in records if r['section'] == 'patients'))
+
+    @unittest.skipUnless(__import__('importlib').util.find_spec('openpyxl'), 'openpyxl not installed')
+    def test_revenue_report_xlsx(self):
+        from openpyxl import load_workbook
+
+        response = self.export('admin/revenue-reports/?format=xlsx')
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['revenue', 'staff_revenue'])
+        rows = list(workbook['revenue'].values)
+        self.assertEqual(rows[0], ('clinic__name', 'total_revenue', 'total_bills', 'avg_bill_amount'))
+        self.assertEqual(rows[1][0], 'Main')
+
+    def test_async_iteration_streams_without_buffering(self):
+        response = self.export('admin/clinic-report/?format=ndjson')
+
+        async def read():
+            return [chunk async for chunk in response]
+
+        with warnings.catch_warnings(), mock.patch('clinical.report_export.EXPORT_STREAM_CHUNK_BYTES', 100):
+            warnings.simplefilter('error')  # Django warns when it falls back to sync_to_async(list)
+            chunks = async_to_sync(read)()
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(json.loads(line)['section'] == 'trials' for line in b''.join(chunks).splitlines()), 3)
+
+    def test_json_report_skips_exists_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(API_PREFIX + 'admin/clinic-report/')
+        self.assertFalse(any('LIMIT 1' in q['sql'] for q in ctx.captured_queries))
+
+
+class RevenueRollupTests(TestCase):
+    URL = API_PREFIX + 'admin/revenue-reports/'
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.receptionist = User.objects.create(
+            email='r@example.com', name='Reception', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        self.admin = User.objects.create(
+            email='admin@example.com', name='Admin', role=Role.objects.create(name='Admin'), is_approved=True,
+        )
+        self.patient = Patient.objects.create(clinic=self.clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        self.client = APIClient()
+
+    def make_bill(self, days_ago, costs, final_amount):
+        visit = PatientVisit.objects.create(clinic=self.clinic, patient=self.patient, visit_type='New')
+        bill = Bill.objects.create(
+            visit=visit, clinic=self.clinic, created_by=self.receptionist, final_amount=Decimal(final_amount),
+        )
+        for item_type, cost in costs:
+            BillItem.objects.create(bill=bill, item_type=item_type, description=item_type, cost=Decimal(cost))
+        Bill.objects.filter(pk=bill.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return bill
+
+    def mark_paid(self, bill):
+        self.client.force_authenticate(self.receptionist)
+        response = self.client.post(API_PREFIX + f'mark-bill-paid/{bill.id}/', {'payment_method': 'CASH'})
+        self.assertEqual(response.status_code, 200)
+
+    def report(self, report_type, start, end):
+        self.client.force_authenticate(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.URL, {
+                'type': report_type, 'start_date': start.isoformat(), 'end_date': end.isoformat(),
+            })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data'], ctx.captured_queries
+
+    def rollup_rows(self):
+        return sorted(DailyRevenueRollup.objects.values_list('day', 'clinic_id', 'staff_id', 'item_type', 'entry_count', 'revenue'))
+
+    def test_marking_paid_updates_rollup_and_report(self):
+        old = self.make_bill(3, [('Purchase', '500'), ('Part Used in Service', '100')], '600')
+        older = self.make_bill(3, [('Purchase', '300')], '300')
+        today_bill = self.make_bill(0, [('Purchase', '2000')], '2000')
+        self.make_bill(2, [('Purchase', '999')], '999')  # never paid
+        for bill in (old, older, today_bill):
+            self.mark_paid(bill)
+
+        day = self.today - timedelta(days=3)
+        self.assertEqual(self.rollup_rows(), sorted([
+            (day, self.clinic.id, self.receptionist.id, '', 2, Decimal('900.00')),
+            (day, self.clinic.id, self.receptionist.id, 'Part Used in Service', 1, Decimal('100.00')),
+            (day, self.clinic.id, self.receptionist.id, 'Purchase', 2, Decimal('800.00')),
+            (self.today, self.clinic.id, self.receptionist.id, '', 1, Decimal('2000.00')),
+            (self.today, self.clinic.id, self.receptionist.id, 'Purchase', 1, Decimal('2000.00')),
+        ]))
+
+        # Closed days come from the rollup alone
+        data, queries = self.report('clinic', day, day)
+        self.assertFalse(any('clinical_bill' in q['sql'] for q in queries))
+        self.assertEqual(data['revenue_data'], [
+            {'clinic__name': 'Main', 'total_revenue': '900.00', 'total_bills': 2, 'avg_bill_amount': '450.00'},
+        ])
+
+        # Ranges reaching today add the live bills
+        data, _ = self.report('category', day, self.today)
+        self.assertEqual(
+            [(row['item_type'], row['total_revenue'], row['total_items']) for row in data['revenue_data']],
+            [('Purchase', '2800.00', 3), ('Part Used in Service', '100.00', 1)],
+        )
+        self.assertEqual(data['staff_revenue_data'], [{
+            'created_by__name': 'Reception', 'created_by__id': self.receptionist.id,
+            'total_revenue': '2900.00', 'total_bills': 3, 'avg_bill_amount': '966.67',
+        }])
+
+    def test_rebuild_matches_incremental_rollup_and_delete_is_subtracted(self):
+        bills = [self.make_bill(days, [('Purchase', '500'), ('Part Used in Service', '100')], '600') for days in (1, 1, 5)]
+        for bill in bills:
+            self.mark_paid(bill)
+        incremental = self.rollup_rows()
+
+        self.assertEqual(rebuild_rollup(), len(incremental))
+        self.assertEqual(self.rollup_rows(), incremental)
+
+        bills[0].delete()
+        day = self.today - timedelta(days=1)
+        self.assertEqual(
+            DailyRevenueRollup.objects.get(day=day, item_type='').revenue, Decimal('600.00')
+        )
+
+
+    def test_stale_copies_saved_as_paid_count_once(self):
+        bill = self.make_bill(2, [('Purchase', '500')], '500')
+        first, second = Bill.objects.get(pk=bill.pk), Bill.objects.get(pk=bill.pk)
+        for copy in (first, second):
+            copy.payment_status = 'Paid'
+            copy.save()
+        second.refresh_from_db()
+        second.save()
+        self.assertEqual(DailyRevenueRollup.objects.get(item_type='').entry_count, 1)
+
+        self.client.force_authenticate(self.receptionist)
+        response = self.client.post(API_PREFIX + f'mark-bill-paid/{bill.id}/', {'payment_method': 'CASH'})
+        self.assertEqual(response.status_code, 400)
+
+        first.payment_status = 'Pending'
+        first.save()
+        self.assertEqual(DailyRevenueRollup.objects.get(item_type='').entry_count, 0)
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='C', address='Addr', phone='1')
+        other = Clinic.objects.create(name='O', address='Addr', phone='2')
+        user = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        self.patients = {}
+        for clinic, name, phone in [
+            (self.clinic, 'John Smith', '+91 98765-43210'),
+            (self.clinic, 'Johnny Bravo', '9123401234'),
+            (self.clinic, 'Ann Marie', '9000012345'),
+            (other, 'John Other', '9876543210'),
+        ]:
+            patient = Patient.objects.create(clinic=clinic, name=name, gender='Male', phone_primary=phone, city='Pune')
+            PatientVisit.objects.create(clinic=clinic, patient=patient, visit_type='New', status='Pending for Service')
+            self.patients[name] = patient
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def names(self, url):
+        response = self.client.get(API_PREFIX + url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()['data']
+        return [row.get('name') or row.get('patient_name') for row in data]
+
+    def test_phone_digits_follow_phone_primary(self):
+        patient = self.patients['John Smith']
+        self.assertEqual(patient.phone_digits, '919876543210')
+        patient.phone_primary = '(020) 555-1234'
+        patient.save(update_fields=['phone_primary'])
+        patient.refresh_from_db()
+        self.assertEqual(patient.phone_digits, '0205551234')
+
+    def test_typeahead_is_ranked_and_limited_to_the_clinic(self):
+        self.assertEqual(self.names('patient/search/?q=john'), ['John Smith', 'Johnny Bravo'])
+        self.assertEqual(self.names('patient/search/?q=98765 43210'), ['John Smith'])
+        # phone ending with the digits before numbers merely containing them
+        self.assertEqual(self.names('patient/search/?q=1234'), ['Johnny Bravo', 'Ann Marie'])
+        self.assertEqual(self.names('patient/search/?q=jo'), ['John Smith', 'Johnny Bravo'])
+        self.assertEqual(self.names('patient/search/?q=john&limit=1'), ['John Smith'])
+        self.assertEqual(self.names('patient/search/?q=ma'), [])  # short terms match the start of the name
+        self.assertEqual(self.names('patient/search/'), [])
+
+    def test_list_views_search_name_or_normalized_phone(self):
+        self.assertEqual(self.names('patient/flat-list/?search=543210'), ['John Smith'])
+        self.assertEqual(self.names('patient/flat-list/?search=john 1234'), ['Johnny Bravo'])
+        self.assertEqual(self.names('patient/service-list/?search=9876543210'), ['John Smith'])
+        self.assertEqual(self.names('patient/service-list/?search=marie'), ['Ann Marie'])
+        response = self.client.get(API_PREFIX + 'patient/visit/?search=98765-43210')
+        self.assertEqual([row['patient_name'] for row in response.json()['data']], ['John Smith'])
+
+
+class InventoryItemListTests(TestCase):
+    URL = API_PREFIX + 'inventory/items/'
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        user = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def item(self, quantity, serials_in_stock=None, use_in_trial=False):
+        item = InventoryItem.objects.create(
+            clinic=self.clinic, category='Accessories', product_name=f'Item {InventoryItem.objects.count()}',
+            stock_type='Non-Serialized' if serials_in_stock is None else 'Serialized',
+            quantity_in_stock=quantity, use_in_trial=use_in_trial, is_approved=True,
+        )
+        for i in range(serials_in_stock or 0):
+            InventorySerial.objects.create(
+                inventory_item=item, serial_number=f'S-{item.id}-{i}', status='In Stock',
+            )
+        InventorySerial.objects.create(inventory_item=item, serial_number=f'S-{item.id}-sold', status='Sold')
+        return item
+
+    def test_status_counts_and_filter_from_the_database(self):
+        self.item(0)                       # Critical
+        self.item(3)                       # Low
+        self.item(9)                       # Good
+        self.item(9, serials_in_stock=1)   # Critical: only one serial is in stock
+        self.item(0, serials_in_stock=6, use_in_trial=True)  # Good
+
+        data = self.client.get(self.URL).json()
+        self.assertEqual((data['total_count'], data['low_count'], data['critical_count']), (5, 1, 2))
+        serialized = next(row for row in data['data'] if row['quantity_in_stock'] == 1)
+        self.assertEqual(serialized['status'], 'Critical')
+
+        critical = self.client.get(self.URL, {'status': 'critical'}).json()
+        self.assertEqual(critical['totalItems'], 2)
+        self.assertEqual({row['status'] for row in critical['data']}, {'Critical'})
+
+        trial = self.client.get(self.URL, {'use_in_trial': 'true'}).json()
+        self.assertEqual((trial['total_count'], trial['low_count'], trial['critical_count']), (1, 0, 0))
+
+    def test_page_is_rendered_in_constant_queries(self):
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(self.URL, {'pageSize': 50}).status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.item(2, serials_in_stock=2)
+        before = queries()
+        for i in range(5):
+            self.item(i, serials_in_stock=i)
+        self.assertEqual(queries(), before)
+
+
+class SerialCountTests(TestCase):
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.item = self.new_item()
+
+    def new_item(self):
+        return InventoryItem.objects.create(
+            clinic=self.clinic, category='Hearing Aid', product_name=f'Device {InventoryItem.objects.count()}',
+            stock_type='Serialized', is_approved=True,
+        )
+
+    def counts(self, item=None):
+        rows = InventorySerialCount.objects.filter(inventory_item=item or self.item, count__gt=0)
+        return dict(rows.values_list('status', 'count'))
+
+    def serial(self, status='In Stock', item=None):
+        return InventorySerial.objects.create(
+            inventory_item=item or self.item, serial_number=f'SN-{InventorySerial.objects.count()}', status=status,
+        )
+
+    def test_save_and_delete_keep_counters_current(self):
+        first, second = self.serial(), self.serial()
+        self.serial('Sold')
+        self.assertEqual(self.counts(), {'In Stock': 2, 'Sold': 1})
+
+        loaded = InventorySerial.objects.get(pk=first.pk)
+        loaded.status = 'Trial'
+        loaded.save()
+        self.assertEqual(self.counts(), {'In Stock': 1, 'Sold': 1, 'Trial': 1})
+
+        other = self.new_item()
+        second.inventory_item = other
+        second.save(update_fields=['inventory_item'])
+        self.assertEqual(self.counts(), {'Sold': 1, 'Trial': 1})
+        self.assertEqual(self.counts(other), {'In Stock': 1})
+
+        second.save()  # unchanged: counted once
+        loaded.delete()
+        self.assertEqual(self.counts(), {'Sold': 1})
+        self.assertEqual(self.counts(other), {'In Stock': 1})
+
+    def test_bulk_helpers_count_rows(self):
+        create_serials([
+            InventorySerial(inventory_item=self.item, serial_number=f'BULK-{i}', status='In Stock') for i in range(4)
+        ])
+        other = self.new_item()
+        moved = update_serials(
+            InventorySerial.objects.filter(serial_number__in=['BULK-0', 'BULK-1']), inventory_item=other,
+        )
+        self.assertEqual(moved, 2)
+        self.assertEqual(self.counts(), {'In Stock': 2})
+        self.assertEqual(self.counts(other), {'In Stock': 2})
+
+    def test_reconcile_fixes_drift_in_chunks(self):
+        for i in range(3):
+            self.serial()
+        other = self.new_item()
+        self.serial('Sold', item=other)
+        # drift: raw updates bypass the counters, quantity_in_stock was never maintained
+        InventorySerial.objects.filter(inventory_item=self.item).update(status='Lost')
+        InventorySerialCount.objects.filter(inventory_item=other).delete()
+
+        dry_run = reconcile_serial_counts(chunk_size=1, fix=False)
+        self.assertEqual(dry_run, {'items': 2, 'counters_fixed': 3, 'quantities_fixed': 0})
+        self.assertEqual(self.counts(), {'In Stock': 3})
+
+        InventoryItem.objects.filter(pk=other.pk).update(quantity_in_stock=5)
+        out = io.StringIO()
+        call_command('reconcile_serial_counts', '--chunk-size', '1', stdout=out)
+        self.assertIn('Fixed 3 counters, 1 quantities', out.getvalue())
+        self.assertEqual(self.counts(), {'Lost': 3})
+        self.assertEqual(self.counts(other), {'Sold': 1})
+        other.refresh_from_db()
+        self.assertEqual(other.quantity_in_stock, 0)
+        self.assertEqual(reconcile_serial_counts(), {'items': 2, 'counters_fixed': 0, 'quantities_fixed': 0})
+
+    def test_inventory_lists_read_the_counter(self):
+        for i in range(3):
+            self.serial()
+        InventorySerialCount.objects.filter(inventory_item=self.item, status='In Stock').update(count=7)
+        item = InventoryItemSerializer.setup_eager_loading(InventoryItem.objects.filter(pk=self.item.pk)).get()
+        self.assertEqual((item.stock_quantity, item.stock_status), (7, 'Good'))
+
+
+class TrialDevicesInUseTests(TestCase):
+    URL = API_PREFIX + 'inventory/trial-devices-in-use/'
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.user = User.objects.create(email='a@example.com', name='A', clinic=self.clinic, is_approved=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_latest_trial_per_serial_paginated_in_constant_queries(self):
+        def fetch(**params):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(self.URL, params)
+            self.assertEqual(response.status_code, 200)
+            return response.json(), len(ctx.captured_queries)
+
+        patient = seed_clinic_data(self.clinic, self.user, 2)[0]
+        serial = InventorySerial.objects.filter(status='Use in Trial').order_by('id').first()
+        self.assertIsNotNone(Trial.objects.get(serial_number=serial.serial_number).inventory_serial_id)
+        # a later trial of the same device takes over the assignment
+        later = Trial.objects.create(
+            clinic=self.clinic, visit=patient.visits.order_by('id').last(), serial_number=serial.serial_number,
+            assigned_patient=patient, ear_fitted='Left',
+        )
+        data, queries = fetch()
+        self.assertEqual(data['totalItems'], 2)
+        device = next(row for row in data['data'] if row['serial_number'] == serial.serial_number)
+        self.assertEqual(device['trial_assignment']['trial_id'], later.id)
+        self.assertEqual(device['product_info']['brand'], 'Phonak')
+
+        seed_clinic_data(self.clinic, self.user, 3)
+        data, more_queries = fetch(pageSize=2, page=2)
+        self.assertEqual((data['totalItems'], len(data['data'])), (5, 2))
+        self.assertEqual(more_queries, queries)
+
+    def test_clinic_filter(self):
+        other = Clinic.objects.create(name='Other', address='Addr', phone='2')
+        seed_clinic_data(self.clinic, self.user, 1)
+        seed_clinic_data(other, self.user, 2)
+        self.assertEqual(self.client.get(self.URL, {'clinic_id': other.id}).json()['totalItems'], 2)
+        self.assertEqual(self.client.get(self.URL).json()['totalItems'], 3)
+
+
+class StaffPerformanceTests(TestCase):
+    URL = API_PREFIX + 'admin/trial-performance/'
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        audiologist_role = Role.objects.create(name='Audiologist')
+        self.audiologists = [
+            User.objects.create(
+                email=f'a{i}@example.com', name=f'A{i}', clinic=self.clinic, role=audiologist_role, is_approved=True,
+            )
+            for i in range(2)
+        ]
+        self.receptionist = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.receptionist)
+
+    def seed(self, audiologist, n):
+        seed_clinic_data(self.clinic, audiologist, n)
+        # every visit paid, the follow-ups count as tests, one trial booked
+        visits = PatientVisit.objects.filter(seen_by=audiologist)
+        Bill.objects.filter(visit__in=visits).update(payment_status='Paid', final_amount=Decimal('250.00'))
+        visits.filter(status='Follow up').update(visit_type='New Test')
+        trial = Trial.objects.filter(visit__seen_by=audiologist).first()
+        Trial.objects.filter(pk=trial.pk).update(trial_decision='BOOK - Device Allocated')
+
+    def get(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def test_summary_for_several_staff(self):
+        self.seed(self.audiologists[0], 4)
+        self.seed(self.audiologists[1], 2)
+        staff_ids = ','.join(str(user.id) for user in [*self.audiologists, self.receptionist])
+
+        with self.assertNumQueries(5):  # staff + 2 audiologist + 2 reception aggregates
+            data = self.get(staff_id=staff_ids, detail='none')
+
+        first, second, reception = data
+        self.assertEqual([row['staff_id'] for row in data], [*(a.id for a in self.audiologists), self.receptionist.id])
+        self.assertEqual(
+            {key: first[key] for key in ('test_count', 'patient_seen', 'trial_count', 'trials_booked')},
+            {'test_count': 4, 'patient_seen': 4, 'trial_count': 4, 'trials_booked': 1},
+        )
+        self.assertEqual(first['trial_booking_ratio'], 25.0)
+        self.assertEqual(second['trial_booking_ratio'], 50.0)
+        self.assertNotIn('test_details', first)
+        self.assertEqual(reception['pending_service'], 0)
+        self.assertEqual(reception['calls_made_for_followup'], 0)
+
+    def test_repeated_staff_id_params(self):
+        data = self.get(staff_id=[self.audiologists[0].id, self.audiologists[1].id], detail='none')
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[1]['test_count'], 0)
+
+    def test_full_details_include_costs(self):
+        self.seed(self.audiologists[0], 3)
+        staff = self.get(staff_id=self.audiologists[0].id)[0]
+
+        self.assertEqual(len(staff['test_details']), 3)
+        self.assertEqual({visit['cost'] for visit in staff['test_details']}, {250.0})
+        self.assertEqual(len(staff['trial_details']), 3)
+        self.assertEqual(staff['trial_details'][0]['cost'], 100.0)
+        self.assertEqual(staff['trial_details'][0]['device_brand'], 'Phonak')
+        self.assertEqual(len(staff['booked_trials_details']), 1)
+        self.assertEqual(len(staff['patient_seen_details']), 3)
+
+    def test_paginated_details_use_constant_queries(self):
+        def measure():
+            with CaptureQueriesContext(connection) as ctx:
+                staff = self.get(staff_id=self.audiologists[0].id, detail='page', pageSize=2)[0]
+            return staff, len(ctx.captured_queries)
+
+        self.seed(self.audiologists[0], 3)
+        staff, queries = measure()
+        self.assertEqual(staff['test_details']['totalItems'], 3)
+        self.assertEqual(staff['test_details']['totalPages'], 2)
+        self.assertEqual(len(staff['test_details']['data']), 2)
+        self.assertEqual(staff['patient_seen_details']['nextPage'], 2)
+
+        self.seed(self.audiologists[0], 3)
+        self.assertEqual(measure()[1], queries)
+
+    def test_unknown_staff_and_bad_params(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'staff_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'staff_id': 999999}).status_code, 404)
+        self.assertEqual(
+            self.client.get(self.URL, {'staff_id': self.receptionist.id, 'detail': 'all'}).status_code, 400,
+        )
+
+
+class FollowupStatusTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        self.patient = Patient.objects.create(clinic=self.clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+
+    def make_trial(self, status, **trial_fields):
+        visit = PatientVisit.objects.create(clinic=self.clinic, patient=self.patient, visit_type='New', status=status)
+        Trial.objects.create(clinic=self.clinic, visit=visit, assigned_patient=self.patient, **trial_fields)
+        return visit
+
+    def test_transitions_and_summary(self):
+        ended = [self.make_trial('Trial Active', trial_end_date=self.today) for _ in range(3)]
+        due = [self.make_trial('Decision Pending', followup_date=self.today) for _ in range(2)]
+        untouched = [
+            self.make_trial('Trial Active', trial_end_date=date(2000, 1, 1)),
+            self.make_trial('Test pending', followup_date=self.today),
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            summary = update_followup_statuses(self.today)
+
+        # Set-based: a fixed number of statements regardless of the number of trials
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+        self.assertEqual(summary['transitions'], {
+            'trial_ended': {'trials': 3, 'visits': 3},
+            'followup_due': {'visits': 2},
+        })
+        self.assertEqual(summary['total_visits'], 5)
+        self.assertEqual(summary['date'], self.today.isoformat())
+        self.assertIn('duration_ms', summary)
+
+        for visit in ended:
+            visit.refresh_from_db()
+            self.assertEqual((visit.status, visit.status_note), ('Follow up', 'Trial ended, Follow up needed'))
+            self.assertEqual(visit.trial_set.get().trial_decision, 'Follow up')
+        for visit in due:
+            visit.refresh_from_db()
+            self.assertEqual(visit.status, 'Follow up')
+        self.assertEqual(
+            [PatientVisit.objects.get(pk=v.pk).status for v in untouched], ['Trial Active', 'Test pending']
+        )
+
+        # Running again is a no-op
+        self.assertEqual(update_followup_statuses(self.today)['total_visits'], 0)
+
+
+class KeysetPaginationTests(TestCase):
+    URL = API_PREFIX + 'patient/visit/'
+
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name='C', address='Addr', phone='1')
+        user = User.objects.create(
+            email='r@example.com', name='R', clinic=self.clinic, role=Role.objects.create(name='Reception'),
+            is_approved=True,
+        )
+        patient = Patient.objects.create(clinic=self.clinic, name='P', gender='Male', phone_primary='9000000000', city='Pune')
+        visits = [
+            PatientVisit.objects.create(clinic=self.clinic, patient=patient, visit_type='New', status='Pending for Service')
+            for _ in range(23)
+        ]
+        # Several visits share a created_at so the id tie-break matters
+        start = timezone.now()
+        for i, visit in enumerate(visits):
+            PatientVisit.objects.filter(pk=visit.pk).update(created_at=start - timedelta(minutes=i // 3))
+        self.expected = list(PatientVisit.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def get(self, query):
+        response = self.client.get(self.URL + query)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, body):
+        return [row['visit_id'] for row in body['data']]
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        body = self.get('?cursor=&pageSize=5')
+        self.assertEqual(body['previousPage'], -1)
+        self.assertEqual((body['totalItems'], body['totalPages']), (23, 5))
+        pages = [self.ids(body)]
+        while body['nextPage'] != -1:
+            body = self.get(f"?cursor={body['nextPage']}&pageSize=5")
+            pages.append(self.ids(body))
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual(len(pages[-1]), 3)
+
+        for page in reversed(pages[:-1]):
+            body = self.get(f"?cursor={body['previousPage']}&pageSize=5")
+            self.assertEqual(self.ids(body), page)
+        self.assertEqual(body['previousPage'], -1)
+
+    def test_page_numbers_are_unchanged_without_the_opt_ins(self):
+        body = self.get('?page=2&pageSize=5')
+        self.assertEqual(self.ids(body), self.expected[5:10])
+        self.assertEqual((body['nextPage'], body['previousPage'], body['totalItems'], body['totalPages']), (3, 1, 23, 5))
+
+    def test_count_modes(self):
+        body = self.get('?page=5&pageSize=5&count=none')
+        self.assertEqual(self.ids(body), self.expected[20:])
+        self.assertEqual((body['nextPage'], body['previousPage'], body['totalItems'], body['totalPages']), (-1, 4, -1, -1))
+        body = self.get('?cursor=&pageSize=5&count=estimate')
+        self.assertIsInstance(body['totalItems'], int)
+        self.assertEqual(self.ids(body), self.expected[:5])
+        self.assertEqual(self.client.get(self.URL + '?count=maybe').status_code, 400)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get(self.URL + '?cursor=not-a-cursor').status_code, 404)
+
+    def test_deep_cursor_page_costs_the_same_queries(self):
+        first = self.get('?cursor=&pageSize=2&count=none')
+        cursor = first['nextPage']
+        for _ in range(8):
+            cursor = self.get(f'?cursor={cursor}&pageSize=2&count=none')['nextPage']
+        with CaptureQueriesContext(connection) as shallow:
+            self.get('?cursor=&pageSize=2&count=none')
+        with CaptureQueriesContext(connection) as deep:
+            body = self.get(f'?cursor={cursor}&pageSize=2&count=none')
+        self.assertEqual(self.ids(body), self.expected[18:20])
+        self.assertEqual(len(deep), len(shallow))
+        self.assertNotIn('OFFSET', deep.captured_queries[-1]['sql'].upper())
+
+
+class InventoryTransferTests(TestCase):
+    URL = API_PREFIX + 'inventory/transfer/'
+
+    def setUp(self):
+        self.main = Clinic.objects.create(name='Main', address='Addr', phone='1', is_main_inventory=True)
+        self.branch = Clinic.objects.create(name='Branch', address='Addr', phone='2')
+        admin = User.objects.create(
+            email='admin@example.com', name='Admin', clinic=self.main, role=Role.objects.create(name='Admin'),
+            is_approved=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def stock(self, count, quantity=10, serials=0):
+        items = []
+        for i in range(count):
+            item = InventoryItem.objects.create(
+                clinic=self.main, category='Accessories', product_name=f'Item {InventoryItem.objects.count()}',
+                stock_type='Serialized' if serials else 'Non-Serialized',
+                quantity_in_stock=serials or quantity, is_approved=True,
+            )
+            for n in range(serials):
+                InventorySerial.objects.create(inventory_item=item, serial_number=f'T-{item.id}-{n}', status='In Stock')
+            items.append(item)
+        return items
+
+    def transfer(self, products):
+        return self.client.post(self.URL, {'to_clinic_id': self.branch.id, 'products': products}, format='json')
+
+    def test_mixed_transfer_creates_then_reuses_destination_items(self):
+        plain, = self.stock(1, quantity=10)
+        serialized, = self.stock(1, serials=3)
+
+        response = self.transfer([
+            {'source_inventory_id': plain.id, 'quantity': 4},
+            {'source_inventory_id': serialized.id, 'serial_numbers': [f'T-{serialized.id}-0', f'T-{serialized.id}-1']},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['transferred_count'], 2)
+        self.transfer([{'source_inventory_id': plain.id, 'quantity': 1}])
+
+        dest_plain = InventoryItem.objects.get(clinic=self.branch, sku=plain.sku)
+        dest_serialized = InventoryItem.objects.get(clinic=self.branch, sku=serialized.sku)
+        plain.refresh_from_db()
+        serialized.refresh_from_db()
+        self.assertEqual((plain.quantity_in_stock, dest_plain.quantity_in_stock), (5, 5))
+        self.assertEqual((serialized.quantity_in_stock, dest_serialized.quantity_in_stock), (1, 2))
+        self.assertEqual(dest_plain.master_item_id, plain.id)
+        self.assertEqual(dest_serialized.serials.count(), 2)
+        self.assertEqual(
+            InventorySerialCount.objects.get(inventory_item=dest_serialized, status='In Stock').count, 2,
+        )
+        self.assertEqual(InventorySerialCount.objects.get(inventory_item=serialized, status='In Stock').count, 1)
+        self.assertEqual(InventoryTransfer.objects.count(), 3)
+
+    def test_invalid_line_rolls_back_the_whole_transfer(self):
+        first, second = self.stock(2, quantity=3)
+        serialized, = self.stock(1, serials=1)
+
+        for products in (
+            [{'source_inventory_id': first.id, 'quantity': 2}, {'source_inventory_id': second.id, 'quantity': 5}],
+            [{'source_inventory_id': first.id, 'quantity': 2},
+             {'source_inventory_id': serialized.id, 'serial_numbers': ['missing']}],
+        ):
+            response = self.transfer(products)
+            self.assertEqual(response.status_code, 400)
+
+        first.refresh_from_db()
+        self.assertEqual(first.quantity_in_stock, 3)
+        self.assertFalse(InventoryItem.objects.filter(clinic=self.branch).exists())
+        self.assertFalse(InventoryTransfer.objects.exists())
+
+    def test_string_source_ids(self):
+        item, = self.stock(1, quantity=5)
+
+        response = self.transfer([
+            {'source_inventory_id': str(item.id), 'quantity': 1},
+            {'source_inventory_id': item.id, 'quantity': '2'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        item.refresh_from_db()
+        self.assertEqual(item.quantity_in_stock, 2)
+
+        response = self.transfer([{'source_inventory_id': 'abc', 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_statement_count_does_not_grow_with_products(self):
+        def queries(items):
+            products = [{'source_inventory_id': item.id, 'quantity': 1} for item in items]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.transfer(products).status_code, 200)
+            return len(ctx.captured_queries)
+
+        few = queries(self.stock(2))
+        self.assertEqual(queries(self.stock(40)), few)
+        # and again when the destination items already exist
+        self.assertLessEqual(queries(InventoryItem.objects.filter(clinic=self.main)), few)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs row-level locking (PostgreSQL)')
+class InventoryTransferConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+
+    def test_parallel_transfers_cannot_oversell(self):
+        main = Clinic.objects.create(name='Main', address='Addr', phone='1', is_main_inventory=True)
+        branches = [
+            Clinic.objects.create(name=f'Branch {i}', address='Addr', phone=str(i)) for i in range(self.THREADS)
+        ]
+        user = User.objects.create(email='admin@example.com', name='Admin', clinic=main, is_approved=True)
+        plain = InventoryItem.objects.create(
+            clinic=main, category='Accessories', product_name='Batteries', quantity_in_stock=10, is_approved=True,
+        )
+        device = InventoryItem.objects.create(
+            clinic=main, category='Hearing Aid', product_name='Device', stock_type='Serialized', is_approved=True,
+        )
+        InventorySerial.objects.create(inventory_item=device, serial_number='ONLY-ONE', status='In Stock')
+
+        results = []
+        barrier = threading.Barrier(self.THREADS)
+
+        # Half the threads race for 3 units of 10, the other half for the same serial
+        requests = [
+            [{'source_inventory_id': plain.id, 'quantity': 3}],
+            [{'source_inventory_id': device.id, 'serial_numbers': ['ONLY-ONE']}],
+        ]
+
+        def worker(index, branch):
+            try:
+                barrier.wait()
+                transfer_inventory(branch, requests[index % 2], user)
+                results.append('ok')
+            except TransferError:
+                results.append('rejected')
+            except Exception as exc:
+                results.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=pair) for pair in enumerate(branches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(map(str, results)), ['ok'] * 4 + ['rejected'] * (self.THREADS - 4))
+        plain.refresh_from_db()
+        self.assertEqual(plain.quantity_in_stock, 1)
+        received = InventoryItem.objects.filter(clinic__in=branches, sku=plain.sku)
+        self.assertEqual(sum(item.quantity_in_stock for item in received), 9)
+        serial = InventorySerial.objects.select_related('inventory_item').get(serial_number='ONLY-ONE')
+        self.assertIn(serial.inventory_item.clinic_id, [branch.id for branch in branches[1::2]])
+        self.assertEqual(InventorySerialCount.objects.get(inventory_item=serial.inventory_item).count, 1)
+        self.assertFalse(InventorySerialCount.objects.filter(inventory_item=device, count__gt=0).exists())
+
+
+@unittest.skipUnless(mock_aws, 'needs moto')
+@override_settings(
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1',
+    AWS_STORAGE_BUCKET_NAME='test-reports', AWS_S3_CUSTOM_DOMAIN='test-reports.s3.amazonaws.com',
+    AWS_S3_ENDPOINT_URL=None, REPORT_UPLOAD_MAX_BYTES=1024,
+)
+class ReportStorageTests(TestCase):
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        storage.get_client.cache_clear()
+        self.addCleanup(storage.get_client.cache_clear)
+        self.s3 = storage.get_client()
+        self.s3.create_bucket(Bucket='test-reports')
+
+        clinic = Clinic.objects.create(name='C', address='Addr', phone='1')
+        user = User.objects.create(email='a@example.com', name='A', clinic=clinic, is_approved=True)
+        patient = Patient.objects.create(clinic=clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        visit = PatientVisit.objects.create(clinic=clinic, patient=patient, visit_type='New', seen_by=user)
+        self.performed = VisitTestPerformed.objects.create(visit=visit)
+        self.report = TestUpload.objects.create(visit=self.performed, report_type='BERA')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def presign(self, **data):
+        return self.client.post(
+            f'{API_PREFIX}report-upload/{self.report.id}/presign/',
+            {'filename': 'report.pdf', 'content_type': 'application/pdf', **data}, format='json',
+        )
+
+    def complete(self, token, report=None):
+        return self.client.post(
+            f'{API_PREFIX}report-upload/{(report or self.report).id}/complete/', {'upload_token': token}, format='json',
+        )
+
+    def test_client_is_created_once_per_process(self):
+        self.assertIs(storage.get_client(), self.s3)
+
+    def test_presigned_post_upload_is_recorded(self):
+        upload = self.presign().json()['data']
+        self.assertEqual(upload['method'], 'POST')
+        self.assertTrue(upload['key'].startswith('test_reports/BERA/'))
+
+        sent = requests.post(upload['url'], data=upload['fields'], files={'file': ('report.pdf', b'%PDF report')})
+        self.assertLess(sent.status_code, 300, sent.text)
+        response = self.complete(upload['upload_token'])
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.file_path, f"https://test-reports.s3.amazonaws.com/{upload['key']}")
+        stored = self.s3.get_object(Bucket='test-reports', Key=upload['key'])
+        self.assertEqual((stored['Body'].read(), stored['ContentType']), (b'%PDF report', 'application/pdf'))
+
+    def test_presigned_put_upload_is_recorded(self):
+        upload = self.presign(method='put').json()['data']
+        sent = requests.put(upload['url'], data=b'%PDF report', headers=upload['headers'])
+        self.assertLess(sent.status_code, 300, sent.text)
+
+        self.assertEqual(self.complete(upload['upload_token']).status_code, 200)
+        self.report.refresh_from_db()
+        self.assertTrue(self.report.file_path.endswith(upload['key']))
+
+    def test_bad_confirmations_are_rejected(self):
+        self.assertEqual(self.presign(method='get').status_code, 400)
+        upload = self.presign(method='put').json()['data']
+        other = TestUpload.objects.create(visit=self.performed, report_type='PTA')
+
+        self.assertEqual(self.complete(upload['upload_token']).status_code, 400)  # nothing uploaded yet
+        self.s3.put_object(Bucket='test-reports', Key=upload['key'], Body=b'x' * 2048)
+        self.assertEqual(self.complete(upload['upload_token'], report=other).status_code, 400)
+        self.assertEqual(self.complete('forged').status_code, 400)
+        self.assertEqual(self.complete(upload['upload_token']).status_code, 400)  # over REPORT_UPLOAD_MAX_BYTES
+
+        self.assertFalse(self.s3.list_objects_v2(Bucket='test-reports').get('Contents'))
+        self.report.refresh_from_db()
+        self.assertIsNone(self.report.file_path)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs row-level locking (PostgreSQL)')
+class BillNumberConcurrencyTests(TransactionTestCase):
+    THREADS = 16
+    BILLS_PER_THREAD = 25
+
+    def test_concurrent_bills_get_unique_numbers(self):
+        clinic = Clinic.objects.create(name='Main', address='Addr', phone='1')
+        patient = Patient.objects.create(clinic=clinic, name='P', gender='Male', phone_primary='1', city='Pune')
+        visit_ids = [
+            PatientVisit.objects.create(clinic=clinic, patient=patient, visit_type='New').id
+            for _ in range(self.THREADS * self.BILLS_PER_THREAD)
+        ]
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(chunk):
+            try:
+                barrier.wait()
+                for visit_id in chunk:
+                    Bill.objects.create(visit_id=visit_id, clinic=clinic)
+            except Exception as exc:  # any IntegrityError here is a collision
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(visit_ids[i::self.THREADS],)) for i in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        numbers = list(Bill.objects.values_list('bill_number', flat=True))
+        self.assertEqual(len(numbers), len(visit_ids))
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(
+            sorted(int(n.split('-')[-1]) for n in numbers), list(range(1, len(visit_ids) + 1))
+        )
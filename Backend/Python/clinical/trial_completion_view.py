@@ -103,6 +103,7 @@ class TrialCompletionView(APIView):
                     BillItem.objects.create(
                         bill=bill,
                         item_type='Purchase',
+                        inventory_item=inventory_item,
                         description=f"Purchase of {inventory_item.product_name} ({inventory_item.brand} {inventory_item.model_type})",
                         cost=unit_price,
                         quantity=1,
@@ -321,6 +322,7 @@ class AllocateSerialNumber(generics.UpdateAPIView):
                 BillItem.objects.create(
                     bill=bill,
                     item_type='Purchase',
+                    inventory_item=instance.booked_device_inventory,
                     description=f"Purchase of {instance.booked_device_inventory.product_name} ({instance.booked_device_inventory.brand} {instance.booked_device_inventory.model_type}) - Serial: {booked_device_serial}",
                     cost=unit_price,
                     quantity=1,
@@ -371,6 +373,7 @@ class AllocateSerialNumber(generics.UpdateAPIView):
                         BillItem.objects.create(
                             bill=bill,
                             item_type='Purchase',
+                            inventory_item=instance.booked_device_inventory,
                             description=f"Purchase of {instance.booked_device_inventory.product_name} ({instance.booked_device_inventory.brand} {instance.booked_device_inventory.model_type}) - With Customization",
                             cost=unit_price,
                             quantity=1,
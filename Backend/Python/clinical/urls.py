@@ -1,8 +1,9 @@
 
 # ...existing code...
+from django.conf import settings
 from django.urls import path
 from .views import (PatientRegistrationView,PatientVisitListView,PatientDetailView,PatientVisitsView,PatientVisitCreateView,TodayPatientVisitsView,
-                    PatientVisitUpdateView,PatientUpdateView,PatientFlatListView,DashboardStatsView,DoctorFlatListView,AudiologistPatientQueueView,
+                    PatientVisitUpdateView,PatientUpdateView,PatientFlatListView,PatientSearchView,DashboardStatsView,DoctorFlatListView,AudiologistPatientQueueView,
                     PatientVisitDetailView,PatientVisitFullDetailsView,AudiologistCaseHistoryCreateView,BillDetailView,BillPaidListView,BillPendingListView,TrialDeviceReturnView,
                     TestResultListView,TestUploadDeleteView,MarkAsPaidView,DeviceBookingDropdownView,DeviceBookingSerialView,PatientVisitFollowupView,
                     MarkPatientContactedView, VisitTestTypesView,TestTypeUpdateListView,ClinicTransactionListView,ClinicTransactionView,ClinicTransactionUpdateDeleteView,
@@ -16,7 +17,8 @@ from .api_inventory_item_create import InventoryItemCreateView,InventoryItemDest
 from .api_trials import TrialCreateView, TrialListView
 from .api_trial_devices import TrialDeviceListView
 from .api_trial_device_serials import TrialDeviceSerialListView, ProductInfoBySerialView, TrialDeviceInUseListView, TrialAvailableModelsView
-from .test_upload_views import TestUploadListView,ReportTestCreateView,ReportUploadView
+from .test_upload_views import (TestUploadListView,ReportTestCreateView,ReportUploadView,ReportUploadPresignView,
+                                ReportUploadCompleteView)
 from .completed_tests_views import CompletedTestsListView, CompletedTestDetailView, PatientTestHistoryView
 from .trial_completion_view import TrialCompletionView, AwaitingStockListView, AllocateSerialFlatList, AllocateSerialNumber
 from .api_for_services import CustomerNeedService,DeviceNeedService,ServiceVisitUpdateView,ServiceVisitCreateView,ServiceTypeListView,ServiceVisitList,ServiceDetailView,PartsUsedListView
@@ -26,6 +28,14 @@ from .api_patient_history import PatientPurchaseHistoryView, PatientServiceVisit
 from .api_inventory_transfer import InventoryTransferView, InventoryTransferHistoryView,InventoryFlatListView
 from .api_bill_item_discount import BillItemDiscountUpdateView, BillItemBulkDiscountUpdateView
 from .api_trial_completion_notes import TrialCompletionNotesUpdateView
+
+if settings.ASYNC_READ_VIEWS:
+    # Under ASGI the polled read endpoints wait on the database without holding a thread
+    from .async_views import (AsyncAudiologistPatientQueueView as AudiologistPatientQueueView,
+                              AsyncDashboardStatsView as DashboardStatsView,
+                              AsyncPatientVisitFollowupView as PatientVisitFollowupView,
+                              AsyncTodayPatientVisitsView as TodayPatientVisitsView)
+
 urlpatterns = [
       # Awaiting stock trial endpoints
       path('trials/awaiting-stock/', AwaitingStockListView.as_view(), name='trials_awaiting_stock'),
@@ -43,6 +53,7 @@ urlpatterns = [
    path('patient/visit/<int:id>/update/', PatientVisitUpdateView.as_view(), name='patient_visit_update'), # Update patient visit
    path('patient/<int:id>/update/', PatientUpdateView.as_view(), name='patient_update'), # Update patient details
    path('patient/flat-list/', PatientFlatListView.as_view(), name='patient_flat_list'), # Flat list of patients for dropdowns and search by name
+   path('patient/search/', PatientSearchView.as_view(), name='patient_search'), # Ranked patient typeahead by name or phone
 
    path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard_stats'), # Dashboard statistics
    path('doctor/flat-list/', DoctorFlatListView.as_view(), name='doctor_flat_list'), # Flat list of doctors for dropdowns and search by name
@@ -82,6 +93,8 @@ urlpatterns = [
    path('inventory/trial-devices-in-use/', TrialDeviceInUseListView.as_view(), name='trial_devices_in_use'),
 
    path('report-upload/<int:id>/', ReportUploadView.as_view(), name='report-upload'), # Endpoint for uploading files to existing TestUpload records
+   path('report-upload/<int:id>/presign/', ReportUploadPresignView.as_view(), name='report-upload-presign'), # Presigned URL for uploading the file straight to S3
+   path('report-upload/<int:id>/complete/', ReportUploadCompleteView.as_view(), name='report-upload-complete'), # Confirm a direct upload and record file_path
    path('report-create/', ReportTestCreateView.as_view(), name='report-create'), #
    path('test-uploads/list/', TestUploadListView.as_view(), name='test-upload-list'), # List and create test upload records
 
@@ -30,13 +30,21 @@ from .serializers import (
     PurchaseInventoryItemSerializer
 )
 from .models import Patient, PatientPurchase, PatientVisit, AudiologistCaseHistory, Bill, VisitTestPerformed, TestUpload,InventorySerial,Trial,InventoryItem,TestType,ClinicTransactions
+from .billing import summarize_items, bill_total
+from .conditional import clinic_conditional_get
+from .dashboard import get_dashboard_stats
+from .patient_search import (MAX_TYPEAHEAD_LIMIT, TYPEAHEAD_LIMIT, PatientSearchFilter, patient_search_q,
+                             search_patients)
+from .storage import delete_file
 from accounts.models import User
-from clinical_be.utils.pagination import StandardResultsSetPagination
+from clinical_be.utils.cache import get_or_set
+from clinical_be.utils.pagination import KeysetResultsSetPagination, StandardResultsSetPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from clinical_be.utils.permission import IsClinicAdmin, ReceptionistPermission, AuditorPermission, SppechTherapistPermission
 from django.db import transaction
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.shortcuts import redirect, get_object_or_404
 
 
@@ -108,14 +116,13 @@ class PatientVisitListView(generics.ListAPIView): # Show all Recent Visits
     queryset = PatientVisit.objects.all()
     serializer_class = PatientVisitSerializer
     permission_classes = [IsAuthenticated,ReceptionistPermission]  # Ensure user is logged in
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend,SearchFilter]
-    search_fields = ['patient__name','patient__phone_primary']
+    pagination_class = KeysetResultsSetPagination
+    filter_backends = [DjangoFilterBackend,PatientSearchFilter]
     filterset_fields = ['status','visit_type', 'appointment_date', 'service_type']
     
 
     def list(self, request, *args, **kwargs):
-            self.queryset = self.queryset.filter(clinic=getattr(request.user, 'clinic', None)).order_by('-created_at')
+            self.queryset = self.queryset.filter(clinic=getattr(request.user, 'clinic', None)).order_by('-created_at', '-id')
             queryset = self.filter_queryset(self.get_queryset())
             page = self.paginate_queryset(queryset)
             if page is not None:
@@ -148,7 +155,8 @@ class PatientVisitsView(generics.ListAPIView):
 
     def get_queryset(self):
         patient_id = self.kwargs['id']
-        return PatientVisit.objects.filter(patient__id=patient_id).order_by('-created_at')
+        queryset = PatientVisit.objects.filter(patient__id=patient_id).order_by('-created_at')
+        return PatientAllVisitSerializer.setup_eager_loading(queryset)
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -197,20 +205,22 @@ class PatientVisitUpdateView(generics.UpdateAPIView):
 
 
 # Today Patient visit records 
+@method_decorator(clinic_conditional_get, name='get')
 class TodayPatientVisitsView(generics.ListAPIView):
     ''' List all Patient Visits for Today '''
     serializer_class = PatientVisitSerializer
     permission_classes = [IsAuthenticated,ReceptionistPermission]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend,SearchFilter]
-    search_fields = ['patient__name','patient__phone_primary']
+    filter_backends = [DjangoFilterBackend,PatientSearchFilter]
     filterset_fields = ['status','visit_type', 'service_type']
 
 
     def get_queryset(self):
         from django.utils import timezone
         today = timezone.now().date()
-        return PatientVisit.objects.filter(appointment_date=today, clinic=getattr(self.request.user, 'clinic', None)).order_by('-created_at')
+        return PatientVisit.objects.filter(
+            appointment_date=today, clinic_id=getattr(self.request.user, 'clinic_id', None),
+        ).select_related('patient', 'seen_by').order_by('-created_at')
     
     def list(self, request, *args, **kwargs):
         # filters 
@@ -231,8 +241,8 @@ class PatientFlatListView(generics.ListAPIView):
     queryset = Patient.objects.values('id', 'name', 'email', 'phone_primary')
     serializer_class = PatientListSerializer
     permission_classes = [IsAuthenticated]  # Ensure user is logged in
-    filter_backends = [DjangoFilterBackend,SearchFilter]
-    search_fields = ['name','phone_primary']
+    filter_backends = [DjangoFilterBackend,PatientSearchFilter]
+    patient_search_path = ''
     
 
     def list(self, request, *args, **kwargs):
@@ -240,6 +250,26 @@ class PatientFlatListView(generics.ListAPIView):
             queryset = self.filter_queryset(self.get_queryset())
             serializer = self.get_serializer(queryset, many=True)
             return Response({"status": 200, "data": serializer.data}, status=status.HTTP_200_OK)
+
+# Ranked patient typeahead for the search box
+class PatientSearchView(APIView):
+    """
+    Patients of the user's clinic matching a name or phone number, best
+    matches first (exact phone, phone ending with the digits, name prefix,
+    then the rest).
+    URL parameters example: ?q=9876 or ?q=john&limit=10 (max 25)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q') or request.query_params.get('search') or ''
+        try:
+            limit = min(max(int(request.query_params.get('limit', TYPEAHEAD_LIMIT)), 1), MAX_TYPEAHEAD_LIMIT)
+        except ValueError:
+            return Response({"status": 400, "error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        patients = search_patients(Patient.objects.filter(clinic=getattr(request.user, 'clinic', None)), query)
+        serializer = PatientListSerializer(patients.values('id', 'name', 'email', 'phone_primary')[:limit], many=True)
+        return Response({"status": 200, "data": serializer.data}, status=status.HTTP_200_OK)
     
 # Doctor name and role flat list for dropdowns
 class DoctorFlatListView(generics.ListAPIView):
@@ -271,60 +301,17 @@ class DoctorFlatListView(generics.ListAPIView):
 
 # Dashboard Tile records count 
 # Total patients , today's visits , pending visits etc can be added here in future
+@method_decorator(clinic_conditional_get, name='get')
 class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated, ReceptionistPermission | AuditorPermission]
 
     def get(self, request, *args, **kwargs):
-        from django.utils import timezone
-        today = timezone.now().date()
-        clinic = getattr(request.user, 'clinic', None)
-
         role = getattr(request.user.role, 'name', None)
-        data = {}
-
-        # If the user.role == 'Reception', show the dashboard
-        if role == 'Reception':
-            total_patients = Patient.objects.filter(clinic=clinic).count()
-            todays_visits = PatientVisit.objects.filter(
-                appointment_date=today, clinic=clinic
-            ).count()
-            pending_tests = PatientVisit.objects.filter(
-                status='Pending for Service', clinic=clinic
-            ).count()
-            followup_visits = PatientVisit.objects.filter(
-                status='Follow up', clinic=clinic
-            ).count()
-
-            data = {
-                "total_patients": total_patients,
-                "todays_visits": todays_visits,
-                "pending_services": pending_tests,
-                "followup_visits": followup_visits
-            }
-        elif role == 'Audiologist': 
-            # For Audiologist, show only relevant stats
-            pending_tests = PatientVisit.objects.filter(
-                status='Test pending', clinic=clinic, seen_by=request.user
-            ).count()
-           
-            completed_tests = PatientVisit.objects.filter(
-
-                models.Q(patient__case_history__isnull=False) &
-                models.Q(visittestperformed__isnull=False),
-                seen_by=request.user,
-                clinic=request.user.clinic
-            ).count()
-
-            trials_active = Trial.objects.filter(
-                clinic=clinic, visit__seen_by=request.user,trial_decision='TRIAL_ACTIVE'
-            ).count()
-
-            data = {
-                "pending_tests": pending_tests,
-                "completed_tests": completed_tests,
-                "trials_active": trials_active
-            }
 
+        # Reception / Audiologist counters come from one aggregate per table,
+        # cached per (clinic, role, user); see clinical.dashboard
+        if role in ('Reception', 'Audiologist'):
+            data = get_dashboard_stats(request.user, role)
         else:
             # Should not normally happen because permission already blocks it
             data = {"error": "Access restricted to Receptionists only."}
@@ -339,13 +326,13 @@ class DashboardStatsView(APIView):
 # ----------------------------------------------------------------------
 
 # Patient Queue View for Audiologist whose visit type is not either 'TGA / Machine Check' or 'Battery Purchase' or 'Tip / Dome Change'
+@method_decorator(clinic_conditional_get, name='get')
 class AudiologistPatientQueueView(generics.ListAPIView):
     ''' List all Patient Visits for Audiologist Queue '''
     serializer_class = AudiologistQueueSerializer
     permission_classes = [IsAuthenticated, AuditorPermission]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = ['patient__name', 'patient__phone_primary']
+    filter_backends = [DjangoFilterBackend, PatientSearchFilter]
     filterset_fields = ['service_type','appointment_date']
 
     def get_queryset(self):
@@ -362,10 +349,10 @@ class AudiologistPatientQueueView(generics.ListAPIView):
         ]
 
         queryset = PatientVisit.objects.filter(
-            clinic=getattr(self.request.user, 'clinic', None),
+            clinic_id=getattr(self.request.user, 'clinic_id', None),
             seen_by=self.request.user,
             status__in=['Test pending','Pending','Test and Trial Pending','Followup Pending','Test Pending']
-        ).exclude(visit_type__in=excluded_types)
+        ).exclude(visit_type__in=excluded_types).select_related('patient')
 
         # Support direct filtering by GET parameters if provided
         appointment_date = self.request.query_params.get('appointment_date', None)
@@ -457,14 +444,14 @@ class BillPaidListView(generics.ListAPIView):
     """
     serializer_class = BillListSerializer
     permission_classes = [IsAuthenticated, ReceptionistPermission]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     # Use SearchFilter only; handle payment_status filtering manually to avoid ChoiceField setup issues
     filter_backends = [SearchFilter]
     search_fields = ['visit__patient__name', 'visit__patient__phone_primary', 'bill_number']
 
     def get_queryset(self):
         clinic = getattr(self.request.user, 'clinic', None)
-        qs = Bill.objects.select_related('visit', 'visit__patient', 'clinic').filter(payment_status='Paid').order_by('-created_at')
+        qs = Bill.objects.select_related('visit', 'visit__patient', 'clinic').filter(payment_status='Paid').order_by('-created_at', '-id')
         if clinic:
             qs = qs.filter(clinic=clinic)
         return qs
@@ -486,6 +473,7 @@ class BillPaidListView(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response({"status": 200, "data": serializer.data}, status=status.HTTP_200_OK)
 
+@method_decorator(clinic_conditional_get, name='get')
 class BillPendingListView(generics.ListAPIView):
     """
     List all bills with patient info and payment status for the logged-in clinic.
@@ -493,14 +481,14 @@ class BillPendingListView(generics.ListAPIView):
     """
     serializer_class = BillListSerializer
     permission_classes = [IsAuthenticated, ReceptionistPermission]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetResultsSetPagination
     # Use SearchFilter only; handle payment_status filtering manually to avoid ChoiceField setup issues
     filter_backends = [SearchFilter]
     search_fields = ['visit__patient__name', 'visit__patient__phone_primary', 'bill_number']
 
     def get_queryset(self):
         clinic = getattr(self.request.user, 'clinic', None)
-        qs = Bill.objects.select_related('visit', 'visit__patient', 'clinic').filter(payment_status='Pending').order_by('-created_at')
+        qs = Bill.objects.select_related('visit', 'visit__patient', 'clinic').filter(payment_status='Pending').order_by('-created_at', '-id')
         if clinic:
             qs = qs.filter(clinic=clinic)
         return qs
@@ -545,50 +533,29 @@ class BillDetailView(generics.RetrieveAPIView):
         """Filter bills by clinic"""
         clinic = getattr(self.request.user, 'clinic', None)
         if clinic:
-            return Bill.objects.filter(clinic=clinic).select_related(
-                'visit',
-                'visit__patient',
-                'clinic',
-                'created_by'
-            ).prefetch_related(
-                'bill_items__test_type',
-                'bill_items__trial'
-            )
-        return Bill.objects.select_related(
-            'visit',
-            'visit__patient',
-            'clinic',
-            'created_by'
-        ).prefetch_related(
-            'bill_items__test_type',
-            'bill_items__trial'
-        )
+            return BillDetailSerializer.setup_eager_loading(Bill.objects.filter(clinic=clinic))
+        return BillDetailSerializer.setup_eager_loading(Bill.objects.all())
 
     def get_object(self):
         """Get bill by visit_id, create if doesn't exist"""
         visit_id = self.kwargs.get(self.lookup_url_kwarg)
-        try:
-            visit = PatientVisit.objects.get(id=visit_id)
-        except PatientVisit.DoesNotExist:
+        if not PatientVisit.objects.filter(id=visit_id).exists():
             from rest_framework.exceptions import NotFound
             raise NotFound("Visit not found")
 
-        # Get or create bill for this visit
-        bill = Bill.objects.get(
-            visit=visit
-            # defaults={
-            #     'clinic': visit.clinic,
-            #     'created_by': self.request.user,
-            # }
-        )
+        # Bill with its visit/patient/clinic and every line item loaded up front
+        bill = BillDetailSerializer.setup_eager_loading(Bill.objects.all()).get(visit_id=visit_id)
 
         # Ensure bill number is generated
         if not bill.bill_number:
             bill.generate_bill_number()
             bill.save()
 
-        # Recalculate totals to ensure they're up to date
-        bill.calculate_total()
+        # Keep the stored total in sync, computed from the prefetched items
+        total = bill_total(bill, summarize_items(bill.bill_items.all()))
+        if bill.total_amount != total:
+            bill.total_amount = total
+            bill.save(update_fields=['total_amount'])
 
         return bill
 
@@ -774,26 +741,7 @@ class TestUploadDeleteView(APIView):
             # Delete the file from S3
             if test_file.file_path:
                 try:
-                    import boto3
-                    from django.conf import settings
-                    from urllib.parse import urlparse
-                    
-                    # Parse the S3 URL to get bucket and key
-                    parsed_url = urlparse(test_file.file_path)
-                    bucket_name = parsed_url.netloc.split('.')[0]
-                    file_key = parsed_url.path.lstrip('/')
-                    
-                    # Initialize S3 client
-                    s3_client = boto3.client(
-                        's3',
-                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                        region_name=settings.AWS_S3_REGION_NAME
-                    )
-                    
-                    # Delete the file from S3
-                    s3_client.delete_object(Bucket=bucket_name, Key=file_key)
-                    
+                    delete_file(test_file.file_path)
                 except Exception as e:
                     # Log the error but continue with database deletion
                     print(f"Warning: Could not delete file from S3 {test_file.file_path}: {e}")
@@ -832,10 +780,11 @@ class MarkAsPaidView(APIView):
     """
     permission_classes = [IsAuthenticated, ReceptionistPermission]
     
+    @transaction.atomic
     def post(self, request, bill_id):
-        # Get bill for the current clinic
+        # Get bill for the current clinic, locked so a double submit sees it Paid
         clinic = getattr(request.user, 'clinic', None)
-        bill = get_object_or_404(Bill, id=bill_id, clinic=clinic)
+        bill = get_object_or_404(Bill.objects.select_for_update(), id=bill_id, clinic=clinic)
         
         # Validate bill is not already paid
         if bill.payment_status == 'Paid':
@@ -989,12 +938,11 @@ class PatientVisitFollowupView(generics.ListAPIView):
     """
     API to get patient visits that require follow-up.
     Returns visits with status 'Follow up' or 'Book Follow-up Required'.
-    Supports search by patient name and pagination.
+    Supports search by patient name or phone number and pagination.
     """
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = ['patient__name']
+    filter_backends = [DjangoFilterBackend, PatientSearchFilter]
     filterset_fields = ['contacted']
     
     def get_queryset(self):
@@ -1002,15 +950,19 @@ class PatientVisitFollowupView(generics.ListAPIView):
         Get patient visits that need follow-up
         Filter by clinic for multi-tenant support
         """
-        clinic = getattr(self.request.user, 'clinic', None)
+        clinic_id = getattr(self.request.user, 'clinic_id', None)
         queryset = PatientVisit.objects.filter(
             status__in=['Follow up']
         )
         
-        if clinic:
-            queryset = queryset.filter(clinic=clinic)
+        if clinic_id:
+            queryset = queryset.filter(clinic_id=clinic_id)
             
-        return queryset.order_by('-appointment_date', '-created_at')
+        return queryset.select_related('patient', 'seen_by', 'contacted_by').order_by('-appointment_date', '-created_at')
+
+    def get_serializer(self, *args, **kwargs):
+        # Pass show_contacted_fields=True to include contact fields
+        return PatientVisitSerializer(*args, show_contacted_fields=True, **kwargs)
     
     def list(self, request, *args, **kwargs):
         """
@@ -1020,12 +972,10 @@ class PatientVisitFollowupView(generics.ListAPIView):
         page = self.paginate_queryset(queryset)
         
         if page is not None:
-            # Pass show_contacted_fields=True to include contact fields
-            serializer = PatientVisitSerializer(page, many=True, show_contacted_fields=True)
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         
-        # Pass show_contacted_fields=True to include contact fields
-        serializer = PatientVisitSerializer(queryset, many=True, show_contacted_fields=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response({
             "status": 200,
             "data": serializer.data
@@ -1103,8 +1053,10 @@ class TestTypeUpdateListView(generics.ListAPIView):
 
     def get(self, request, *args, **kwargs):
         try:
-            queryset = self.get_queryset()
-            data = self.get_serializer(queryset, many=True).data
+            # Served from the reference cache, invalidated on TestType writes
+            data = get_or_set(
+                'test-types', ['list'], lambda: list(self.get_serializer(self.get_queryset(), many=True).data)
+            )
             return Response({
                 'status': status.HTTP_200_OK,
                 'data': data
@@ -1377,10 +1329,7 @@ class CustomerNeedPurchase(APIView):
 
             search_query = request.query_params.get('search', None)
             if search_query:
-                service_visits = service_visits.filter(
-                    Q(patient__name__icontains=search_query) |
-                    Q(patient__phone_primary__icontains=search_query)
-                )
+                service_visits = service_visits.filter(patient_search_q(search_query.split(), 'patient__'))
             
             # Get unique patients (latest visit per patient)
             unique_patients = {}
@@ -3,6 +3,18 @@ ASGI config for clinical_be project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served this way, the polled read endpoints use their async views
+(ASYNC_READ_VIEWS, see clinical.async_views), e.g.:
+
+    uvicorn clinical_be.asgi:application --workers 2
+
+Each request runs its sync code in a thread of its own, so a persistent
+connection would never be reused; database connections come from a pool
+instead (DB_POOL_MAX_SIZE, 10 per process unless set).
+
+The report exports (clinical.report_export) stream here as well, read from
+their sync iterators a chunk at a time rather than buffered whole.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +24,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinical_be.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+os.environ.setdefault('DB_POOL_MAX_SIZE', '10')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from celery.schedules import crontab
 
@@ -54,14 +55,66 @@ AUTH_USER_MODEL = 'accounts.User'
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'clinical_be.utils.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'clinical_be.utils.query_budget.QueryBudgetMiddleware',
 ]
 
+# GET responses at least this large are compressed (brotli or gzip)
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+
+# Requests issuing more SQL queries than this are logged as warnings
+QUERY_BUDGET_WARN_THRESHOLD = 50
+
+# Caches: local memory by default; set CACHE_REDIS_URL (e.g. redis://localhost:6379/1,
+# the Celery Redis instance on its own db) to share the cache between processes.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'clinical',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'clinical-default',
+        }
+    }
+
+# Cache alias used by clinical_be.utils.cache for reference data
+REFERENCE_CACHE_ALIAS = 'default'
+
+# Longest a local-memory (per-process) cache keeps reference data: other
+# processes' invalidations never reach it
+LOCAL_CACHE_TIMEOUT = 60
+
+# Seconds a cached dashboard/stats/ payload may live without an invalidating write
+DASHBOARD_STATS_CACHE_TIMEOUT = 60
+
+# Seconds an authenticated user (role, clinic, managed clinics) stays cached
+# between invalidating writes. Only cached with a shared cache (CACHE_REDIS_URL):
+# a per-process one would keep a deactivated user authenticating elsewhere
+PRINCIPAL_CACHE_TIMEOUT = 300
+
+# Serve the polled read endpoints (today's visits, audiologist queue, dashboard
+# stats, follow-ups) with their async views; clinical_be/asgi.py turns it on
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+
+# Longest a clinic's conditional-GET version stamp (ETag / Last-Modified of the
+# polled lists) can miss a write that sent no signal. The stamps need a cache
+# shared by every process (CACHE_REDIS_URL); with the local-memory cache the
+# polled lists skip conditional GET and always answer 200
+CLINIC_VERSION_TIMEOUT = 120
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://localhost:3001",
@@ -84,6 +137,11 @@ CORS_ALLOW_HEADERS = [
     "x-requested-with",
 ]
 
+CORS_EXPOSE_HEADERS = [
+    "x-db-query-count",
+    "x-db-time-ms",
+]
+
 
 ROOT_URLCONF = 'clinical_be.urls'
 
@@ -108,6 +166,16 @@ WSGI_APPLICATION = 'clinical_be.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections: each worker thread keeps its connection open for DB_CONN_MAX_AGE
+# seconds (0 reconnects on every request). Set DB_POOL_MAX_SIZE to share a
+# psycopg connection pool of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections
+# per process instead; a request waits up to DB_POOL_TIMEOUT seconds for a free
+# one. Compare the two with `manage.py benchmark_db_connections`.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+DB_POOL_MIN_SIZE = min(int(os.environ.get('DB_POOL_MIN_SIZE', 2)), DB_POOL_MAX_SIZE)
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -116,6 +184,19 @@ DATABASES = {
         'PASSWORD': 'postgres',
         'HOST': 'localhost',   # or your PostgreSQL server IP
         'PORT': '5432',        # default PostgreSQL port
+        # Pooled connections are handed back after every request, so a pool
+        # and persistent connections exclude each other
+        'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+        # Ping a reused connection before the request uses it (the pool checks
+        # on checkout), so a restarted server costs a reconnect, not a 500
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': DB_POOL_MIN_SIZE,
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+            },
+        } if DB_POOL_MAX_SIZE else {},
     }
 
     # 'default': {
@@ -152,12 +233,16 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'clinical_be.utils.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     "EXCEPTION_HANDLER": "clinical_be.utils.exception_handler.custom_exception_handler",
+    'DEFAULT_RENDERER_CLASSES': [
+        'clinical_be.utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10, 
     'DEFAULT_FILTER_BACKENDS': [
@@ -182,6 +267,10 @@ AWS_SECRET_ACCESS_KEY = 'IaoA4869mSb9VE3oc7JmAFy6wOAKgWKFNEQWOcG8'
 AWS_STORAGE_BUCKET_NAME = 'clinical-mgmt'
 AWS_S3_REGION_NAME = 'eu-north-1'  # e.g., 'us-east-1'
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_S3_REGION_NAME}.amazonaws.com'
+AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL')  # local S3 stand-in (moto server, MinIO)
+AWS_S3_MAX_POOL_CONNECTIONS = 20
+AWS_PRESIGNED_EXPIRY = 15 * 60  # seconds a presigned upload URL stays valid
+REPORT_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
 
 # Media files storage
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
@@ -234,6 +323,10 @@ CELERY_BEAT_SCHEDULE = {
         # 'schedule': crontab(hour=0, minute=5),  # Run daily after 5 minutes
         'schedule': crontab(minute='*/5'),  # Runs every 5 minutes
     },
+    'reconcile-serial-counts': {
+        'task': 'clinical.tasks.reconcile_serial_counts',
+        'schedule': crontab(hour=2, minute=30),  # Nightly drift check of the serial counters
+    },
 }
 
 
@@ -0,0 +1,70 @@
+"""
+Async DRF views.
+
+DRF's APIView dispatches synchronously. AsyncAPIViewMixin gives a view an
+async dispatch(): authentication, permission and throttle checks (which may
+read the cache or the database) run through sync_to_async, then the handler
+is awaited. AsyncListModelMixin is ListModelMixin for such views, with the
+page read through the async ORM (StandardResultsSetPagination.apaginate_queryset):
+
+    @method_decorator(clinic_conditional_get, name='get')
+    class AsyncTodayPatientVisitsView(AsyncListModelMixin, TodayPatientVisitsView):
+        pass
+
+A handler must not touch the database synchronously; a lazy load of a
+related object raises SynchronousOnlyOperation, so querysets select_related
+whatever the serializer reads. Under ASGI Django awaits these views
+directly; under WSGI it runs each in an event loop of its own, which works
+but gains nothing.
+"""
+
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class AsyncAPIViewMixin:
+    """For APIView subclasses whose HTTP method handlers are coroutines."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch() with the checks run in a thread and the handler awaited
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):  # OPTIONS and 405 stay synchronous
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListModelMixin(AsyncAPIViewMixin):
+    """Async list() for GenericAPIView subclasses, answered in the project's {"status", "data"} format."""
+
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = None
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer([obj async for obj in queryset], many=True)
+        return Response({"status": 200, "data": serializer.data}, status=status.HTTP_200_OK)
@@ -0,0 +1,80 @@
+"""
+JWT authentication with the resolved principal cached.
+
+JWTAuthentication loads the User on every request, then the permission
+classes and views load the role, the clinic and, for Clinic Managers, the
+managed clinic ids one lookup at a time. CachedJWTAuthentication loads them
+together (select_related role / clinic plus User.managed_clinic_ids) and
+keeps the result in the cache of clinical_be.utils.cache, so on a hit
+authentication costs no query at all.
+
+Only a cache shared by every process (Redis, CACHE_REDIS_URL) is used: with
+the per-process local-memory cache, a worker would go on accepting a user
+deactivated or given another role through a different worker until its
+entry expired. Without one, authentication is a single query per request.
+
+Entries are keyed by user id and the user's principal version, plus the
+'roles' and 'clinics' reference-data versions. accounts.signals bumps the
+principal version once a change to the user or their clinic manager
+assignments commits. The password hash is not cached; the rare views that
+need it (change password) load it on access.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import bump_version, get_or_set, get_version, is_shared
+
+
+def _namespace(user_id):
+    return f'principal:{user_id}'
+
+
+def invalidate_principal(user_id):
+    """Drop the cached principal of ``user_id`` once the current transaction commits."""
+    transaction.on_commit(lambda: bump_version(_namespace(user_id)), robust=True)
+
+
+def load_principal(user_id):
+    """The user with role, clinic and managed_clinic_ids loaded, or None."""
+    user = get_user_model().objects.select_related('role', 'clinic').defer('password').filter(
+        **{api_settings.USER_ID_FIELD: user_id}
+    ).first()
+    if user is not None:
+        user.managed_clinic_ids  # cached_property: evaluated now, stored with the user
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        if is_shared():
+            user = get_or_set(
+                _namespace(user_id), [get_version('roles'), get_version('clinics')],
+                lambda: load_principal(user_id),
+                timeout=getattr(settings, 'PRINCIPAL_CACHE_TIMEOUT', 300),
+            )
+        else:
+            user = load_principal(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
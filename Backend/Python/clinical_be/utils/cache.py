@@ -0,0 +1,160 @@
+"""
+Small caching layer for reference data (test types, brands / models,
+clinics, roles) and other read-mostly payloads.
+
+Every cached value lives under a *namespace*. Keys embed the namespace's
+current version, so invalidating a namespace is a single version bump:
+stale entries are simply never read again and expire with their TTL.
+
+    from clinical_be.utils.cache import get_or_set, invalidate_on_change
+
+    data = get_or_set('roles', [request.get_full_path()], build_payload)
+
+    # in the app's signals module
+    invalidate_on_change('roles', Role)
+
+Versions are bumped once the writing transaction commits, so a read in
+between cannot store pre-commit rows under the new version.
+
+The backend is the REFERENCE_CACHE_ALIAS entry of CACHES (the "default"
+cache unless configured otherwise). With the local-memory backend each
+process keeps its own copy and its own versions and never sees another
+process's bumps, so entries there live at most LOCAL_CACHE_TIMEOUT seconds;
+multi-process deployments should point CACHES at Redis (CACHE_REDIS_URL) to
+make invalidation visible everywhere.
+
+Stamps (get_stamp / touch_stamp) are the conditional-GET counterpart: an
+opaque token plus the time of the last change of a namespace, for ETag and
+Last-Modified headers.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+DEFAULT_TIMEOUT = 60 * 60
+
+
+def get_cache():
+    return caches[getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    """
+    Whether every process sees the same cache, and with it the same versions
+    and stamps. Local-memory (and dummy) caches are per process.
+    """
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def _timeout(timeout):
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+    if is_shared():
+        return timeout
+    # Bumps made by other processes never reach this cache
+    return min(timeout, getattr(settings, 'LOCAL_CACHE_TIMEOUT', 60))
+
+
+def _version_key(namespace):
+    return f'cache-version:{namespace}'
+
+
+def get_version(namespace):
+    return get_cache().get(_version_key(namespace), 0)
+
+
+def bump_version(namespace):
+    """Invalidate everything cached under ``namespace``."""
+    cache = get_cache()
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _key(namespace, version, parts):
+    suffix = ':'.join(str(part) for part in parts)
+    # Request values (query strings, names with spaces) are hashed to keep keys backend-safe
+    if len(suffix) > 200 or not suffix.isascii() or any(char.isspace() for char in suffix):
+        suffix = hashlib.md5(suffix.encode()).hexdigest()
+    return f'{namespace}:v{version}:{suffix}'
+
+
+def make_key(namespace, parts=()):
+    return _key(namespace, get_version(namespace), parts)
+
+
+def get_or_set(namespace, parts, builder, timeout=None):
+    """
+    Return the value cached under (namespace, parts), building and storing
+    it with ``builder()`` on a miss. ``None`` results are not cached.
+    """
+    cache = get_cache()
+    key = make_key(namespace, parts)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        if value is not None:
+            cache.set(key, value, _timeout(timeout))
+    return value
+
+
+async def aget_or_set(namespace, parts, builder, timeout=None):
+    """get_or_set() for async views: ``builder`` is a coroutine function."""
+    cache = get_cache()
+    key = _key(namespace, await cache.aget(_version_key(namespace), 0), parts)
+    value = await cache.aget(key)
+    if value is None:
+        value = await builder()
+        if value is not None:
+            await cache.aset(key, value, _timeout(timeout))
+    return value
+
+
+def invalidate_on_change(namespace, *models):
+    """Bump ``namespace`` once a save or delete of one of ``models`` commits."""
+    def receiver(sender, using=None, **kwargs):
+        transaction.on_commit(lambda: bump_version(namespace), using=using, robust=True)
+
+    for model in models:
+        uid = f'cache-invalidate:{namespace}:{model._meta.label}'
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=uid)
+
+
+def _stamp_key(namespace):
+    return f'cache-stamp:{namespace}'
+
+
+def _new_stamp():
+    # A random token rather than the version counter: a flushed or restarted
+    # cache must never hand out a token that a client still holds.
+    return uuid.uuid4().hex, timezone.now().replace(microsecond=0)
+
+
+def get_stamp(namespace, timeout=DEFAULT_TIMEOUT):
+    """
+    (token, last modified) of ``namespace``, started fresh when missing.
+    ``timeout`` bounds how long a change made without touch_stamp() (e.g. a
+    queryset.update()) can go unnoticed.
+    """
+    cache = get_cache()
+    key = _stamp_key(namespace)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, _new_stamp(), timeout)
+        stamp = cache.get(key) or _new_stamp()
+    return stamp
+
+
+def touch_stamp(namespace, timeout=DEFAULT_TIMEOUT):
+    """Record a change to ``namespace``: new token, last modified now."""
+    get_cache().set(_stamp_key(namespace), _new_stamp(), timeout)
@@ -0,0 +1,68 @@
+"""
+Compression of API responses.
+
+CompressionMiddleware compresses GET responses of at least
+RESPONSE_COMPRESSION_MIN_BYTES: with brotli when the client accepts "br"
+and the brotli package is installed, with gzip (Django's GZipMiddleware)
+otherwise. Smaller bodies go out as they are, since under a kilobyte or so
+the headers dominate and compressing only costs CPU. Streamed exports are
+gzipped chunk by chunk.
+
+Only GET is compressed: responses to POST (login tokens, forms echoing
+input) are the ones a BREACH-style length attack would target.
+"""
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+DEFAULT_MIN_BYTES = 1024
+BROTLI_QUALITY = 5  # most of the size win of quality 11 at a small fraction of the CPU
+
+
+def accepted_encodings(request):
+    """Content codings in Accept-Encoding, minus those refused with q=0."""
+    codings = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = [value.strip() for value in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            codings.add(coding.lower())
+    return codings
+
+
+class CompressionMiddleware(GZipMiddleware):
+
+    def process_response(self, request, response):
+        if request.method != 'GET' or response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < getattr(
+                settings, 'RESPONSE_COMPRESSION_MIN_BYTES', DEFAULT_MIN_BYTES):
+            return response
+        if brotli is None or response.streaming or 'br' not in accepted_encodings(request):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        # Weak ETag, as GZipMiddleware does, so If-None-Match still matches
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -1,10 +1,53 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from math import ceil
+
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+
+def estimated_count(queryset):
+    """
+    Row count from the PostgreSQL planner (EXPLAIN, the query is not run).
+    Good enough for "about N results" and page counts; exact elsewhere.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
 class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'pageSize'
     page_query_param = 'page'
 
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views: the count and the page come from the async ORM."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()  # cached_property, so page() will not query it
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [obj async for obj in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
     def get_paginated_response(self, data):
         return Response({
             "status": 200,
@@ -14,3 +57,126 @@ class StandardResultsSetPagination(PageNumberPagination):
             "totalPages": self.page.paginator.num_pages,
             "data": data
         })
+
+
+class KeysetResultsSetPagination(StandardResultsSetPagination):
+    """
+    StandardResultsSetPagination plus two opt-ins for long lists ordered
+    newest first. Views enable it with pagination_class; clients choose per
+    request, and without either parameter nothing changes.
+
+    ?cursor=        keyset pages on (created_at, id): the first page is
+                    ?cursor= (empty), then nextPage / previousPage are the
+                    cursors to send (-1 when there is none). Each page is an
+                    index range scan, however deep, instead of OFFSET.
+    ?count=estimate totalItems / totalPages from the planner's row estimate
+    ?count=none     no count at all (totalItems / totalPages are -1)
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset_fields = ('created_at', 'id')  # newest first
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count_mode = request.query_params.get(self.count_query_param, 'exact')
+        if self.count_mode not in COUNT_MODES:
+            raise ValidationError({self.count_query_param: f"Must be one of: {', '.join(COUNT_MODES)}"})
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset and self.count_mode == 'exact':
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.total = self.get_count(queryset)
+        if self.keyset:
+            return self.paginate_keyset(queryset, request.query_params[self.cursor_query_param])
+
+        # Page numbers without an exact count
+        self.page_number = self.get_page_number_value(request)
+        offset = (self.page_number - 1) * self.page_size
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        if not rows and self.page_number > 1:
+            raise NotFound('Invalid page.')
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def get_count(self, queryset):
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'estimate':
+            return estimated_count(queryset)
+        return None
+
+    def get_page_number_value(self, request):
+        try:
+            page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound('Invalid page.')
+        if page_number < 1:
+            raise NotFound('Invalid page.')
+        return page_number
+
+    # ------------------------------------------------------------------ keyset
+
+    def encode_cursor(self, row, reverse):
+        values = [getattr(row, field) for field in self.keyset_fields]
+        position = {'p': [values[0].isoformat(), values[1]], 'r': reverse}
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()))
+            created_at, pk = position['p']
+            created_at = parse_datetime(created_at)
+            if created_at is None or not isinstance(pk, int):
+                raise ValueError
+            return created_at, pk, bool(position.get('r'))
+        except (ValueError, TypeError, KeyError):
+            raise NotFound('Invalid cursor.')
+
+    def paginate_keyset(self, queryset, cursor):
+        time_field, id_field = self.keyset_fields
+        ordering = [f'-{time_field}', f'-{id_field}']
+        reverse = False
+        if cursor:
+            created_at, pk, reverse = self.decode_cursor(cursor)
+            if reverse:
+                # Rows before (newer than) the cursor, read upwards and flipped back
+                after = Q(**{f'{time_field}__gt': created_at}) | Q(**{time_field: created_at, f'{id_field}__gt': pk})
+                queryset = queryset.filter(after, **{f'{time_field}__gte': created_at})
+                ordering = [time_field, id_field]
+            else:
+                before = Q(**{f'{time_field}__lt': created_at}) | Q(**{time_field: created_at, f'{id_field}__lt': pk})
+                queryset = queryset.filter(before, **{f'{time_field}__lte': created_at})
+
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(rows[-1], reverse=False)
+            if cursor and (has_more or not reverse):
+                self.previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    # ---------------------------------------------------------------- response
+
+    def get_paginated_response(self, data):
+        if not self.keyset and self.count_mode == 'exact':
+            return super().get_paginated_response(data)
+        if self.keyset:
+            next_page, previous_page = self.next_cursor or -1, self.previous_cursor or -1
+        else:
+            next_page = self.page_number + 1 if self.has_next else -1
+            previous_page = self.page_number - 1 if self.page_number > 1 else -1
+        return Response({
+            "status": 200,
+            "nextPage": next_page,
+            "previousPage": previous_page,
+            "totalItems": -1 if self.total is None else self.total,
+            "totalPages": -1 if self.total is None else max(1, ceil(self.total / self.page_size)),
+            "data": data
+        })
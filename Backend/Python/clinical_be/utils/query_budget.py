@@ -0,0 +1,89 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('clinical_be.query_budget')
+
+
+class QueryCounter:
+    """
+    Execute wrapper that counts SQL statements and the time spent in the
+    database. Installed on every connection for the duration of a request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryBudgetMiddleware:
+    """
+    Adds the number of SQL queries and the DB time of the request to the
+    response headers (X-DB-Query-Count / X-DB-Time-ms) and logs them.
+
+    Requests that go over QUERY_BUDGET_WARN_THRESHOLD queries are logged
+    as warnings so N+1 patterns show up in the server logs.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.warn_threshold = getattr(settings, 'QUERY_BUDGET_WARN_THRESHOLD', 50)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter, wrappers = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(wrappers)
+        return self.report(request, response, counter)
+
+    async def __acall__(self, request):
+        # Connections belong to a thread. The ORM runs a request's queries in
+        # the request's sync_to_async thread, so the wrappers go on there.
+        counter, wrappers = await sync_to_async(self.start)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.stop)(wrappers)
+        return self.report(request, response, counter)
+
+    def start(self):
+        counter = QueryCounter()
+        wrappers = [conn.execute_wrapper(counter) for conn in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        return counter, wrappers
+
+    def stop(self, wrappers):
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+
+    def report(self, request, response, counter):
+        db_time_ms = round(counter.duration * 1000, 2)
+        response['X-DB-Query-Count'] = str(counter.count)
+        response['X-DB-Time-ms'] = str(db_time_ms)
+
+        log = logger.warning if counter.count > self.warn_threshold else logger.debug
+        log(
+            '%s %s -> %s queries, %sms db time',
+            request.method, request.path, counter.count, db_time_ms,
+        )
+        return response
@@ -0,0 +1,67 @@
+"""
+JSON rendering with orjson.
+
+orjson encodes dicts, lists, strings, numbers and datetimes in C; only the
+values it does not know (Decimal above all) are handed to a stdlib-style
+encoder, one value at a time. Output matches the encoder it replaces:
+
+    fast_json_dumps()         DRF's JSONEncoder (Decimal as a number,
+                              datetimes ISO 8601 with 'Z' for UTC)
+    fast_django_json_dumps()  DjangoJSONEncoder, as used by JsonResponse
+                              (Decimal as a string, datetimes in milliseconds)
+
+FastJSONRenderer is the project-wide DRF renderer (DEFAULT_RENDERER_CLASSES)
+and FastJsonResponse stands in for django.http.JsonResponse in plain views.
+"""
+
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+DRF_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+# DjangoJSONEncoder trims datetimes to milliseconds, so they go through it
+DJANGO_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+_drf_default = JSONEncoder().default
+_django_default = DjangoJSONEncoder().default
+
+
+def _dumps(data, default, option):
+    content = orjson.dumps(data, default=default, option=option)
+    # Like DRF, escape the two line terminators JSON allows but JavaScript does not
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+def fast_json_dumps(data):
+    """``data`` as compact UTF-8 JSON bytes, as DRF's JSONRenderer writes it."""
+    return _dumps(data, _drf_default, DRF_OPTIONS)
+
+
+def fast_django_json_dumps(data):
+    """``data`` as compact UTF-8 JSON bytes, values encoded as DjangoJSONEncoder does."""
+    return _dumps(data, _django_default, DJANGO_OPTIONS)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer through fast_json_dumps(); indented output (browsable API, ?indent=) stays on DRF's."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return fast_json_dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """django.http.JsonResponse encoded with fast_django_json_dumps()."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=fast_django_json_dumps(data), **kwargs)